@@ -1,9 +1,29 @@
 """
 Authentication utilities for Harit Swaraj
 Handles password hashing, JWT tokens, and user authentication
+
+Password hashing (argon2) takes tens of milliseconds of CPU per call, so the
+request handlers run it in a bounded thread pool (PASSWORD_HASH_THREADS)
+instead of on the event loop; argon2 releases the GIL while hashing. The
+cost parameters come from PASSWORD_HASH_TIME_COST / _MEMORY_COST_KB /
+_PARALLELISM. When they change, a user's hash is recomputed with the new
+parameters the next time they log in.
+
+Benchmark: benchmarks/login.py
+
+Access tokens carry sub (username), uid, role, tv (token version) and jti,
+so get_current_user authenticates a request from the token alone: signature,
+expiry and the in-memory revocation filter (token_revocation.py), no
+database read. Routes that need the user's full profile use
+get_current_profile, which goes through the per-worker principal cache
+(principal_cache.py).
 """
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -11,6 +31,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from models import User
 from database import get_db
+from principal_cache import Principal, get_principal_cache, invalidate_principal
+from token_revocation import get_revocation_filter, current_token_version
 
 # Security configuration
 SECRET_KEY = "harit-swaraj-secret-key-change-in-production"  # Change this in production!
@@ -18,19 +40,50 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 # Password hashing
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+PASSWORD_HASH_TIME_COST = int(os.getenv("PASSWORD_HASH_TIME_COST", "3"))
+PASSWORD_HASH_MEMORY_COST_KB = int(os.getenv("PASSWORD_HASH_MEMORY_COST_KB", "65536"))
+PASSWORD_HASH_PARALLELISM = int(os.getenv("PASSWORD_HASH_PARALLELISM", "4"))
+PASSWORD_HASH_THREADS = int(os.getenv("PASSWORD_HASH_THREADS", os.cpu_count() or 2))
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=PASSWORD_HASH_TIME_COST,
+    argon2__memory_cost=PASSWORD_HASH_MEMORY_COST_KB,
+    argon2__parallelism=PASSWORD_HASH_PARALLELISM
+)
+
+# Separate from the default threadpool so a burst of logins cannot starve
+# file and database work, and vice versa
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_THREADS,
+                                    thread_name_prefix="password-hash")
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
+    """Hash a password using argon2 (blocking; use hash_password_async in handlers)"""
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    """Hash a password in the password hashing thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Verify a password in the password hashing thread pool
+    Returns (valid, new_hash); new_hash is set when the stored hash was made
+    with other cost parameters and should be replaced
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, pwd_context.verify_and_update,
+                                      plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -43,6 +96,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_token(db: Session, user: User) -> str:
+    """Create an access token with the claims get_current_user needs"""
+    return create_access_token(data={
+        "sub": user.username,
+        "uid": user.id,
+        "role": user.role,
+        "tv": current_token_version(db, user.id),
+        "jti": uuid.uuid4().hex
+    })
+
 def decode_token(token: str) -> dict:
     """Decode and validate a JWT token"""
     try:
@@ -55,23 +118,37 @@ def decode_token(token: str) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+def get_token_payload(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> dict:
     """
-    Dependency to get the current authenticated user from JWT token
+    Dependency to get the claims of a valid, unrevoked access token
     """
-    token = credentials.credentials
-    payload = decode_token(token)
-    
-    username: str = payload.get("sub")
-    if username is None:
+    payload = decode_token(credentials.credentials)
+    if payload.get("sub") is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
     
+    revocations = get_revocation_filter()
+    revocations.maybe_sync()
+    if revocations.is_revoked(payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+def _load_principal(db: Session, username: str) -> Principal:
+    """Profile of a user, from the principal cache or the database"""
+    cache = get_principal_cache()
+    principal = cache.get(username)
+    if principal is not None:
+        return principal
+
+    version = cache.version(username)
     user = db.query(User).filter(User.username == username).first()
     if user is None:
         raise HTTPException(
@@ -79,14 +156,38 @@ def get_current_user(
             detail="User not found"
         )
     
-    return user
+    principal = Principal.from_user(user)
+    cache.put(username, principal, version)
+    return principal
+
+def get_current_user(
+    payload: dict = Depends(get_token_payload),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """
+    Dependency to get the current authenticated user from JWT token
+    Only id, username and role are set unless the token predates those claims
+    """
+    if "uid" in payload and "role" in payload:
+        return Principal.from_claims(payload)
+    return _load_principal(db, payload["sub"])
+
+def get_current_profile(
+    payload: dict = Depends(get_token_payload),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """
+    Dependency to get the current user with the full profile
+    Served from the principal cache when possible
+    """
+    return _load_principal(db, payload["sub"])
 
 def require_role(allowed_roles: list):
     """
     Dependency factory to require specific roles
     Usage: Depends(require_role(['owner', 'admin']))
     """
-    def role_checker(current_user: User = Depends(get_current_user)) -> User:
+    def role_checker(current_user: Principal = Depends(get_current_user)) -> Principal:
         if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -95,7 +196,7 @@ def require_role(allowed_roles: list):
         return current_user
     return role_checker
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """
     Authenticate a user by username and password
     Returns User object if successful, None otherwise
@@ -103,6 +204,12 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
     user = db.query(User).filter(User.username == username).first()
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    valid, new_hash = await verify_and_update_password(password, user.password_hash)
+    if not valid:
         return None
+    if new_hash:
+        # Cost parameters changed since this hash was made
+        user.password_hash = new_hash
+        db.commit()
+        invalidate_principal(user.username)
     return user
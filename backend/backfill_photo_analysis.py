@@ -0,0 +1,282 @@
+"""
+Backfill photo (and kiln video) analysis for existing uploads
+
+Walks the photo references stored in the database, the files under
+uploads/photos and the photo uploads in the content-addressed store, runs
+analyze_photo on every photo that has no analysis yet across all CPU cores,
+and upserts the results in chunks (photo_analyses, PlotPhoto CV fields and
+the perceptual hash index).
+
+Manufacturing batch videos without a video analysis are then analysed and
+fingerprinted (oldest batch first), so reused footage is flagged across the
+whole archive.
+
+With --derivatives, only the WebP thumbnail/medium copies are generated
+for photos that are missing any of them.
+
+Each chunk (and each video) is committed on its own, so the command can be
+stopped at any point (Ctrl+C) and rerun: photos and videos that already have
+an analysis are skipped. Photos whose analysis fails are not recorded and are
+retried on the next run.
+
+Usage (from the backend directory):
+    python backfill_photo_analysis.py
+    python backfill_photo_analysis.py --workers 4 --chunk-size 200
+    python backfill_photo_analysis.py --force   # reanalyse everything
+    python backfill_photo_analysis.py --derivatives [--force]
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from database import SessionLocal, init_db
+from models import (PlotPhoto, BiomassHarvest, Transport, BiomassPreprocessing,
+                    ManufacturingBatch, UnburnableProcess, BiocharApplication, Audit,
+                    PhotoAnalysis, VideoAnalysis, StoredFile)
+from file_storage import (PHOTO_DERIVATIVE_SIZES, get_file_path, derivative_path, layout_alternative,
+                          list_plain_uploads, upload_temp_path, store_photo_derivatives)
+from cv.cv_analyzer import mark_duplicate
+from cv.hash_index import get_photo_hash_index
+from cv.worker import (_init_worker, _analyze_file, _analyze_video_file, _derive_file,
+                       save_photo_analyses, store_video_result)
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# (model, source, photo path columns) for every table that references photos
+PHOTO_COLUMNS = [
+    (PlotPhoto, 'plot', ['photo_path']),
+    (BiomassHarvest, 'harvest', ['photo_path_1', 'photo_path_2']),
+    (BiomassPreprocessing, 'preprocessing', ['photo_before_path', 'photo_after_path']),
+    (Transport, 'transport', ['loading_photo_path', 'unloading_photo_path']),
+    (ManufacturingBatch, 'batch', ['photo_path']),
+    (UnburnableProcess, 'unburnable', ['photo_path']),
+    (BiocharApplication, 'application', ['photo_path']),
+]
+
+
+def collect_photo_references(db) -> Dict[str, Tuple[str, Optional[int]]]:
+    """
+    Map every photo path referenced in the database to (source, record_id).
+    Files under uploads/photos that no record points to are included with
+    source 'unreferenced'.
+    """
+    references = {}
+
+    for model, source, columns in PHOTO_COLUMNS:
+        record_key = model.plot_id if model is PlotPhoto else model.id
+        for row in db.query(record_key, *[getattr(model, c) for c in columns]):
+            for path in row[1:]:
+                if path:
+                    references.setdefault(path, (source, row[0]))
+
+    for audit_id, photos in db.query(Audit.id, Audit.photos):
+        for path in photos or []:
+            if path:
+                references.setdefault(path, ('audit', audit_id))
+
+    for path in list_plain_uploads("photos"):
+        if path.lower().endswith(PHOTO_EXTENSIONS):
+            references.setdefault(path, ('unreferenced', None))
+    for (path,) in db.query(StoredFile.path).filter(StoredFile.path.like("photos/%")):
+        if path.lower().endswith(PHOTO_EXTENSIONS):
+            references.setdefault(path, ('unreferenced', None))
+
+    return references
+
+
+def find_pending(db, references: Dict, force: bool) -> Tuple[List, int, int]:
+    """
+    Filter references down to photos that exist on disk and still need analysis
+
+    Returns:
+        (pending [(relative_path, file_path, source, record_id)], done, missing)
+    """
+    done_paths = set() if force else {path for (path,) in db.query(PhotoAnalysis.photo_path)}
+
+    pending = []
+    done = missing = 0
+    for relative_path, (source, record_id) in references.items():
+        if relative_path in done_paths:
+            done += 1
+            continue
+        file_path = get_file_path(relative_path)
+        if not file_path:
+            missing += 1
+            continue
+        pending.append((relative_path, file_path, source, record_id))
+
+    return pending, done, missing
+
+
+def store_chunk(db, index, chunk: List, results: List[Dict]) -> int:
+    """Check duplicates, upsert one chunk of results and commit it"""
+    records = []
+    for (relative_path, _, source, record_id), result in zip(chunk, results):
+        image_hash = result.get('perceptual_hash')
+        if not image_hash:
+            continue  # analysis failed; retried on the next run
+
+        duplicates = index.query(image_hash, exclude_path=relative_path)
+        if duplicates:
+            mark_duplicate(result, duplicates[0]['similarity'])
+            result['duplicates'] = duplicates[:5]
+
+        records.append((relative_path, source, record_id, result))
+        index.add(db, relative_path, image_hash, source, record_id, commit=False)
+
+    save_photo_analyses(db, records)
+    db.commit()
+    return len(records)
+
+
+def backfill_photos(db, pool: ProcessPoolExecutor, workers: int, chunk_size: int, force: bool):
+    references = collect_photo_references(db)
+    pending, done, missing = find_pending(db, references, force)
+    print(f"Photos referenced: {len(references)}  already analysed: {done}  "
+          f"missing files: {missing}  to analyse: {len(pending)}")
+    if not pending:
+        return
+
+    index = get_photo_hash_index()
+    stored = failed = 0
+    start = time.perf_counter()
+
+    for offset in range(0, len(pending), chunk_size):
+        chunk = pending[offset:offset + chunk_size]
+        chunk_start = time.perf_counter()
+
+        results = list(pool.map(
+            _analyze_file, [item[1] for item in chunk],
+            chunksize=max(1, len(chunk) // (workers * 4))
+        ))
+        count = store_chunk(db, index, chunk, results)
+        stored += count
+        failed += len(chunk) - count
+
+        elapsed = time.perf_counter() - start
+        processed = offset + len(chunk)
+        print(f"  {processed}/{len(pending)}  "
+              f"chunk {len(chunk) / (time.perf_counter() - chunk_start):.1f} photos/s  "
+              f"overall {processed / elapsed:.1f} photos/s")
+
+    elapsed = time.perf_counter() - start
+    print(f"[OK] Photo backfill complete: {stored} analysed, {failed} failed "
+          f"in {elapsed:.1f}s ({len(pending) / elapsed:.1f} photos/s)")
+
+
+def backfill_videos(db, pool: ProcessPoolExecutor, force: bool):
+    """
+    Analyse and fingerprint batch videos that have no video analysis yet.
+    Videos are stored oldest batch first, so when footage was reused the
+    later batch is the one flagged.
+    """
+    done_paths = set() if force else {path for (path,) in db.query(VideoAnalysis.video_path)}
+    pending = []
+    for batch_id, video_path in db.query(ManufacturingBatch.id, ManufacturingBatch.video_path) \
+            .filter(ManufacturingBatch.video_path.isnot(None)).order_by(ManufacturingBatch.id):
+        file_path = get_file_path(video_path)
+        if video_path not in done_paths and file_path:
+            pending.append((batch_id, video_path, file_path))
+
+    print(f"Batch videos to analyse: {len(pending)}")
+    if not pending:
+        return
+
+    start = time.perf_counter()
+    results = pool.map(_analyze_video_file, [item[2] for item in pending])
+    for count, ((batch_id, video_path, _), result) in enumerate(zip(pending, results), 1):
+        store_video_result(db, video_path, batch_id, result)
+        print(f"  {count}/{len(pending)}  {video_path}"
+              f"{'  REUSED' if result.get('reused_video') else ''}")
+
+    elapsed = time.perf_counter() - start
+    print(f"[OK] Video backfill complete: {len(pending)} analysed in {elapsed:.1f}s")
+
+
+def backfill_derivatives(db, pool: ProcessPoolExecutor, workers: int, force: bool):
+    """
+    Generate missing WebP derivatives for every photo under uploads/photos
+    and every content-addressed photo upload, and store them through the
+    storage backend
+    """
+    paths = set(list_plain_uploads("photos"))
+    paths.update(path for (path,) in db.query(StoredFile.path).filter(StoredFile.path.like("photos/%")))
+
+    def has_derivatives(relative_path: str) -> bool:
+        candidates = [relative_path, layout_alternative(relative_path)]
+        return all(any(candidate and derivative_path(candidate, size) in paths for candidate in candidates)
+                   for size in PHOTO_DERIVATIVE_SIZES)
+
+    pending = []
+    for relative_path in sorted(paths):
+        if not relative_path.lower().endswith(PHOTO_EXTENSIONS) or (not force and has_derivatives(relative_path)):
+            continue
+        file_path = get_file_path(relative_path)
+        if file_path:
+            pending.append((relative_path, file_path))
+
+    print(f"Photos without derivatives: {len(pending)}")
+    if not pending:
+        return
+
+    start = time.perf_counter()
+    failed = 0
+    files = [{size: upload_temp_path('.webp') for size in PHOTO_DERIVATIVE_SIZES} for _ in pending]
+    targets = [[(outputs[size], max_side) for size, max_side in PHOTO_DERIVATIVE_SIZES.items()]
+               for outputs in files]
+    results = pool.map(_derive_file, [item[1] for item in pending], targets,
+                       chunksize=max(1, len(pending) // (workers * 4)))
+    for count, ((relative_path, file_path), outputs, result) in enumerate(zip(pending, files, results), 1):
+        asyncio.run(store_photo_derivatives(relative_path, outputs))
+        if result.get('error'):
+            failed += 1
+            print(f"  ⚠️ {file_path}: {result['error']}")
+        if count % 100 == 0:
+            print(f"  {count}/{len(pending)}")
+
+    elapsed = time.perf_counter() - start
+    print(f"[OK] Derivative backfill complete: {len(pending) - failed} photos, {failed} failed "
+          f"in {elapsed:.1f}s")
+
+
+def backfill(workers: int, chunk_size: int, force: bool = False, derivatives: bool = False):
+    init_db()
+    db = SessionLocal()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    try:
+        if derivatives:
+            backfill_derivatives(db, pool, workers, force)
+        else:
+            backfill_photos(db, pool, workers, chunk_size, force)
+            backfill_videos(db, pool, force)
+
+    except KeyboardInterrupt:
+        db.rollback()
+        print("\n⚠️ Interrupted - committed chunks are kept, rerun to continue")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill CV analysis for existing photos and batch videos")
+    parser.add_argument("--workers", type=int, default=max(1, os.cpu_count() or 1),
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=100,
+                        help="photos analysed and committed per chunk")
+    parser.add_argument("--force", action="store_true",
+                        help="reanalyse photos that already have an analysis "
+                             "(with --derivatives: regenerate existing derivatives)")
+    parser.add_argument("--derivatives", action="store_true",
+                        help="only generate missing WebP thumbnail/medium derivatives")
+    args = parser.parse_args()
+
+    backfill(args.workers, args.chunk_size, args.force, args.derivatives)
+
+
+if __name__ == "__main__":
+    main()
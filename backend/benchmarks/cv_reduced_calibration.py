@@ -0,0 +1,143 @@
+"""
+Calibration: reduced-resolution vs full-resolution photo analysis
+Builds a labelled sample from a directory of photos (each photo at phone
+resolution, sharp and with known amounts of Gaussian blur), then compares the
+reduced-decode heuristics with full-resolution results:
+
+- blur warning agreement per reduction factor, and the Laplacian-variance
+  threshold that best reproduces the full-resolution decision
+- brightness and dark-pixel ratio error, biochar decision agreement
+- perceptual hash Hamming distance
+- analysis time per photo
+
+Usage (from the backend directory):
+    python benchmarks/cv_reduced_calibration.py [photo_dir]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+import imagehash
+from PIL import Image
+
+from cv.cv_analyzer import (
+    analyze_photo, check_quality, detect_biochar, decode_image, get_image_size,
+    choose_reduce_factor, BLUR_VARIANCE_NORMALIZER, REDUCED_DECODE_FLAGS
+)
+
+# Full-resolution sigma (relative to a ~1600 px photo) and its label
+BLUR_LEVELS = [0, 0.5, 0.8, 1.0, 1.2, 1.5, 2.0, 3.0]
+PHONE_SCALES = [1.0, 2.5]  # 2.5x brings ~1600 px photos to 12 MP
+
+
+def build_sample(photo_dir: str) -> list:
+    """Return a list of encoded JPEG buffers covering sharp and blurred variants"""
+    sample = []
+    for name in sorted(os.listdir(photo_dir)):
+        if not name.lower().endswith(('.jpg', '.jpeg')):
+            continue
+        original = cv2.imread(os.path.join(photo_dir, name))
+        if original is None:
+            continue
+        for scale in PHONE_SCALES:
+            base = original if scale == 1.0 else cv2.resize(
+                original, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            for sigma in BLUR_LEVELS:
+                image = base if sigma == 0 else cv2.GaussianBlur(base, (0, 0), sigma * scale)
+                ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                sample.append(buf.tobytes())
+    return sample
+
+
+def laplacian_variance(image: np.ndarray) -> float:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+def best_threshold(values: np.ndarray, labels: np.ndarray):
+    """Geometric middle of the threshold range with the best agreement"""
+    thresholds = np.geomspace(10, 50000, 600)
+    accuracy = np.array([((values < t) == labels).mean() for t in thresholds])
+    best = thresholds[accuracy >= accuracy.max() - 1e-9]
+    return accuracy.max(), float(np.sqrt(best.min() * best.max()))
+
+
+def main():
+    photo_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join('uploads', 'photos')
+    sample = build_sample(photo_dir)
+    if not sample:
+        print(f"No JPEG photos found in {photo_dir}")
+        return
+
+    factors = sorted(REDUCED_DECODE_FLAGS)
+    variances = {f: [] for f in factors}
+    chosen = []
+    brightness_err, dark_err, biochar_agree, hash_dist = [], [], [], []
+
+    for data in sample:
+        full = decode_image(data, 1)
+        for factor in factors:
+            variances[factor].append(laplacian_variance(decode_image(data, factor)))
+
+        # Compare at the factor production would actually pick for this photo
+        reduced_factor = choose_reduce_factor(*get_image_size(data))
+        chosen.append(reduced_factor)
+        reduced = decode_image(data, reduced_factor)
+        q_full = check_quality('', image=full, file_size=len(data))
+        q_red = check_quality('', image=reduced, file_size=len(data), reduce_factor=reduced_factor)
+        b_full = detect_biochar('', image=full)
+        b_red = detect_biochar('', image=reduced)
+        brightness_err.append(abs(q_full['brightness'] - q_red['brightness']))
+        dark_err.append(abs(b_full['dark_pixel_ratio'] - b_red['dark_pixel_ratio']))
+        biochar_agree.append(b_full['biochar_detected'] == b_red['biochar_detected'])
+
+        h_full = imagehash.average_hash(Image.fromarray(cv2.cvtColor(full, cv2.COLOR_BGR2GRAY)))
+        h_red = imagehash.average_hash(Image.fromarray(cv2.cvtColor(reduced, cv2.COLOR_BGR2GRAY)))
+        hash_dist.append(h_full - h_red)
+
+    full_var = np.array(variances[1])
+    chosen = np.array(chosen)
+    all_labels = full_var < 0.3 * BLUR_VARIANCE_NORMALIZER[1]
+    print(f"Labelled sample: {len(sample)} images ({all_labels.sum()} blurry at full resolution)\n")
+
+    print("Blur warning vs full resolution (photos large enough for each factor):")
+    for factor in factors[1:]:
+        eligible = chosen >= factor
+        if not eligible.any():
+            continue
+        values = np.array(variances[factor])[eligible]
+        labels = all_labels[eligible]
+        current = ((values < 0.3 * BLUR_VARIANCE_NORMALIZER[factor]) == labels).mean()
+        accuracy, threshold = best_threshold(values, labels)
+        print(f"  1/{factor} ({eligible.sum()} photos): current normalizer {BLUR_VARIANCE_NORMALIZER[factor]:.0f} -> "
+              f"{current:.1%} agreement | best {accuracy:.1%} at normalizer {threshold / 0.3:.0f}")
+
+    print("\nAt the production reduction factor:")
+    print(f"  Brightness abs error:      max {max(brightness_err):.4f}")
+    print(f"  Dark-pixel ratio abs error: max {max(dark_err):.4f}")
+    print(f"  Biochar decision agreement: {np.mean(biochar_agree):.1%}")
+    print(f"  Hash Hamming distance:      max {max(hash_dist)}, mean {np.mean(hash_dist):.2f}")
+
+    # Timing on the phone-resolution images
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, data in enumerate(sample[len(BLUR_LEVELS):2 * len(BLUR_LEVELS)]):
+            path = os.path.join(tmp, f"sample_{i}.jpg")
+            with open(path, 'wb') as f:
+                f.write(data)
+            paths.append(path)
+        start = time.perf_counter()
+        for path in paths:
+            analyze_photo(path)
+        elapsed = (time.perf_counter() - start) * 1000 / len(paths)
+        size = Image.open(paths[0]).size
+        print(f"\nanalyze_photo: {elapsed:.1f} ms/photo at {size[0]}x{size[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark: login throughput and latency
+Compares POST /auth/login (argon2 verification in the password hashing
+thread pool, see auth.py) with the previous behaviour of verifying inline on
+the event loop, over real HTTP against one uvicorn worker:
+
+- login latency p50 / p99 and logins/s for the worker
+- latency of a trivial request sent while the logins run, which shows how
+  long the event loop is blocked
+
+A benchmark user is created with the configured PASSWORD_HASH_* parameters
+and removed again at the end.
+
+Usage (from the backend directory):
+    python benchmarks/login.py [--clients 8] [--seconds 10]
+    PASSWORD_HASH_TIME_COST=2 PASSWORD_HASH_MEMORY_COST_KB=32768 python benchmarks/login.py
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Measure hashing, not the login rate limiter (rate_limit.py)
+os.environ.setdefault("AUTH_RATE_LIMIT_ENABLED", "false")
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy.orm import Session
+
+from auth import (PASSWORD_HASH_TIME_COST, PASSWORD_HASH_MEMORY_COST_KB, PASSWORD_HASH_PARALLELISM,
+                  PASSWORD_HASH_THREADS, hash_password, verify_password)
+from database import SessionLocal, get_db, init_db
+from models import User
+from schemas import UserLogin
+from routers import auth as auth_router
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def inline_app() -> FastAPI:
+    """Login as before: argon2 verification on the event loop"""
+    app = FastAPI()
+
+    @app.post("/auth/login")
+    async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+        user = db.query(User).filter(User.username == credentials.username).first()
+        if not user or not verify_password(credentials.password, user.password_hash):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        return {"username": user.username}
+
+    return app
+
+
+async def ping():
+    return {"ok": True}
+
+
+def pooled_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(auth_router.router)
+    return app
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def benchmark(name: str, base_url: str, username: str, password: str, clients: int, seconds: float):
+    login_ms = []
+    ping_ms = []
+    failures = []
+    deadline = time.perf_counter() + seconds
+
+    def login_worker():
+        with httpx.Client(timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = client.post(f"{base_url}/auth/login",
+                                       json={"username": username, "password": password})
+                elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code == 200:
+                    login_ms.append(elapsed)
+                else:
+                    failures.append(response.status_code)
+
+    def ping_worker():
+        with httpx.Client(timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                client.get(f"{base_url}/ping")
+                ping_ms.append((time.perf_counter() - start) * 1000)
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=login_worker) for _ in range(clients)]
+    threads.append(threading.Thread(target=ping_worker))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"  {name:8s} logins  {len(login_ms) / seconds:7.1f}/s per worker  "
+          f"p50 {percentile(login_ms, 0.50):7.1f} ms  p99 {percentile(login_ms, 0.99):7.1f} ms"
+          + (f"  ({len(failures)} failed)" if failures else ""))
+    print(f"  {name:8s} ping during logins        "
+          f"p50 {percentile(ping_ms, 0.50):7.1f} ms  p99 {percentile(ping_ms, 0.99):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login throughput and latency")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    init_db()
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    password = uuid.uuid4().hex
+    db = SessionLocal()
+    user = User(username=username, email=f"{username}@example.com", password_hash=hash_password(password),
+                role="farmer", full_name="Login Benchmark")
+    db.add(user)
+    db.commit()
+
+    apps = {"pool": pooled_app(), "inline": inline_app()}
+    for app in apps.values():
+        app.add_api_route("/ping", ping)
+    start_server(apps["pool"], 8941)
+    start_server(apps["inline"], 8942)
+
+    try:
+        print(f"argon2 t={PASSWORD_HASH_TIME_COST} m={PASSWORD_HASH_MEMORY_COST_KB} KB "
+              f"p={PASSWORD_HASH_PARALLELISM}, {PASSWORD_HASH_THREADS} hash threads, "
+              f"{args.clients} clients, {args.seconds:.0f}s per test")
+        benchmark("pool", "http://127.0.0.1:8941", username, password, args.clients, args.seconds)
+        benchmark("inline", "http://127.0.0.1:8942", username, password, args.clients, args.seconds)
+    finally:
+        db.delete(user)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: /uploads serving throughput
+Compares the /uploads route (routers/uploads.py) with a plain StaticFiles
+mount serving the same bytes, over real HTTP (uvicorn on localhost):
+
+- full download of a kiln video (MB/s)
+- random 256 KB byte ranges, as a video player seeking (requests/s;
+  StaticFiles has no Range support and sends the whole file each time)
+- revalidation of a photo with If-None-Match (requests/s; StaticFiles
+  answers 304 as well, but clients re-ask because it sends no max-age)
+
+The test files are stored through the content-addressed store and removed
+again at the end.
+
+Usage (from the backend directory):
+    python benchmarks/uploads_serving.py [--video-mb 50] [--clients 8] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from database import init_db
+from file_storage import UPLOAD_DIR, store_file, delete_file, get_stored_sha256, blob_key
+from routers import uploads as uploads_router
+
+RANGE_SIZE = 256 * 1024
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def run_clients(clients: int, seconds: float, request) -> tuple:
+    """Call request(client) from `clients` threads for `seconds`; returns (requests, bytes)"""
+    totals = []
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        count = received = 0
+        with httpx.Client(timeout=30) as client:
+            while time.perf_counter() < deadline:
+                received += request(client)
+                count += 1
+        totals.append((count, received))
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(t[0] for t in totals), sum(t[1] for t in totals)
+
+
+def benchmark(name: str, base_url: str, video_path: str, photo_path: str,
+              video_size: int, clients: int, seconds: float):
+    def full(client):
+        return len(client.get(f"{base_url}/{video_path}").content)
+
+    def ranged(client):
+        start = random.randrange(0, video_size - RANGE_SIZE)
+        response = client.get(f"{base_url}/{video_path}",
+                              headers={"Range": f"bytes={start}-{start + RANGE_SIZE - 1}"})
+        return len(response.content)
+
+    with httpx.Client() as client:
+        etag = client.get(f"{base_url}/{photo_path}").headers.get("etag", "")
+
+    def revalidate(client):
+        response = client.get(f"{base_url}/{photo_path}", headers={"If-None-Match": etag})
+        assert response.status_code == 304, response.status_code
+        return 0
+
+    count, received = run_clients(clients, seconds, full)
+    print(f"  {name:12s} full video     {count / seconds:8.1f} req/s  {received / seconds / 1e6:8.1f} MB/s")
+    count, received = run_clients(clients, seconds, ranged)
+    print(f"  {name:12s} 256 KB ranges  {count / seconds:8.1f} req/s  {received / seconds / 1e6:8.1f} MB/s")
+    count, _ = run_clients(clients, seconds, revalidate)
+    print(f"  {name:12s} photo 304      {count / seconds:8.1f} req/s")
+
+
+async def store_test_files(video_mb: int):
+    temp_dir = tempfile.mkdtemp()
+    files = {}
+    for kind, name, size in (("video", f"videos/bench_{uuid.uuid4().hex[:8]}.mp4", video_mb * 1024 * 1024),
+                             ("photo", f"photos/bench_{uuid.uuid4().hex[:8]}.jpg", 3 * 1024 * 1024)):
+        temp_path = os.path.join(temp_dir, kind)
+        with open(temp_path, "wb") as f:
+            f.write(os.urandom(size))
+        files[kind] = (await store_file(temp_path, name), size)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /uploads serving")
+    parser.add_argument("--video-mb", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    init_db()
+    files = asyncio.run(store_test_files(args.video_mb))
+    video_path, video_size = files["video"]
+    photo_path, _ = files["photo"]
+
+    app = FastAPI()
+    app.include_router(uploads_router.router)
+    baseline = FastAPI()
+    baseline.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+
+    start_server(app, 8931)
+    start_server(baseline, 8932)
+
+    try:
+        print(f"{args.video_mb} MB video, {args.clients} clients, {args.seconds:.0f}s per test")
+        benchmark("/uploads", "http://127.0.0.1:8931/uploads", video_path, photo_path,
+                  video_size, args.clients, args.seconds)
+        # StaticFiles can only serve the blob path itself
+        benchmark("StaticFiles", "http://127.0.0.1:8932/uploads",
+                  blob_key(get_stored_sha256(video_path)), blob_key(get_stored_sha256(photo_path)),
+                  video_size, args.clients, args.seconds)
+    finally:
+        delete_file(video_path)
+        delete_file(photo_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,5 +2,6 @@
 Computer Vision module for photo analysis and verification
 """
 from .cv_analyzer import analyze_photo, extract_exif, check_quality, detect_biochar
+from .biochar_batch import detect_biochar_batch
 
-__all__ = ['analyze_photo', 'extract_exif', 'check_quality', 'detect_biochar']
+__all__ = ['analyze_photo', 'extract_exif', 'check_quality', 'detect_biochar', 'detect_biochar_batch']
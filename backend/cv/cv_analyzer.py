@@ -4,93 +4,301 @@ Analyzes uploaded photos for quality, authenticity, and biochar presence
 """
 import cv2
 import numpy as np
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL import Image, ImageOps
 import imagehash
 import exifread
 from datetime import datetime
-from typing import Dict, Optional, Tuple, List
+from io import BytesIO
+from typing import BinaryIO, Dict, Optional, Tuple, Union
 import os
 
 
-def extract_exif(image_path: str) -> Dict:
+# Reduced-resolution analysis
+# ---------------------------
+# Blur, brightness, dark-pixel ratio, mean colour and the 8x8 average hash do
+# not need every pixel of a 12 MP photo. JPEGs are decoded at 1/2 or 1/4 scale
+# using DCT scaling, keeping the shorter side at least ANALYSIS_MIN_SIDE pixels.
+# 1/8 scale is not used for analysis: blur classification drops to ~80%
+# agreement with the full-resolution result there (batch scoring and photo
+# derivatives, which need no blur score, do use it).
+ANALYSIS_MIN_SIDE = 600
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+# Laplacian variance that maps to blur_score 1.0, per reduction factor.
+# Downscaling hides blur, so reduced images need a larger normalizer to keep
+# the "Image appears blurry" (blur_score < 0.3) decision in line with
+# full resolution. Calibrated with benchmarks/cv_reduced_calibration.py
+# (agreement with full resolution on the labelled sample: 100% at 1/2 and 1/4).
+BLUR_VARIANCE_NORMALIZER = {
+    1: 500.0,
+    2: 2900.0,
+    4: 11400.0
+}
+
+
+def read_image_bytes(image_path: str) -> bytes:
     """
-    Extract EXIF metadata from image including GPS coordinates
+    Read an image file from disk in a single read
     
     Args:
         image_path: Path to image file
         
     Returns:
-        Dictionary with EXIF data including GPS, timestamp, camera info
+        Raw file bytes
     """
-    result = {
-        'has_gps': False,
-        'gps_coordinates': None,
-        'timestamp': None,
-        'camera_make': None,
-        'camera_model': None
-    }
+    with open(image_path, 'rb') as f:
+        return f.read()
+
+
+def decode_image(data: bytes, reduce_factor: int = 1) -> Optional[np.ndarray]:
+    """
+    Decode image bytes into a BGR array (same layout as cv2.imread)
     
+    Args:
+        data: Raw image bytes
+        reduce_factor: 1, 2 or 4; JPEGs are decoded directly at reduced size
+        
+    Returns:
+        BGR image array or None if decoding fails
+    """
+    if not data:
+        return None
+    flag = REDUCED_DECODE_FLAGS.get(reduce_factor, cv2.IMREAD_COLOR)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+
+def get_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from the image header without decoding pixels
+    """
     try:
-        # Open image with PIL to get EXIF
-        image = Image.open(image_path)
-        exif_data = image._getexif()
+        return Image.open(BytesIO(data)).size
+    except Exception:
+        return None
+
+
+def choose_reduce_factor(width: int, height: int) -> int:
+    """
+    Pick the largest reduction factor that keeps the shorter side
+    at or above ANALYSIS_MIN_SIDE
+    """
+    for factor in (4, 2):
+        if min(width, height) // factor >= ANALYSIS_MIN_SIDE:
+            return factor
+    return 1
+
+
+def load_analysis_image(data: bytes) -> Tuple[Optional[np.ndarray], int, Optional[Tuple[int, int]]]:
+    """
+    Decode an image at the reduced resolution used for analysis
+    
+    Args:
+        data: Raw image bytes
+        
+    Returns:
+        Tuple of (BGR image, reduce_factor, full (width, height))
+    """
+    full_size = get_image_size(data)
+    reduce_factor = choose_reduce_factor(*full_size) if full_size else 1
+    image = decode_image(data, reduce_factor)
+    
+    if image is not None:
+        if full_size is None:
+            full_size = (image.shape[1], image.shape[0])
+        elif (image.shape[1] > image.shape[0]) != (full_size[0] > full_size[1]):
+            # cv2 applies EXIF orientation, the header size does not
+            full_size = (full_size[1], full_size[0])
+    
+    return image, reduce_factor, full_size
+
+
+EMPTY_EXIF = {
+    'has_gps': False,
+    'gps_coordinates': None,
+    'timestamp': None,
+    'camera_make': None,
+    'camera_model': None
+}
+
+# JPEG markers that end the metadata header (start of scan, end of image)
+JPEG_HEADER_END_MARKERS = (0xDA, 0xD9)
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xD8)) | {0x01}
+
+
+def read_exif_block(stream: BinaryIO) -> Optional[bytes]:
+    """
+    Read the EXIF (TIFF) block from a JPEG's APP1 segment
+    
+    Only the segment headers before the first scan are read; compressed
+    pixel data is never touched.
+    
+    Args:
+        stream: Binary file-like object positioned at the start of the JPEG
+        
+    Returns:
+        TIFF bytes of the EXIF block, or None if the stream is not a JPEG,
+        has no EXIF segment or has a corrupt segment header
+    """
+    if stream.read(2) != b'\xff\xd8':
+        return None
+    
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        
+        marker = stream.read(1)
+        while marker == b'\xff':  # fill bytes
+            marker = stream.read(1)
+        if not marker:
+            return None
+        
+        code = marker[0]
+        if code in JPEG_HEADER_END_MARKERS:
+            return None
+        if code in JPEG_STANDALONE_MARKERS:
+            continue
+        
+        length_bytes = stream.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = int.from_bytes(length_bytes, 'big') - 2
+        if length < 0:  # Corrupt segment header (the length includes its own 2 bytes)
+            return None
+        
+        if code == 0xE1:
+            segment = stream.read(length)
+            if segment.startswith(b'Exif\x00\x00'):
+                return segment[6:]
+        else:
+            stream.seek(length, 1)
+
+
+def _ratio_to_float(value) -> float:
+    return float(value.num) / float(value.den) if value.den else 0.0
+
+
+def extract_exif_header(source: Union[bytes, BinaryIO]) -> Dict:
+    """
+    Extract EXIF metadata (GPS, timestamp, camera) from a photo's header
+    
+    JPEGs are parsed from the APP1 segment alone, so this works on upload
+    bytes or an upload stream before the file is written to disk and
+    without decoding any pixels. Other formats fall back to exifread's own
+    header parsing.
+    
+    Args:
+        source: Raw image bytes or a binary file-like object
         
-        if not exif_data:
+    Returns:
+        Dictionary with has_gps, gps_coordinates, timestamp, camera_make, camera_model
+    """
+    result = dict(EMPTY_EXIF)
+    
+    stream = BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    start = stream.tell()
+    
+    try:
+        is_jpeg = stream.read(2) == b'\xff\xd8'
+        stream.seek(start)
+        if is_jpeg:
+            block = read_exif_block(stream)
+            if block is None:
+                return result
+            tags = exifread.process_file(BytesIO(block), details=False)
+        else:
+            tags = exifread.process_file(stream, details=False)
+        
+        if not tags:
             return result
         
-        # Extract basic EXIF info
-        for tag_id, value in exif_data.items():
-            tag = TAGS.get(tag_id, tag_id)
+        if 'Image Make' in tags:
+            result['camera_make'] = str(tags['Image Make']).strip()
+        if 'Image Model' in tags:
+            result['camera_model'] = str(tags['Image Model']).strip()
+        
+        date_tag = tags.get('Image DateTime') or tags.get('EXIF DateTimeOriginal')
+        if date_tag:
+            try:
+                result['timestamp'] = datetime.strptime(str(date_tag), '%Y:%m:%d %H:%M:%S').isoformat()
+            except ValueError:
+                result['timestamp'] = str(date_tag)
+        
+        latitude = tags.get('GPS GPSLatitude')
+        longitude = tags.get('GPS GPSLongitude')
+        if latitude and longitude:
+            lat = _convert_to_degrees([_ratio_to_float(v) for v in latitude.values])
+            lon = _convert_to_degrees([_ratio_to_float(v) for v in longitude.values])
+            
+            # Apply direction (N/S, E/W)
+            if str(tags.get('GPS GPSLatitudeRef', 'N')).strip() == 'S':
+                lat = -lat
+            if str(tags.get('GPS GPSLongitudeRef', 'E')).strip() == 'W':
+                lon = -lon
             
-            if tag == 'Make':
-                result['camera_make'] = str(value)
-            elif tag == 'Model':
-                result['camera_model'] = str(value)
-            elif tag == 'DateTime':
-                try:
-                    result['timestamp'] = datetime.strptime(str(value), '%Y:%m:%d %H:%M:%S').isoformat()
-                except:
-                    result['timestamp'] = str(value)
-            elif tag == 'GPSInfo':
-                # Extract GPS coordinates
-                gps_data = {}
-                for gps_tag_id in value:
-                    gps_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
-                    gps_data[gps_tag] = value[gps_tag_id]
-                
-                # Convert GPS to decimal degrees
-                if 'GPSLatitude' in gps_data and 'GPSLongitude' in gps_data:
-                    lat = _convert_to_degrees(gps_data['GPSLatitude'])
-                    lon = _convert_to_degrees(gps_data['GPSLongitude'])
-                    
-                    # Apply direction (N/S, E/W)
-                    if gps_data.get('GPSLatitudeRef') == 'S':
-                        lat = -lat
-                    if gps_data.get('GPSLongitudeRef') == 'W':
-                        lon = -lon
-                    
-                    result['has_gps'] = True
-                    result['gps_coordinates'] = [lat, lon]
+            result['has_gps'] = True
+            result['gps_coordinates'] = [lat, lon]
     
     except Exception as e:
         print(f"⚠️ EXIF extraction error: {e}")
     
+    finally:
+        if stream is not source:
+            stream.close()
+        else:
+            stream.seek(start)
+    
     return result
 
 
+def extract_exif(image_path: str, data: Optional[bytes] = None) -> Dict:
+    """
+    Extract EXIF metadata from image including GPS coordinates
+    
+    Args:
+        image_path: Path to image file
+        data: Optional raw image bytes (avoids re-reading the file)
+        
+    Returns:
+        Dictionary with EXIF data including GPS, timestamp, camera info
+    """
+    if data is not None:
+        return extract_exif_header(data)
+    
+    try:
+        with open(image_path, 'rb') as f:
+            return extract_exif_header(f)
+    except OSError as e:
+        print(f"⚠️ EXIF extraction error: {e}")
+        return dict(EMPTY_EXIF)
+
+
 def _convert_to_degrees(value) -> float:
     """Convert GPS coordinates to decimal degrees"""
     d, m, s = value
     return float(d) + float(m) / 60.0 + float(s) / 3600.0
 
 
-def check_quality(image_path: str) -> Dict:
+def check_quality(image_path: str, image: Optional[np.ndarray] = None,
+                  file_size: Optional[int] = None, reduce_factor: int = 1,
+                  full_size: Optional[Tuple[int, int]] = None) -> Dict:
     """
     Check image quality (blur, brightness, resolution)
     
     Args:
         image_path: Path to image file
+        image: Optional already-decoded BGR image (avoids decoding again)
+        file_size: Optional file size in bytes (avoids a stat call)
+        reduce_factor: Reduction factor the image was decoded at
+        full_size: Full-resolution (width, height) when image is reduced
         
     Returns:
         Dictionary with quality metrics
@@ -104,14 +312,20 @@ def check_quality(image_path: str) -> Dict:
     }
     
     try:
-        # Read image
-        image = cv2.imread(image_path)
+        # Read image (reduced-resolution decode)
+        if image is None:
+            data = read_image_bytes(image_path)
+            file_size = len(data)
+            image, reduce_factor, full_size = load_analysis_image(data)
         if image is None:
             result['warnings'].append('Failed to read image')
             return result
         
-        # Get resolution
-        height, width = image.shape[:2]
+        # Get resolution (of the original, not the analysis image)
+        if full_size:
+            width, height = full_size
+        else:
+            height, width = image.shape[:2]
         result['resolution'] = [width, height]
         
         # Check resolution
@@ -122,9 +336,11 @@ def check_quality(image_path: str) -> Dict:
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         # Calculate blur score using Laplacian variance
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+        _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_64F))
+        laplacian_var = float(laplacian_std[0][0]) ** 2
         # Normalize to 0-1 scale (higher = sharper)
-        result['blur_score'] = min(laplacian_var / 500.0, 1.0)
+        normalizer = BLUR_VARIANCE_NORMALIZER.get(reduce_factor, BLUR_VARIANCE_NORMALIZER[1])
+        result['blur_score'] = min(laplacian_var / normalizer, 1.0)
         
         if result['blur_score'] < 0.3:
             result['warnings'].append('Image appears blurry')
@@ -138,7 +354,8 @@ def check_quality(image_path: str) -> Dict:
             result['warnings'].append('Overexposed image')
         
         # Get file size
-        file_size = os.path.getsize(image_path)
+        if file_size is None:
+            file_size = os.path.getsize(image_path)
         result['file_size_mb'] = file_size / (1024 * 1024)
         
         if result['file_size_mb'] > 10:
@@ -151,12 +368,13 @@ def check_quality(image_path: str) -> Dict:
     return result
 
 
-def detect_biochar(image_path: str) -> Dict:
+def detect_biochar(image_path: str, image: Optional[np.ndarray] = None) -> Dict:
     """
     Detect biochar presence using color analysis
     
     Args:
         image_path: Path to image file
+        image: Optional already-decoded BGR image (avoids decoding again)
         
     Returns:
         Dictionary with biochar detection results
@@ -169,8 +387,9 @@ def detect_biochar(image_path: str) -> Dict:
     }
     
     try:
-        # Read image
-        image = cv2.imread(image_path)
+        # Read image (reduced-resolution decode)
+        if image is None:
+            image, _, _ = load_analysis_image(read_image_bytes(image_path))
         if image is None:
             return result
         
@@ -197,10 +416,8 @@ def detect_biochar(image_path: str) -> Dict:
             result['biochar_confidence'] = min(result['dark_pixel_ratio'] * 3, 1.0)
         
         # Get dominant colors (simplified)
-        # Reshape image to list of pixels
-        pixels = image.reshape(-1, 3)
-        # Calculate mean color
-        mean_color = pixels.mean(axis=0).astype(int).tolist()
+        # Calculate mean color (BGR)
+        mean_color = [int(c) for c in cv2.mean(image)[:3]]
         result['dominant_colors'] = [mean_color]
     
     except Exception as e:
@@ -209,33 +426,46 @@ def detect_biochar(image_path: str) -> Dict:
     return result
 
 
-def calculate_perceptual_hash(image_path: str) -> str:
+def calculate_perceptual_hash(image_path: str, image: Optional[np.ndarray] = None) -> str:
     """
     Calculate perceptual hash for duplicate detection
     
     Args:
         image_path: Path to image file
+        image: Optional already-decoded BGR image (avoids decoding again)
         
     Returns:
         Perceptual hash string
     """
     try:
-        image = Image.open(image_path)
+        if image is not None:
+            # Same luma conversion PIL uses for mode "L"
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            # Area-downsample first; the hash only looks at an 8x8 thumbnail
+            gray = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+            pil_image = Image.fromarray(gray)
+        else:
+            pil_image = Image.open(image_path)
+            # JPEG DCT scaling: decode straight to a small greyscale image
+            pil_image.draft('L', (ANALYSIS_MIN_SIDE, ANALYSIS_MIN_SIDE))
+            # cv2 decodes apply the EXIF orientation; hash the same upright image
+            pil_image = ImageOps.exif_transpose(pil_image)
         # Use average hash (fast and effective)
-        phash = imagehash.average_hash(image)
+        phash = imagehash.average_hash(pil_image)
         return str(phash)
     except Exception as e:
         print(f"⚠️ Hash calculation error: {e}")
         return ""
 
 
-def check_duplicate(image_hash: str, existing_hashes: List[str], threshold: int = 5) -> Tuple[bool, float]:
+def check_duplicate(image_hash: str, existing_hashes, threshold: int = 5) -> Tuple[bool, float]:
     """
     Check if image is duplicate of existing images
     
     Args:
         image_hash: Perceptual hash of new image
-        existing_hashes: List of existing image hashes
+        existing_hashes: List of existing image hashes, or a PhotoHashIndex
+                         (sub-linear lookup, see cv.hash_index)
         threshold: Hamming distance threshold (lower = more similar)
         
     Returns:
@@ -245,14 +475,21 @@ def check_duplicate(image_hash: str, existing_hashes: List[str], threshold: int
         return False, 0.0
     
     try:
-        new_hash = imagehash.hex_to_hash(image_hash)
+        # Indexed lookup
+        if hasattr(existing_hashes, 'query'):
+            matches = existing_hashes.query(image_hash, threshold)
+            if matches:
+                return True, matches[0]['similarity']
+            return False, 0.0
+        
+        # Linear scan over plain hashes, compared as 64-bit ints
+        new_hash = int(image_hash, 16)
         
         for existing_hash_str in existing_hashes:
             if not existing_hash_str:
                 continue
             
-            existing_hash = imagehash.hex_to_hash(existing_hash_str)
-            distance = new_hash - existing_hash
+            distance = (new_hash ^ int(existing_hash_str, 16)).bit_count()
             
             if distance <= threshold:
                 # Calculate similarity (0-1, higher = more similar)
@@ -266,13 +503,51 @@ def check_duplicate(image_hash: str, existing_hashes: List[str], threshold: int
         return False, 0.0
 
 
-def analyze_photo(image_path: str, existing_hashes: Optional[List[str]] = None) -> Dict:
+# Share of the quality score awarded for not being a duplicate
+DUPLICATE_WEIGHT = 0.15
+
+
+def mark_duplicate(result: Dict, similarity: float, adjust_score: bool = True) -> Dict:
+    """
+    Flag an analysis result as a duplicate
+    
+    Used when the duplicate lookup happens after analysis (e.g. in the
+    background worker, which checks the shared hash index).
+    
+    Args:
+        result: analyze_photo result
+        similarity: Similarity to the closest existing photo (0-1)
+        adjust_score: Remove the no-duplicate share from quality_score
+        
+    Returns:
+        The updated result
+    """
+    if result.get('is_duplicate'):
+        return result
+    
+    result['is_duplicate'] = True
+    result['duplicate_similarity'] = similarity
+    result['warnings'].append(f'Possible duplicate image (similarity: {similarity:.2%})')
+    
+    if adjust_score:
+        result['quality_score'] = max(result['quality_score'] - DUPLICATE_WEIGHT, 0.0)
+        if result['quality_score'] < 0.5 and 'Overall low quality score' not in result['warnings']:
+            result['warnings'].append('Overall low quality score')
+    
+    return result
+
+
+def analyze_photo(image_path: str, existing_hashes=None) -> Dict:
     """
     Complete photo analysis pipeline
     
+    The file is read once and decoded once, at reduced resolution; EXIF,
+    quality, biochar and perceptual hash are all computed from that buffer.
+    
     Args:
         image_path: Path to image file
-        existing_hashes: Optional list of existing image hashes for duplicate detection
+        existing_hashes: Optional list of existing image hashes (or a PhotoHashIndex)
+                         for duplicate detection
         
     Returns:
         Complete analysis results dictionary
@@ -299,37 +574,39 @@ def analyze_photo(image_path: str, existing_hashes: Optional[List[str]] = None)
     }
     
     try:
+        # 0. Read and decode the file once
+        data = read_image_bytes(image_path)
+        image, reduce_factor, full_size = load_analysis_image(data)
+        
         # 1. Extract EXIF metadata
-        exif_data = extract_exif(image_path)
+        exif_data = extract_exif(image_path, data=data)
         result.update(exif_data)
         
         if not result['has_gps']:
             result['warnings'].append('No GPS coordinates found')
         
         # 2. Check image quality
-        quality_data = check_quality(image_path)
+        quality_data = check_quality(image_path, image=image, file_size=len(data),
+                                     reduce_factor=reduce_factor, full_size=full_size)
         result['blur_score'] = quality_data['blur_score']
         result['brightness'] = quality_data['brightness']
         result['resolution'] = quality_data['resolution']
         result['warnings'].extend(quality_data['warnings'])
         
         # 3. Detect biochar
-        biochar_data = detect_biochar(image_path)
+        biochar_data = detect_biochar(image_path, image=image)
         result['biochar_detected'] = biochar_data['biochar_detected']
         result['biochar_confidence'] = biochar_data['biochar_confidence']
         result['dark_pixel_ratio'] = biochar_data['dark_pixel_ratio']
         
         # 4. Calculate perceptual hash
-        result['perceptual_hash'] = calculate_perceptual_hash(image_path)
+        result['perceptual_hash'] = calculate_perceptual_hash(image_path, image=image)
         
         # 5. Check for duplicates
         if existing_hashes:
             is_dup, similarity = check_duplicate(result['perceptual_hash'], existing_hashes)
-            result['is_duplicate'] = is_dup
-            result['duplicate_similarity'] = similarity
-            
             if is_dup:
-                result['warnings'].append(f'Possible duplicate image (similarity: {similarity:.2%})')
+                mark_duplicate(result, similarity, adjust_score=False)
         
         # 6. Calculate overall quality score
         # Weighted average of different factors
@@ -351,7 +628,7 @@ def analyze_photo(image_path: str, existing_hashes: Optional[List[str]] = None)
         quality_factors.append(resolution_score * 0.15)
         
         # No duplicate (weight: 0.15)
-        quality_factors.append(0.0 if result['is_duplicate'] else 0.15)
+        quality_factors.append(0.0 if result['is_duplicate'] else DUPLICATE_WEIGHT)
         
         result['quality_score'] = sum(quality_factors)
         
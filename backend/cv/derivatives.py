@@ -0,0 +1,81 @@
+"""
+Photo Derivatives for Harit Swaraj
+Creates downscaled WebP copies of uploaded photos for list and detail views,
+so clients do not download 12 MP originals just to show a thumbnail.
+
+- The photo is decoded once, at the smallest JPEG DCT scale that still
+  covers the largest derivative (cv2 applies the EXIF orientation)
+- Each derivative is resized so its longer side is at most its max size
+  (smaller photos are re-encoded at their own size, never upscaled)
+- Files are written to the paths the caller gives (temporary files, which
+  the CV worker then stores through the storage backend like any upload)
+"""
+import os
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from .cv_analyzer import REDUCED_DECODE_FLAGS, get_image_size
+
+PHOTO_DERIVATIVE_QUALITY = int(os.getenv("PHOTO_DERIVATIVE_QUALITY", "80"))
+
+
+def _decode_for(data: bytes, max_side: int):
+    """Decode at the smallest DCT scale whose longer side still reaches max_side"""
+    flag = cv2.IMREAD_COLOR
+    dimensions = get_image_size(data)
+    if dimensions:
+        for factor in sorted(REDUCED_DECODE_FLAGS, reverse=True):
+            if max(dimensions) // factor >= max_side:
+                flag = REDUCED_DECODE_FLAGS[factor]
+                break
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+
+def generate_derivatives(file_path: str, targets: List[Tuple[str, int]],
+                         quality: int = PHOTO_DERIVATIVE_QUALITY) -> Dict:
+    """
+    Write WebP derivatives of one photo
+
+    Args:
+        file_path: Path to the original photo
+        targets: (output path, max side in pixels) for each derivative
+        quality: WebP quality (0-100)
+
+    Returns:
+        Dictionary with 'written' (output paths) and 'sizes' ([width, height]
+        per output path), or 'error'
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return {'error': str(e)}
+
+    image = _decode_for(data, max(side for _, side in targets))
+    if image is None:
+        return {'error': 'Failed to read image'}
+
+    written = []
+    sizes = {}
+    height, width = image.shape[:2]
+    for output_path, max_side in targets:
+        scale = min(1.0, max_side / max(width, height))
+        resized = image if scale == 1.0 else cv2.resize(
+            image, (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+
+        ok, encoded = cv2.imencode('.webp', resized, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        if not ok:
+            return {'error': f'WebP encoding failed for {output_path}', 'written': written}
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'wb') as f:
+            f.write(encoded.tobytes())
+
+        written.append(output_path)
+        sizes[output_path] = [resized.shape[1], resized.shape[0]]
+
+    return {'written': written, 'sizes': sizes}
@@ -0,0 +1,313 @@
+"""
+Perceptual Hash Index for Harit Swaraj
+Near-duplicate photo detection in sub-linear time using multi-index
+hashing over 64-bit perceptual hashes (Hamming distance).
+
+Every uploaded photo (plots, harvests, preprocessing, transport, batches,
+unburnable processes, applications and audits) is recorded in the
+photo_hashes table. Each worker process keeps an in-memory index built from
+that table on first use and updated on every insert it makes. Hashes added
+by other workers are picked up by polling the table for rows above the
+highest id seen, at most every PHOTO_HASH_INDEX_POLL_S seconds; when the row
+count no longer matches (rows deleted by gc_uploads.py, or committed out of
+id order) the index is rebuilt.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+HASH_INDEX_POLL_S = float(os.getenv("PHOTO_HASH_INDEX_POLL_S", "10"))
+
+HASH_BITS = 64
+
+
+def hash_to_int(image_hash: str) -> int:
+    """Convert a hex perceptual hash (as produced by imagehash) to an int"""
+    return int(image_hash, 16)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHashTable:
+    """
+    Multi-index hashing (Norouzi et al.) over 64-bit hashes.
+
+    Each hash is split into NUM_BANDS 16-bit bands, and every band value is
+    indexed in its own hash table. If two hashes differ in at most r bits,
+    at least one band differs in at most r // NUM_BANDS bits (pigeonhole), so
+    a radius query only has to probe the band values within that small
+    radius and verify the few candidates it finds with the full distance.
+    """
+
+    NUM_BANDS = 4
+    BAND_BITS = HASH_BITS // NUM_BANDS
+    BAND_MASK = (1 << BAND_BITS) - 1
+
+    def __init__(self):
+        self._payloads = {}  # hash -> [payload, ...]
+        self._bands = [dict() for _ in range(self.NUM_BANDS)]  # band value -> {hash, ...}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _split(self, value: int) -> List[int]:
+        return [(value >> (i * self.BAND_BITS)) & self.BAND_MASK for i in range(self.NUM_BANDS)]
+
+    def _neighbours(self, band_value: int, radius: int) -> List[int]:
+        """All band values within `radius` bits of band_value"""
+        values = [band_value]
+        for _ in range(radius):
+            values = list({v ^ (1 << bit) for v in values for bit in range(self.BAND_BITS)} | set(values))
+        return values
+
+    def add(self, value: int, payload=None):
+        """Insert a hash with an associated payload"""
+        self._size += 1
+        if value in self._payloads:
+            self._payloads[value].append(payload)
+            return
+
+        self._payloads[value] = [payload]
+        for band, band_value in zip(self._bands, self._split(value)):
+            band.setdefault(band_value, set()).add(value)
+
+    def remove(self, value: int, predicate) -> int:
+        """Remove the payloads of a hash for which predicate(payload) is true"""
+        payloads = self._payloads.get(value)
+        if not payloads:
+            return 0
+        kept = [payload for payload in payloads if not predicate(payload)]
+        removed = len(payloads) - len(kept)
+        self._size -= removed
+        if kept:
+            self._payloads[value] = kept
+            return removed
+
+        del self._payloads[value]
+        for band, band_value in zip(self._bands, self._split(value)):
+            bucket = band.get(band_value)
+            if bucket is not None:
+                bucket.discard(value)
+                if not bucket:
+                    del band[band_value]
+        return removed
+
+    def query(self, value: int, radius: int) -> List[Tuple[int, int, list]]:
+        """
+        Find every stored hash within `radius` of `value`
+
+        Returns:
+            List of (distance, hash, payloads) sorted by distance
+        """
+        band_radius = radius // self.NUM_BANDS
+        candidates = set()
+        for band, band_value in zip(self._bands, self._split(value)):
+            for neighbour in self._neighbours(band_value, band_radius):
+                bucket = band.get(neighbour)
+                if bucket:
+                    candidates.update(bucket)
+
+        results = []
+        for candidate in candidates:
+            distance = hamming_distance(value, candidate)
+            if distance <= radius:
+                results.append((distance, candidate, list(self._payloads[candidate])))
+
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class PhotoHashIndex:
+    """
+    Thread-safe near-duplicate index for uploaded photos, backed by the
+    photo_hashes table.
+    """
+
+    def __init__(self, poll_interval_s: float = HASH_INDEX_POLL_S):
+        self.poll_interval_s = poll_interval_s
+        self._table = MultiIndexHashTable()
+        self._paths: Dict[str, int] = {}  # photo_path -> hash
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._max_id = 0
+        self._row_count = 0
+        self._last_poll = 0.0
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    @staticmethod
+    def _insert(table: MultiIndexHashTable, paths: Dict[str, int], photo_path: str,
+                image_hash: str, source: str, record_id: Optional[int]):
+        if not image_hash or photo_path in paths:
+            return
+        value = hash_to_int(image_hash)
+        paths[photo_path] = value
+        table.add(value, {
+            'photo_path': photo_path,
+            'source': source,
+            'record_id': record_id
+        })
+
+    def refresh(self, db, full: bool = False):
+        """
+        Add photo_hashes rows inserted since the last refresh; rebuild the
+        whole index when the table's row count shows rows were deleted or
+        committed below the highest id seen
+        """
+        from sqlalchemy import func
+        from models import PhotoHash
+
+        columns = (PhotoHash.id, PhotoHash.photo_path, PhotoHash.perceptual_hash,
+                   PhotoHash.source, PhotoHash.record_id)
+        if not full:
+            rows = db.query(*columns).filter(PhotoHash.id > self._max_id).order_by(PhotoHash.id).all()
+            count = db.query(func.count(PhotoHash.id)).scalar()
+            with self._lock:
+                for row_id, photo_path, image_hash, source, record_id in rows:
+                    self._insert(self._table, self._paths, photo_path, image_hash, source, record_id)
+                    self._max_id = max(self._max_id, row_id)
+                self._row_count += len(rows)
+                if self._row_count == count:
+                    return
+
+        # Build the new index aside so queries keep running meanwhile
+        table = MultiIndexHashTable()
+        paths: Dict[str, int] = {}
+        max_id = row_count = 0
+        for row_id, photo_path, image_hash, source, record_id in db.query(*columns).yield_per(1000):
+            self._insert(table, paths, photo_path, image_hash, source, record_id)
+            max_id = max(max_id, row_id)
+            row_count += 1
+        with self._lock:
+            self._table, self._paths = table, paths
+            self._max_id, self._row_count = max_id, row_count
+
+    def maybe_refresh(self):
+        """Refresh from the database if poll_interval_s has passed (one thread at a time)"""
+        if time.monotonic() - self._last_poll < self.poll_interval_s:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # Another thread is refreshing
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            self._last_poll = time.monotonic()
+            self.refresh(db)
+        except Exception as e:
+            print(f"⚠️ Could not refresh photo hash index: {e}")
+        finally:
+            db.close()
+            self._refresh_lock.release()
+
+    def contains(self, photo_path: str) -> bool:
+        return photo_path in self._paths
+
+    def add(self, db, photo_path: str, image_hash: str, source: str,
+            record_id: Optional[int] = None, commit: bool = True):
+        """
+        Persist a photo hash and insert it into the in-memory index
+
+        With commit=False the row is only added to the session's transaction,
+        so bulk callers can commit many photos at once. A row another worker
+        inserted for the same path first is kept.
+        """
+        from database import insert_ignore
+        from models import PhotoHash
+
+        if not image_hash or photo_path in self._paths:
+            return
+
+        insert_ignore(db, PhotoHash, photo_path=photo_path, perceptual_hash=image_hash,
+                      source=source, record_id=record_id)
+        if commit:
+            db.commit()
+
+        with self._lock:
+            self._insert(self._table, self._paths, photo_path, image_hash, source, record_id)
+
+    def remove(self, db, photo_paths, commit: bool = True) -> int:
+        """Delete photos from the photo_hashes table and the in-memory index"""
+        from models import PhotoHash
+
+        photo_paths = list(photo_paths)
+        deleted = 0
+        for offset in range(0, len(photo_paths), 500):
+            chunk = photo_paths[offset:offset + 500]
+            deleted += db.query(PhotoHash).filter(PhotoHash.photo_path.in_(chunk)) \
+                .delete(synchronize_session=False)
+        if commit:
+            db.commit()
+
+        with self._lock:
+            for photo_path in photo_paths:
+                value = self._paths.pop(photo_path, None)
+                if value is not None:
+                    self._table.remove(value, lambda payload: payload['photo_path'] == photo_path)
+            self._row_count -= deleted
+        return deleted
+
+    def query(self, image_hash: str, threshold: int = 5,
+              exclude_path: Optional[str] = None) -> List[Dict]:
+        """
+        Find stored photos within `threshold` bits of `image_hash`
+
+        Returns:
+            List of matches (closest first) with photo_path, source,
+            record_id, distance and similarity
+        """
+        if not image_hash:
+            return []
+
+        with self._lock:
+            hits = self._table.query(hash_to_int(image_hash), threshold)
+
+        matches = []
+        for distance, _, payloads in hits:
+            for payload in payloads:
+                if payload['photo_path'] == exclude_path:
+                    continue
+                matches.append({
+                    **payload,
+                    'distance': distance,
+                    'similarity': 1.0 - (distance / HASH_BITS)
+                })
+        return matches
+
+
+# Singleton index, loaded from the database on first use
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_photo_hash_index() -> PhotoHashIndex:
+    """
+    Get the photo hash index (singleton), loading it from the database on
+    first use and picking up other workers' rows afterwards
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from database import SessionLocal
+
+                index = PhotoHashIndex()
+                db = SessionLocal()
+                try:
+                    index.refresh(db, full=True)
+                    index._last_poll = time.monotonic()
+                    print(f"[OK] Photo hash index loaded ({len(index)} photos)")
+                except Exception as e:
+                    print(f"⚠️ Could not load photo hash index: {e}")
+                finally:
+                    db.close()
+                _index = index
+            return _index
+    _index.maybe_refresh()
+    return _index
@@ -0,0 +1,155 @@
+"""
+Content-Hash CV Result Cache for Harit Swaraj
+Caches analyze_photo results by SHA-256 of the photo bytes, so a photo that
+is uploaded again (e.g. a harvest photo reused as a transport or audit
+photo) is never decoded or analysed twice.
+
+- Memory tier: bounded LRU (CV_CACHE_MEMORY_SIZE entries) per process
+- DB tier: cv_result_cache table, capped at CV_CACHE_DB_MAX_ROWS rows;
+  the least recently used rows are evicted when the cap is exceeded
+
+Cached results are the raw analyze_photo output. Per-upload fields such as
+duplicate matches are added after the lookup.
+"""
+import copy
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+
+CV_CACHE_MEMORY_SIZE = int(os.getenv("CV_CACHE_MEMORY_SIZE", "1000"))
+CV_CACHE_DB_MAX_ROWS = int(os.getenv("CV_CACHE_DB_MAX_ROWS", "100000"))
+
+# Check the DB row count once every this many inserts
+EVICTION_CHECK_INTERVAL = 100
+
+
+class CVResultCache:
+    """
+    Two-tier (memory LRU + database) cache of photo analysis results.
+
+    Args:
+        memory_size: Maximum entries kept in memory
+        db_max_rows: Maximum rows kept in the cv_result_cache table
+    """
+
+    def __init__(self, memory_size: int = CV_CACHE_MEMORY_SIZE,
+                 db_max_rows: int = CV_CACHE_DB_MAX_ROWS):
+        self.memory_size = memory_size
+        self.db_max_rows = db_max_rows
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+    def _remember(self, sha256: str, result: Dict):
+        with self._lock:
+            self._memory[sha256] = result
+            self._memory.move_to_end(sha256)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get(self, db, sha256: str) -> Optional[Dict]:
+        """Look up a result by content hash (memory first, then database)"""
+        from models import CVResultCache as CacheEntry
+
+        with self._lock:
+            result = self._memory.get(sha256)
+            if result is not None:
+                self._memory.move_to_end(sha256)
+                self.memory_hits += 1
+                return copy.deepcopy(result)
+
+        entry = db.query(CacheEntry).filter(CacheEntry.sha256 == sha256).first()
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        entry.hits = (entry.hits or 0) + 1
+        entry.last_used_at = datetime.utcnow()
+        db.commit()
+
+        self._remember(sha256, entry.result)
+        with self._lock:
+            self.db_hits += 1
+        return copy.deepcopy(entry.result)
+
+    def put(self, db, sha256: str, result: Dict):
+        """
+        Store a result in both tiers. Failed analyses are not cached.
+        Commits; the same bytes may be stored concurrently (one row is kept),
+        and a database error only costs the cache entry, never the caller's work.
+        """
+        from database import insert_ignore
+        from models import CVResultCache as CacheEntry
+
+        if not sha256 or not result.get('perceptual_hash'):
+            return
+
+        result = copy.deepcopy(result)
+        self._remember(sha256, result)
+
+        try:
+            inserted = insert_ignore(db, CacheEntry, sha256=sha256, result=result)
+            db.commit()
+            if inserted:
+                self._inserts += 1
+                if self._inserts % EVICTION_CHECK_INTERVAL == 0:
+                    self.evict(db)
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"⚠️ CV result cache entry not stored: {e}")
+
+    def evict(self, db) -> int:
+        """Delete the least recently used DB rows above db_max_rows"""
+        from models import CVResultCache as CacheEntry
+
+        excess = db.query(CacheEntry).count() - self.db_max_rows
+        if excess <= 0:
+            return 0
+
+        stale_ids = [
+            entry_id for (entry_id,) in db.query(CacheEntry.id)
+            .order_by(CacheEntry.last_used_at.asc())
+            .limit(excess)
+        ]
+        db.query(CacheEntry).filter(CacheEntry.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self.evictions += len(stale_ids)
+        return len(stale_ids)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and memory tier size"""
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            hits = self.memory_hits + self.db_hits
+            return {
+                'memory_entries': len(self._memory),
+                'memory_size': self.memory_size,
+                'db_max_rows': self.db_max_rows,
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions
+            }
+
+
+# Shared cache instance
+_cache = None
+
+
+def get_cv_result_cache() -> CVResultCache:
+    """Get the shared CV result cache (singleton)"""
+    global _cache
+    if _cache is None:
+        _cache = CVResultCache()
+    return _cache
@@ -0,0 +1,338 @@
+"""
+Kiln Video Analyzer for Harit Swaraj
+Summarises manufacturing batch videos from sampled keyframes.
+
+Instead of analysing every frame, the video is sampled every
+VIDEO_SAMPLE_INTERVAL_S seconds (at most VIDEO_MAX_SAMPLES frames, spread
+over the whole video). The video is read in one forward pass: frames up to
+VIDEO_SEEK_MIN_GAP_S apart are reached with grab() (demux and decode, no
+colour conversion) and only the sampled ones are retrieved; longer gaps are
+skipped with a seek. Each sample is downscaled and analysed on its own, so
+memory use does not depend on the video length.
+
+Per sampled frame:
+- quality (blur, brightness) and biochar detection from cv_analyzer
+- flame ratio: bright, saturated red/orange/yellow pixels
+- smoke ratio: unsaturated grey/white pixels
+
+Consecutive samples with the same dominant phase ('flame', 'smoke', 'char',
+'other') are merged into a phase timeline for the batch summary.
+
+The result also carries a fingerprint (a dHash per frame at a fixed
+interval over the start of the video) used by cv/video_index.py to detect
+videos reused across batches.
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from .cv_analyzer import check_quality, detect_biochar
+
+VIDEO_SAMPLE_INTERVAL_S = float(os.getenv("VIDEO_SAMPLE_INTERVAL_S", "2.0"))
+VIDEO_MAX_SAMPLES = int(os.getenv("VIDEO_MAX_SAMPLES", "60"))
+
+# Fingerprint: one frame hash every VIDEO_FINGERPRINT_INTERVAL_S seconds over
+# the first VIDEO_MAX_FINGERPRINT_FRAMES frames (5 minutes by default). A clip
+# trimmed at any point is then within half an interval of the original's
+# fingerprint frames, but the interval is below VIDEO_SEEK_MIN_GAP_S, so that
+# stretch is walked frame by frame. The cap bounds it: about
+# frames x interval x fps grab() calls (9,000 at 30 fps) whatever the length,
+# after which only the keyframe samples are decoded. The trade-off: a reused
+# video is only caught if the two fingerprinted stretches overlap, i.e. a
+# copy trimmed more than 5 minutes into the original (or padded with more
+# than 5 minutes of new footage) is not matched.
+VIDEO_FINGERPRINT_INTERVAL_S = float(os.getenv("VIDEO_FINGERPRINT_INTERVAL_S", "1.0"))
+VIDEO_MAX_FINGERPRINT_FRAMES = int(os.getenv("VIDEO_MAX_FINGERPRINT_FRAMES", "300"))
+
+# Frames this flat (grey-level std) carry no fingerprint (black/blank frames
+# would match every other video)
+FINGERPRINT_MIN_CONTRAST = 4.0
+
+# A seek decodes from the previous keyframe (up to a GOP, typically 2-10 s),
+# so shorter gaps are cheaper to walk through with grab()
+VIDEO_SEEK_MIN_GAP_S = 5.0
+
+# Sampled frames are downscaled so the longer side is at most this many pixels
+VIDEO_ANALYSIS_MAX_SIDE = 640
+
+# HSV thresholds (OpenCV ranges: H 0-180, S and V 0-255)
+FLAME_LOWER = np.array([0, 100, 180])
+FLAME_UPPER = np.array([35, 255, 255])
+SMOKE_LOWER = np.array([0, 0, 90])
+SMOKE_UPPER = np.array([180, 40, 230])
+
+# Share of pixels needed to call a frame's phase
+FLAME_PHASE_RATIO = 0.05
+SMOKE_PHASE_RATIO = 0.30
+CHAR_PHASE_RATIO = 0.15
+
+
+def _blur_reduce_factor(scale: float) -> int:
+    """Map a downscale factor to the nearest calibrated blur normalizer"""
+    if scale < 1.5:
+        return 1
+    if scale < 3:
+        return 2
+    return 4
+
+
+def analyze_frame(frame: np.ndarray) -> Dict:
+    """
+    Colour and quality statistics for a single (downscaled) BGR frame
+
+    Returns:
+        Dictionary with blur_score, brightness, dark_pixel_ratio,
+        flame_ratio, smoke_ratio and phase
+    """
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    total_pixels = frame.shape[0] * frame.shape[1]
+    flame_ratio = cv2.countNonZero(cv2.inRange(hsv, FLAME_LOWER, FLAME_UPPER)) / total_pixels
+    smoke_ratio = cv2.countNonZero(cv2.inRange(hsv, SMOKE_LOWER, SMOKE_UPPER)) / total_pixels
+
+    biochar = detect_biochar(None, image=frame)
+
+    if flame_ratio >= FLAME_PHASE_RATIO:
+        phase = 'flame'
+    elif smoke_ratio >= SMOKE_PHASE_RATIO:
+        phase = 'smoke'
+    elif biochar['dark_pixel_ratio'] >= CHAR_PHASE_RATIO:
+        phase = 'char'
+    else:
+        phase = 'other'
+
+    return {
+        'dark_pixel_ratio': biochar['dark_pixel_ratio'],
+        'biochar_confidence': biochar['biochar_confidence'],
+        'flame_ratio': flame_ratio,
+        'smoke_ratio': smoke_ratio,
+        'phase': phase
+    }
+
+
+def frame_hash(frame: np.ndarray) -> Optional[str]:
+    """
+    64-bit difference hash (dHash) of a BGR frame as 16 hex digits,
+    or None for near-uniform frames
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    if float(small.std()) < FINGERPRINT_MIN_CONTRAST:
+        return None
+
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f"{value:016x}"
+
+
+def _read_frames(capture, frame_indices: List[int], seek_min_gap: int):
+    """
+    Yield (frame_index, frame) for sorted frame indices in one forward pass,
+    grabbing through short gaps and seeking over long ones
+    """
+    position = 0
+    for frame_index in frame_indices:
+        if frame_index - position > seek_min_gap:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            position = frame_index
+        while position < frame_index:
+            if not capture.grab():
+                return
+            position += 1
+
+        if not capture.grab():
+            return
+        position += 1
+        ok, frame = capture.retrieve()
+        if not ok:
+            return
+        yield frame_index, frame
+
+
+def _merge_phases(samples: List[Dict], interval_s: float, duration_s: float) -> List[Dict]:
+    """Merge consecutive samples with the same phase into timeline segments"""
+    phases = []
+    for sample in samples:
+        if phases and phases[-1]['phase'] == sample['phase']:
+            phases[-1]['end_s'] = sample['time_s']
+            phases[-1]['samples'] += 1
+        else:
+            phases.append({
+                'phase': sample['phase'],
+                'start_s': sample['time_s'],
+                'end_s': sample['time_s'],
+                'samples': 1
+            })
+
+    # Each sample stands for one interval of video
+    for segment in phases:
+        segment['end_s'] = round(min(segment['end_s'] + interval_s, duration_s), 2)
+        segment['start_s'] = round(segment['start_s'], 2)
+    return phases
+
+
+def analyze_video(video_path: str, interval_s: float = VIDEO_SAMPLE_INTERVAL_S,
+                  max_samples: int = VIDEO_MAX_SAMPLES) -> Dict:
+    """
+    Keyframe-sampled kiln video analysis
+
+    Args:
+        video_path: Path to video file
+        interval_s: Seconds between sampled frames
+        max_samples: Upper bound on sampled frames (interval grows for long videos)
+
+    Returns:
+        Compact per-batch summary (duration, quality, flame/smoke/char phases)
+    """
+    result = {
+        'duration_s': 0.0,
+        'fps': 0.0,
+        'frame_count': 0,
+        'resolution': [0, 0],
+        'frames_sampled': 0,
+        'sample_interval_s': 0.0,
+        'blur_score': 0.0,
+        'brightness': 0.0,
+        'blurry_frame_ratio': 0.0,
+        'flame_detected': False,
+        'flame_duration_s': 0.0,
+        'max_flame_ratio': 0.0,
+        'smoke_detected': False,
+        'smoke_duration_s': 0.0,
+        'max_smoke_ratio': 0.0,
+        'biochar_detected': False,
+        'biochar_confidence': 0.0,
+        'quality_score': 0.0,
+        'phases': [],
+        'fingerprint': {'interval_s': 0.0, 'hashes': []},
+        'reused_video': False,
+        'video_matches': [],
+        'warnings': [],
+        'analysis_timestamp': datetime.utcnow().isoformat()
+    }
+
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            result['warnings'].append('Could not open video')
+            return result
+
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
+        if fps <= 0 or frame_count <= 0:
+            result['warnings'].append('Could not read video length')
+            return result
+
+        duration_s = frame_count / fps
+        interval_s = max(interval_s, duration_s / max_samples)
+        step = max(1, int(round(interval_s * fps)))
+        scale = max(width, height) / VIDEO_ANALYSIS_MAX_SIDE if max(width, height) > VIDEO_ANALYSIS_MAX_SIDE else 1.0
+        reduce_factor = _blur_reduce_factor(scale)
+
+        result.update({
+            'duration_s': round(duration_s, 2),
+            'fps': round(fps, 2),
+            'frame_count': frame_count,
+            'resolution': [width, height],
+            'sample_interval_s': round(step / fps, 2)
+        })
+
+        # Fingerprint frames use a fixed interval, so the same footage lines up
+        # across videos of different lengths; analysis frames may be sparser
+        fingerprint_step = max(1, int(round(VIDEO_FINGERPRINT_INTERVAL_S * fps)))
+        fingerprint_frames = set(range(0, frame_count, fingerprint_step)[:VIDEO_MAX_FINGERPRINT_FRAMES])
+        analysis_frames = set(range(0, frame_count, step))
+        fingerprint = {}
+
+        samples = []
+        blur_total = brightness_total = 0.0
+        blurry = 0
+        seek_min_gap = int(VIDEO_SEEK_MIN_GAP_S * fps)
+        for frame_index, frame in _read_frames(capture, sorted(fingerprint_frames | analysis_frames),
+                                               seek_min_gap):
+            if frame_index in fingerprint_frames:
+                fingerprint[frame_index // fingerprint_step] = frame_hash(frame)
+            if frame_index not in analysis_frames:
+                continue
+
+            if scale > 1.0:
+                frame = cv2.resize(frame, (int(width / scale), int(height / scale)),
+                                   interpolation=cv2.INTER_AREA)
+
+            quality = check_quality(None, image=frame, file_size=0,
+                                    reduce_factor=reduce_factor, full_size=(width, height))
+            stats = analyze_frame(frame)
+            blur_total += quality['blur_score']
+            brightness_total += quality['brightness']
+            if quality['blur_score'] < 0.3:
+                blurry += 1
+
+            result['max_flame_ratio'] = max(result['max_flame_ratio'], stats['flame_ratio'])
+            result['max_smoke_ratio'] = max(result['max_smoke_ratio'], stats['smoke_ratio'])
+            samples.append({
+                'time_s': frame_index / fps,
+                'phase': stats['phase'],
+                'biochar_confidence': stats['biochar_confidence']
+            })
+
+        result['fingerprint'] = {
+            'interval_s': round(fingerprint_step / fps, 3),
+            'hashes': [fingerprint.get(i) for i in range(max(fingerprint, default=-1) + 1)]
+        }
+
+        if not samples:
+            result['warnings'].append('Could not decode any frames')
+            return result
+
+        count = len(samples)
+        sample_interval_s = step / fps
+        phases = _merge_phases(samples, sample_interval_s, duration_s)
+        flame_duration = sum(p['end_s'] - p['start_s'] for p in phases if p['phase'] == 'flame')
+        smoke_duration = sum(p['end_s'] - p['start_s'] for p in phases if p['phase'] == 'smoke')
+
+        # Biochar is judged on the last quarter of the video, after the burn
+        tail = samples[-max(1, count // 4):]
+        biochar_confidence = max(s['biochar_confidence'] for s in tail)
+
+        result.update({
+            'frames_sampled': count,
+            'blur_score': blur_total / count,
+            'brightness': brightness_total / count,
+            'blurry_frame_ratio': blurry / count,
+            'flame_detected': flame_duration > 0,
+            'flame_duration_s': round(flame_duration, 2),
+            'smoke_detected': smoke_duration > 0,
+            'smoke_duration_s': round(smoke_duration, 2),
+            'biochar_detected': biochar_confidence > 0,
+            'biochar_confidence': biochar_confidence,
+            'phases': phases
+        })
+
+        if not result['flame_detected']:
+            result['warnings'].append('No flame phase detected')
+        if result['blurry_frame_ratio'] > 0.5:
+            result['warnings'].append('Most sampled frames are blurry')
+        if not result['biochar_detected']:
+            result['warnings'].append('No biochar visible at the end of the video')
+
+        # Weighted: sharpness, flame seen, biochar at the end
+        result['quality_score'] = (
+            result['blur_score'] * 0.4
+            + (0.3 if result['flame_detected'] else 0.0)
+            + min(biochar_confidence, 1.0) * 0.3
+        )
+
+    except Exception as e:
+        print(f"⚠️ Video analysis error: {e}")
+        result['warnings'].append(f'Analysis failed: {str(e)}')
+
+    finally:
+        capture.release()
+
+    return result
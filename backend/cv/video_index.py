@@ -0,0 +1,288 @@
+"""
+Video Fingerprint Index for Harit Swaraj
+Detects kiln videos reused across manufacturing batches.
+
+A video's fingerprint is the sequence of 64-bit frame hashes produced by
+analyze_video (one hash every VIDEO_FINGERPRINT_INTERVAL_S seconds). Every
+frame hash of every batch video is stored in one multi-index hash table, so
+looking up a frame is sub-linear in the size of the archive.
+
+Matching a new video:
+1. At most VIDEO_QUERY_PROBE_FRAMES of its frame hashes, spread over the
+   video, are looked up within VIDEO_FRAME_PROBE_RADIUS bits
+2. Every hit votes for (other video, frame offset); re-uploads and trimmed
+   clips of the same footage line up at one offset (+/- 1), while
+   look-alike frames from other burns scatter over many offsets
+3. The VIDEO_VERIFY_OFFSETS best-voted offsets of each candidate video are
+   verified outside the index lock: every frame of the new video is compared
+   with the aligned frames of the candidate within VIDEO_FRAME_HASH_RADIUS
+4. A video matches when its best offset collects at least
+   VIDEO_MATCH_MIN_FRAMES frames covering VIDEO_MATCH_MIN_COVERAGE of the
+   shorter fingerprint
+
+Fingerprints are stored in the video_fingerprints table; each worker
+process builds its in-memory index from that table on first use and, like
+the photo hash index, polls it for rows above the highest id seen at most
+every PHOTO_HASH_INDEX_POLL_S seconds, so fingerprints stored by other
+workers or backfill_photo_analysis.py are matched too. When the row count
+no longer matches (rows deleted by gc_uploads.py) the index is rebuilt;
+until then deleted videos are dropped when they show up in a match (see
+cv.worker.store_video_result).
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .hash_index import HASH_INDEX_POLL_S, MultiIndexHashTable, hamming_distance, hash_to_int
+
+# Same footage sampled half an interval apart differs by 2-13 bits on the
+# synthetic pan benchmark; frames of unrelated videos by 16 or more
+VIDEO_FRAME_HASH_RADIUS = 10
+# Index lookups only have to find a few frames per offset: radius 7 is one
+# bit per 16-bit band (68 band probes per hash instead of 548 at radius 10)
+VIDEO_FRAME_PROBE_RADIUS = 7
+VIDEO_QUERY_PROBE_FRAMES = 120
+VIDEO_VERIFY_OFFSETS = 3
+VIDEO_MATCH_MIN_FRAMES = 5
+VIDEO_MATCH_MIN_COVERAGE = 0.6
+
+
+def _informative(hashes: List[Optional[str]]) -> int:
+    return sum(1 for h in hashes if h)
+
+
+def _aligned_matches(query: List[Optional[int]], other: List[Optional[int]], offset: int,
+                     radius: int) -> int:
+    """Query frames within radius of the other video's frame at offset (+/- 1)"""
+    matched = 0
+    for position, value in enumerate(query):
+        if value is None:
+            continue
+        for other_position in (position + offset, position + offset - 1, position + offset + 1):
+            if 0 <= other_position < len(other) and other[other_position] is not None \
+                    and hamming_distance(value, other[other_position]) <= radius:
+                matched += 1
+                break
+    return matched
+
+
+class VideoFingerprintIndex:
+    """Thread-safe index of frame-hash sequences for batch videos"""
+
+    def __init__(self, poll_interval_s: float = HASH_INDEX_POLL_S):
+        self.poll_interval_s = poll_interval_s
+        self._table = MultiIndexHashTable()
+        self._videos = {}  # video_path -> {'batch_id', 'frames', 'hashes' (ints or None)}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._max_id = 0
+        self._row_count = 0
+        self._last_poll = 0.0
+
+    def __len__(self) -> int:
+        return len(self._videos)
+
+    @staticmethod
+    def _insert(table: MultiIndexHashTable, videos: Dict, video_path: str, batch_id: Optional[int],
+                hashes: List[Optional[str]]):
+        if video_path in videos:
+            return
+        values = [hash_to_int(frame_hash) if frame_hash else None for frame_hash in hashes]
+        videos[video_path] = {'batch_id': batch_id, 'frames': _informative(hashes), 'hashes': values}
+        for position, value in enumerate(values):
+            if value is not None:
+                table.add(value, (video_path, position))
+
+    def load(self, rows: Iterable[Tuple[str, Optional[int], List[Optional[str]]]]):
+        """Bulk-load (video_path, batch_id, frame_hashes) rows"""
+        with self._lock:
+            for video_path, batch_id, hashes in rows:
+                self._insert(self._table, self._videos, video_path, batch_id, hashes or [])
+
+    def refresh(self, db, full: bool = False):
+        """
+        Add video_fingerprints rows inserted since the last refresh; rebuild
+        the whole index when the table's row count shows rows were deleted or
+        committed below the highest id seen
+        """
+        from sqlalchemy import func
+        from models import VideoFingerprint
+
+        columns = (VideoFingerprint.id, VideoFingerprint.video_path, VideoFingerprint.batch_id,
+                   VideoFingerprint.frame_hashes)
+        if not full:
+            rows = db.query(*columns).filter(VideoFingerprint.id > self._max_id) \
+                .order_by(VideoFingerprint.id).all()
+            count = db.query(func.count(VideoFingerprint.id)).scalar()
+            with self._lock:
+                for row_id, video_path, batch_id, hashes in rows:
+                    self._insert(self._table, self._videos, video_path, batch_id, hashes or [])
+                    self._max_id = max(self._max_id, row_id)
+                self._row_count += len(rows)
+                if self._row_count == count:
+                    return
+
+        # Build the new index aside so queries keep running meanwhile
+        table = MultiIndexHashTable()
+        videos = {}
+        max_id = row_count = 0
+        for row_id, video_path, batch_id, hashes in db.query(*columns).yield_per(500):
+            self._insert(table, videos, video_path, batch_id, hashes or [])
+            max_id = max(max_id, row_id)
+            row_count += 1
+        with self._lock:
+            self._table, self._videos = table, videos
+            self._max_id, self._row_count = max_id, row_count
+
+    def maybe_refresh(self):
+        """Refresh from the database if poll_interval_s has passed (one thread at a time)"""
+        if time.monotonic() - self._last_poll < self.poll_interval_s:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # Another thread is refreshing
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            self._last_poll = time.monotonic()
+            self.refresh(db)
+        except Exception as e:
+            print(f"⚠️ Could not refresh video fingerprint index: {e}")
+        finally:
+            db.close()
+            self._refresh_lock.release()
+
+    def contains(self, video_path: str) -> bool:
+        return video_path in self._videos
+
+    def add(self, db, video_path: str, batch_id: Optional[int], hashes: List[Optional[str]],
+            interval_s: float, commit: bool = True):
+        """
+        Persist a video fingerprint and insert it into the in-memory index
+        A row another worker inserted for the same path first is kept.
+        """
+        from database import insert_ignore
+        from models import VideoFingerprint
+
+        if not _informative(hashes) or video_path in self._videos:
+            return
+
+        insert_ignore(db, VideoFingerprint, video_path=video_path, batch_id=batch_id,
+                      interval_s=interval_s, frame_hashes=hashes)
+        if commit:
+            db.commit()
+
+        with self._lock:
+            self._insert(self._table, self._videos, video_path, batch_id, hashes)
+
+    def discard(self, video_paths: Iterable[str]):
+        """Drop videos from the in-memory index only"""
+        with self._lock:
+            for video_path in video_paths:
+                video = self._videos.pop(video_path, None)
+                if video is None:
+                    continue
+                for position, value in enumerate(video['hashes']):
+                    if value is not None:
+                        self._table.remove(value, lambda payload: payload == (video_path, position))
+
+    def remove(self, db, video_paths: Iterable[str], commit: bool = True) -> int:
+        """Delete videos from the video_fingerprints table and the in-memory index"""
+        from models import VideoFingerprint
+
+        video_paths = list(video_paths)
+        deleted = 0
+        for offset in range(0, len(video_paths), 500):
+            chunk = video_paths[offset:offset + 500]
+            deleted += db.query(VideoFingerprint).filter(VideoFingerprint.video_path.in_(chunk)) \
+                .delete(synchronize_session=False)
+        if commit:
+            db.commit()
+
+        self.discard(video_paths)
+        with self._lock:
+            self._row_count -= deleted
+        return deleted
+
+    def query(self, hashes: List[Optional[str]], exclude_path: Optional[str] = None,
+              radius: int = VIDEO_FRAME_HASH_RADIUS,
+              probe_radius: int = VIDEO_FRAME_PROBE_RADIUS,
+              probe_frames: int = VIDEO_QUERY_PROBE_FRAMES) -> List[Dict]:
+        """
+        Find indexed videos that share footage with a fingerprint
+
+        Returns:
+            Matches (best first) with video_path, batch_id, matched_frames,
+            coverage and offset_frames (position in the indexed video minus
+            position in the queried one)
+        """
+        values = [hash_to_int(frame_hash) if frame_hash else None for frame_hash in hashes]
+        positions = [position for position, value in enumerate(values) if value is not None]
+        query_frames = len(positions)
+        if not query_frames:
+            return []
+        if query_frames > probe_frames:
+            positions = [positions[i * query_frames // probe_frames] for i in range(probe_frames)]
+
+        votes = defaultdict(lambda: defaultdict(int))  # video_path -> offset -> probe hits
+        with self._lock:
+            for position in positions:
+                for _, _, payloads in self._table.query(values[position], probe_radius):
+                    for video_path, other_position in payloads:
+                        if video_path != exclude_path:
+                            votes[video_path][other_position - position] += 1
+            candidates = {video_path: self._videos[video_path] for video_path in votes}
+
+        # Neighbouring offsets are pooled: a clip trimmed between fingerprint
+        # frames can match the original one position early or late
+        matches = []
+        for video_path, offsets in votes.items():
+            pooled = sorted(offsets, reverse=True, key=lambda offset: (
+                offsets[offset] + offsets.get(offset - 1, 0) + offsets.get(offset + 1, 0)))
+            video = candidates[video_path]
+            matched, offset = max((_aligned_matches(values, video['hashes'], offset, radius), offset)
+                                  for offset in pooled[:VIDEO_VERIFY_OFFSETS])
+
+            shorter = min(query_frames, video['frames'])
+            coverage = matched / shorter if shorter else 0.0
+            if matched >= VIDEO_MATCH_MIN_FRAMES and coverage >= VIDEO_MATCH_MIN_COVERAGE:
+                matches.append({
+                    'video_path': video_path,
+                    'batch_id': video['batch_id'],
+                    'matched_frames': matched,
+                    'coverage': round(min(coverage, 1.0), 4),
+                    'offset_frames': offset
+                })
+
+        matches.sort(key=lambda m: (m['coverage'], m['matched_frames']), reverse=True)
+        return matches
+
+
+# Singleton index, loaded from the database on first use
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_video_fingerprint_index() -> VideoFingerprintIndex:
+    """Get the video fingerprint index (singleton), loading it from the database"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from database import SessionLocal
+
+                index = VideoFingerprintIndex()
+                db = SessionLocal()
+                try:
+                    index.refresh(db, full=True)
+                    index._last_poll = time.monotonic()
+                    print(f"[OK] Video fingerprint index loaded ({len(index)} videos)")
+                except Exception as e:
+                    print(f"⚠️ Could not load video fingerprint index: {e}")
+                finally:
+                    db.close()
+                _index = index
+            return _index
+    _index.maybe_refresh()
+    return _index
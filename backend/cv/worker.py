@@ -0,0 +1,489 @@
+"""
+Background CV Worker Pool for Harit Swaraj
+Runs analyze_photo for uploaded photos (and analyze_video for batch videos)
+in a process pool, off the request path, and writes the results back to
+per-photo / per-video analysis records.
+
+- A single shared ProcessPoolExecutor (CV_WORKERS processes) does the CPU work
+- An asyncio semaphore bounds how many photos are in the pool at once
+- Scheduled photos not yet running in the pool are counted as the queue,
+  from the moment they are submitted; when the queue is full new photos are
+  rejected (they can be analysed later by the backfill tool)
+- Photos whose bytes were analysed before are served from the content-hash
+  result cache instead of the pool
+- Results are stored in photo_analyses (and PlotPhoto for plot photos), and
+  the perceptual hash is added to the shared duplicate index
+- WebP thumbnails/medium copies of saved photos are generated in the same
+  pool (see cv/derivatives.py)
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from metrics import LatencyHistogram
+
+CV_WORKERS = int(os.getenv("CV_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+CV_MAX_QUEUE = int(os.getenv("CV_MAX_QUEUE", "500"))
+
+# Photo analysis takes tens to hundreds of milliseconds, video sampling seconds
+CV_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _init_worker():
+    """Keep each worker process single-threaded; the pool provides the parallelism"""
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _analyze_file(file_path: str) -> Dict:
+    """Runs in a worker process"""
+    from cv.cv_analyzer import analyze_photo
+    return analyze_photo(file_path)
+
+
+def _analyze_video_file(file_path: str) -> Dict:
+    """Runs in a worker process"""
+    from cv.video_analyzer import analyze_video
+    return analyze_video(file_path)
+
+
+def _derive_file(file_path: str, targets: List[Tuple[str, int]]) -> Dict:
+    """Runs in a worker process"""
+    from cv.derivatives import generate_derivatives
+    return generate_derivatives(file_path, targets)
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _analysis_fields(source: str, record_id: Optional[int], result: Dict) -> Dict:
+    coordinates = result.get('gps_coordinates') or [None, None]
+    return {
+        'source': source,
+        'record_id': record_id,
+        'quality_score': result.get('quality_score'),
+        'has_gps': 1 if result.get('has_gps') else 0,
+        'gps_latitude': coordinates[0],
+        'gps_longitude': coordinates[1],
+        'photo_timestamp': _parse_timestamp(result.get('timestamp')),
+        'perceptual_hash': result.get('perceptual_hash') or None,
+        'biochar_detected': bool(result.get('biochar_detected')),
+        'biochar_confidence': result.get('biochar_confidence'),
+        'is_duplicate': bool(result.get('is_duplicate')),
+        'cv_analysis': result
+    }
+
+
+def save_photo_analyses(db, records: List[Tuple[str, str, Optional[int], Dict]]):
+    """
+    Bulk upsert analysis records and copy the CV fields onto PlotPhoto for
+    plot photos. Existing rows are fetched with one query per table.
+    The caller commits.
+
+    Args:
+        records: (relative_path, source, record_id, result) tuples
+    """
+    from models import PhotoAnalysis, PlotPhoto
+
+    if not records:
+        return []
+
+    paths = [record[0] for record in records]
+    existing = {
+        analysis.photo_path: analysis
+        for analysis in db.query(PhotoAnalysis).filter(PhotoAnalysis.photo_path.in_(paths))
+    }
+    plot_paths = [record[0] for record in records if record[1] == 'plot']
+    plot_photos = {}
+    if plot_paths:
+        plot_photos = {
+            plot_photo.photo_path: plot_photo
+            for plot_photo in db.query(PlotPhoto).filter(PlotPhoto.photo_path.in_(plot_paths))
+        }
+
+    analyses = []
+    for relative_path, source, record_id, result in records:
+        fields = _analysis_fields(source, record_id, result)
+
+        analysis = existing.get(relative_path)
+        if analysis is None:
+            analysis = PhotoAnalysis(photo_path=relative_path)
+            db.add(analysis)
+            existing[relative_path] = analysis
+        for key, value in fields.items():
+            setattr(analysis, key, value)
+        analyses.append(analysis)
+
+        plot_photo = plot_photos.get(relative_path)
+        if plot_photo:
+            plot_photo.cv_analysis = result
+            plot_photo.quality_score = fields['quality_score']
+            plot_photo.has_gps = fields['has_gps']
+            plot_photo.gps_latitude = fields['gps_latitude']
+            plot_photo.gps_longitude = fields['gps_longitude']
+            plot_photo.photo_timestamp = fields['photo_timestamp']
+            plot_photo.perceptual_hash = fields['perceptual_hash']
+
+    return analyses
+
+
+def save_photo_analysis(db, relative_path: str, source: str, record_id: Optional[int],
+                        result: Dict):
+    """Upsert the analysis record for a single photo. The caller commits."""
+    return save_photo_analyses(db, [(relative_path, source, record_id, result)])[0]
+
+
+def save_video_analysis(db, relative_path: str, batch_id: Optional[int], result: Dict):
+    """Upsert the analysis summary for a batch video. The caller commits."""
+    from models import VideoAnalysis
+
+    analysis = db.query(VideoAnalysis).filter(VideoAnalysis.video_path == relative_path).first()
+    if analysis is None:
+        analysis = VideoAnalysis(video_path=relative_path)
+        db.add(analysis)
+
+    analysis.batch_id = batch_id
+    analysis.duration_s = result.get('duration_s')
+    analysis.frames_sampled = result.get('frames_sampled')
+    analysis.quality_score = result.get('quality_score')
+    analysis.flame_detected = bool(result.get('flame_detected'))
+    analysis.smoke_detected = bool(result.get('smoke_detected'))
+    analysis.biochar_detected = bool(result.get('biochar_detected'))
+    analysis.summary = result
+    return analysis
+
+
+def store_video_result(db, relative_path: str, batch_id: Optional[int], result: Dict):
+    """
+    Match the video's fingerprint against every earlier batch video, flag the
+    batch if the footage was already used, then save the summary and add the
+    fingerprint to the index. Commits.
+    """
+    from models import ManufacturingBatch, VideoFingerprint
+    from cv.video_index import get_video_fingerprint_index
+
+    index = get_video_fingerprint_index()
+    fingerprint = result.pop('fingerprint', None) or {}
+    hashes = fingerprint.get('hashes') or []
+
+    matches = [
+        match for match in index.query(hashes, exclude_path=relative_path)
+        if match['batch_id'] != batch_id
+    ]
+    if matches:
+        # Fingerprints collected by gc_uploads.py since this worker loaded them
+        matched_paths = [match['video_path'] for match in matches]
+        stored = {path for (path,) in db.query(VideoFingerprint.video_path)
+                  .filter(VideoFingerprint.video_path.in_(matched_paths))}
+        index.discard(set(matched_paths) - stored)
+        matches = [match for match in matches if match['video_path'] in stored]
+    if matches:
+        result['reused_video'] = True
+        result['video_matches'] = matches[:5]
+        result['warnings'].append(
+            f"Video footage matches batch {matches[0]['batch_id']} "
+            f"({matches[0]['coverage']:.0%} of frames)"
+        )
+        batch = db.query(ManufacturingBatch).filter(ManufacturingBatch.id == batch_id).first()
+        if batch and batch.status != 'flagged':
+            batch.status = 'flagged'
+            print(f"⚠️ Batch {batch.batch_id} flagged: video reused from batch id {matches[0]['batch_id']}")
+
+    save_video_analysis(db, relative_path, batch_id, result)
+    db.commit()
+    index.add(db, relative_path, batch_id, hashes, fingerprint.get('interval_s'))
+
+
+class CVExecutor:
+    """
+    Shared process pool for photo analysis with bounded concurrency and metrics.
+
+    Args:
+        max_workers: Number of worker processes
+        max_queue: Maximum photos waiting for a pool slot before new ones are rejected
+    """
+
+    def __init__(self, max_workers: int = CV_WORKERS, max_queue: int = CV_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.latency = LatencyHistogram(CV_LATENCY_BUCKETS_MS)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.running = 0
+        self.derivatives_completed = 0
+        self.derivatives_failed = 0
+        self._pool = None
+        self._semaphore = None
+        self._tasks = set()
+        # Duplicate check and index insert must not interleave between photos
+        self._store_lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that is running the event loop and DB threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._pool
+
+    async def run(self, fn, *args):
+        """Run a picklable function in the pool, respecting the concurrency bound"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers * 2)
+
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+
+        self.running += 1
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self.latency.observe((time.perf_counter() - start) * 1000)
+            self.running -= 1
+            self._semaphore.release()
+
+    @property
+    def queue_length(self) -> int:
+        """Scheduled tasks that are not running in the pool"""
+        return max(0, len(self._tasks) - self.running)
+
+    def _spawn(self, coro) -> bool:
+        """Start a background task unless the queue is full"""
+        # Counted from submission: a burst of submit_* calls fills the queue
+        # before any of its tasks has run
+        if self.queue_length >= self.max_queue:
+            self.rejected += 1
+            coro.close()
+            return False
+
+        self.submitted += 1
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def submit_photo(self, relative_path: str, source: str, record_id: Optional[int] = None) -> bool:
+        """
+        Schedule analysis of a saved photo without waiting for it
+
+        Args:
+            relative_path: Path relative to the upload directory (e.g. "photos/x.jpg")
+            source: Kind of record the photo belongs to ('plot', 'harvest', ...)
+            record_id: Primary key of that record
+
+        Returns:
+            False if the photo was rejected because the queue is full
+        """
+        return self._spawn(self._process_photo(relative_path, source, record_id))
+
+    async def _process_photo(self, relative_path: str, source: str, record_id: Optional[int]):
+        from file_storage import get_file_path, file_sha256
+
+        loop = asyncio.get_running_loop()
+        try:
+            # Database / storage lookup (and S3 download): not on the event loop
+            file_path = await loop.run_in_executor(None, get_file_path, relative_path)
+            if not file_path:
+                raise FileNotFoundError(relative_path)
+
+            # save_photo hashes while writing; other callers pass a plain path
+            sha256 = getattr(relative_path, 'sha256', None)
+            if not sha256:
+                sha256 = await loop.run_in_executor(None, file_sha256, file_path)
+
+            result = await loop.run_in_executor(None, self._cached_result, sha256)
+            if result is None:
+                result = await self.run(_analyze_file, file_path)
+
+            await loop.run_in_executor(
+                None, self._store_result, str(relative_path), source, record_id, result, sha256
+            )
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Background CV analysis failed for {relative_path}: {e}")
+
+    def submit_video(self, relative_path: str, batch_id: Optional[int] = None) -> bool:
+        """
+        Schedule keyframe analysis of a saved batch video without waiting for it
+
+        Returns:
+            False if the video was rejected because the queue is full
+        """
+        return self._spawn(self._process_video(relative_path, batch_id))
+
+    async def _process_video(self, relative_path: str, batch_id: Optional[int]):
+        from file_storage import get_file_path
+
+        loop = asyncio.get_running_loop()
+        try:
+            file_path = await loop.run_in_executor(None, get_file_path, relative_path)
+            if not file_path:
+                raise FileNotFoundError(relative_path)
+
+            result = await self.run(_analyze_video_file, file_path)
+            await loop.run_in_executor(
+                None, self._store_video_result, str(relative_path), batch_id, result
+            )
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"⚠️ Background video analysis failed for {relative_path}: {e}")
+
+    def submit_derivatives(self, relative_path: str) -> bool:
+        """
+        Schedule WebP derivative generation for a saved photo without waiting for it
+
+        Returns:
+            False if the photo was rejected because the queue is full
+        """
+        return self._spawn(self._process_derivatives(relative_path))
+
+    async def _process_derivatives(self, relative_path: str):
+        from file_storage import (PHOTO_DERIVATIVE_SIZES, get_file_path, upload_temp_path,
+                                  store_photo_derivatives)
+
+        try:
+            file_path = await asyncio.get_running_loop().run_in_executor(None, get_file_path, relative_path)
+            if not file_path:
+                raise FileNotFoundError(relative_path)
+
+            # Written to temporary files, then stored like any other upload
+            files = {size: upload_temp_path('.webp') for size in PHOTO_DERIVATIVE_SIZES}
+            targets = [(files[size], max_side) for size, max_side in PHOTO_DERIVATIVE_SIZES.items()]
+            result = await self.run(_derive_file, file_path, targets)
+            await store_photo_derivatives(relative_path, files)
+            if result.get('error'):
+                raise RuntimeError(result['error'])
+            self.derivatives_completed += 1
+        except Exception as e:
+            self.derivatives_failed += 1
+            print(f"⚠️ Photo derivatives failed for {relative_path}: {e}")
+
+    def _store_video_result(self, relative_path: str, batch_id: Optional[int], result: Dict):
+        """Check the fingerprint index and write the summary back (runs in a thread)"""
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            with self._store_lock:
+                store_video_result(db, relative_path, batch_id, result)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _cached_result(self, sha256: str) -> Optional[Dict]:
+        """Look up an earlier analysis of the same bytes (runs in a thread)"""
+        from database import SessionLocal
+        from cv.result_cache import get_cv_result_cache
+
+        db = SessionLocal()
+        try:
+            return get_cv_result_cache().get(db, sha256)
+        finally:
+            db.close()
+
+    def _store_result(self, relative_path: str, source: str, record_id: Optional[int],
+                      result: Dict, sha256: Optional[str] = None):
+        """Check the duplicate index and write the analysis back (runs in a thread)"""
+        from database import SessionLocal
+        from cv.cv_analyzer import mark_duplicate
+        from cv.hash_index import get_photo_hash_index
+        from cv.result_cache import get_cv_result_cache
+
+        index = get_photo_hash_index()
+        image_hash = result.get('perceptual_hash')
+
+        db = SessionLocal()
+        try:
+            if sha256:
+                get_cv_result_cache().put(db, sha256, result)
+                result['sha256'] = sha256
+
+            with self._store_lock:
+                if image_hash:
+                    duplicates = index.query(image_hash, exclude_path=relative_path)
+                    if duplicates:
+                        mark_duplicate(result, duplicates[0]['similarity'])
+                        result['duplicates'] = duplicates[:5]
+
+                save_photo_analysis(db, relative_path, source, record_id, result)
+                db.commit()
+                if image_hash:
+                    index.add(db, relative_path, image_hash, source, record_id)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def metrics(self) -> Dict:
+        """Queue length, throughput counters, latency histogram and cache hit/miss counters"""
+        from cv.result_cache import get_cv_result_cache
+
+        return {
+            'workers': self.max_workers,
+            'queue_length': self.queue_length,
+            'max_queue': self.max_queue,
+            'running': self.running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'derivatives': {
+                'completed': self.derivatives_completed,
+                'failed': self.derivatives_failed
+            },
+            'latency': self.latency.snapshot(),
+            'cache': get_cv_result_cache().stats()
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Shared executor instance
+_executor = None
+
+
+def get_cv_executor() -> CVExecutor:
+    """Get the shared CV executor (singleton)"""
+    global _executor
+    if _executor is None:
+        _executor = CVExecutor()
+    return _executor
+
+
+def schedule_photo_analysis(relative_path: Optional[str], source: str,
+                            record_id: Optional[int] = None) -> bool:
+    """Queue background analysis for a saved photo (no-op for empty paths)"""
+    if not relative_path:
+        return False
+    return get_cv_executor().submit_photo(relative_path, source, record_id)
+
+
+def schedule_video_analysis(relative_path: Optional[str], batch_id: Optional[int] = None) -> bool:
+    """Queue background keyframe analysis for a saved batch video (no-op for empty paths)"""
+    if not relative_path:
+        return False
+    return get_cv_executor().submit_video(relative_path, batch_id)
@@ -48,6 +48,29 @@ def get_db():
     finally:
         db.close()
 
+def insert_ignore(db, model, **values) -> bool:
+    """
+    INSERT a row unless it conflicts with a unique key (another request or
+    worker inserted it first). Runs in the session's transaction.
+    Returns True if the row was inserted.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.exc import IntegrityError
+        try:
+            with db.begin_nested():
+                db.add(model(**values))
+            return True
+        except IntegrityError:
+            return False
+
+    result = db.execute(insert(model).values(**values).on_conflict_do_nothing())
+    return result.rowcount > 0
+
 def init_db():
     """
     Initialize database - create all tables with retries
@@ -55,7 +78,10 @@ def init_db():
     import time
     from models import (User, Plot, PlotPhoto, BiomassHarvest, Transport, 
                         BiomassPreprocessing, ManufacturingBatch, Distribution, 
-                        UnburnableProcess, BiocharApplication, Audit)
+                        UnburnableProcess, BiocharApplication, Audit, PhotoHash,
+                        PhotoAnalysis, CVResultCache, VideoAnalysis,
+                        VideoFingerprint, StoredBlob, StoredBlobOwner, StoredFile,
+                        ResumableUpload, TokenRevocation, UserTokenVersion, RateLimitBucket)
     
     max_retries = 5
     for i in range(max_retries):
@@ -1,12 +1,48 @@
 """
 File storage utilities for Harit Swaraj
 Handles saving and retrieving uploaded files (images, videos, KML)
+
+Uploads are stored content-addressed: the bytes live once as blob
+"blobs/ab/cd/<sha256>" in the storage backend (local uploads/ directory or
+S3, see storage.py), and every upload keeps its own path (e.g.
+"photos/3f/9a/harvest_B1_1_ab12cd34.jpg") in the stored_files table,
+pointing at its blob. stored_blobs counts the uploads per blob, so uploading
+the same photo or video again only adds a stored_files row. Files written
+before the content-addressed store (and photo derivatives) are plain files
+under photos/, videos/ and kml/ and still resolve through get_file_path.
+
+Paths and blob keys fan out over two levels of hashed subdirectories so no
+directory holds millions of entries. Uploads from the older flat layout
+("photos/x.jpg", "blobs/<sha256>") keep resolving while UPLOAD_LAYOUT_SHIM
+is on; migrate_upload_layout.py moves them over.
+
+Clients can skip sending content the server already has: after checking
+the SHA-256 with POST /uploads/precheck, a multipart file part with content
+type BLOB_REF_CONTENT_TYPE and body {"sha256": ..., "size": ...} links the
+existing blob to the new upload path instead of transferring it. Only
+content the same user uploaded before (stored_blob_owners) is reported by
+the pre-check or can be referenced, so hashes cannot be used to probe for
+or link other users' files.
 """
+import hashlib
+import json
+import mimetypes
 import os
+import re
 import uuid
 from pathlib import Path
-from fastapi import UploadFile
-from typing import Optional
+import aiofiles
+from fastapi import UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional, Set, Tuple
+
+from storage import get_storage
+
+try:
+    from cv.cv_analyzer import extract_exif_header
+except ImportError:
+    extract_exif_header = None
 
 # Base upload directory
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
@@ -15,11 +51,68 @@ UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'uploads')
 PHOTOS_DIR = os.path.join(UPLOAD_DIR, 'photos')
 VIDEOS_DIR = os.path.join(UPLOAD_DIR, 'videos')
 KML_DIR = os.path.join(UPLOAD_DIR, 'kml')
+BLOBS_DIR = os.path.join(UPLOAD_DIR, 'blobs')
+
+# Resumable uploads in progress: outside UPLOAD_DIR, which is served to clients.
+# With local storage keep it on the same filesystem as UPLOAD_DIR (finalize moves the file)
+PARTIAL_DIR = os.getenv("RESUMABLE_UPLOAD_DIR") or os.path.join(
+    os.path.dirname(__file__), 'data', 'resumable_uploads'
+)
+
+# Also resolve upload paths and blobs in the flat layout (until
+# migrate_upload_layout.py has moved everything)
+UPLOAD_LAYOUT_SHIM = os.getenv("UPLOAD_LAYOUT_SHIM", "true").lower() == "true"
+
+# Upload folders that use the sharded layout
+UPLOAD_FOLDERS = ('photos', 'videos', 'kml')
+
+# Reject field photos without GPS coordinates in their EXIF header
+REQUIRE_PHOTO_GPS = os.getenv("REQUIRE_PHOTO_GPS", "false").lower() == "true"
+
+# Uploads are streamed to disk (and hashed) in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Multipart file parts of this type reference already stored content by hash
+BLOB_REF_CONTENT_TYPE = "application/vnd.harit-swaraj.blob-ref+json"
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+# Size limits: photos and KML files / kiln videos
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "50"))
+MAX_VIDEO_UPLOAD_SIZE_MB = int(os.getenv("MAX_VIDEO_UPLOAD_SIZE_MB", "500"))
+
+# WebP derivatives written next to each photo: photos/<name>.<size>.webp,
+# longer side at most this many pixels
+PHOTO_DERIVATIVE_SIZES = {
+    'thumb': int(os.getenv("PHOTO_THUMB_SIZE", "256")),
+    'medium': int(os.getenv("PHOTO_MEDIUM_SIZE", "1024"))
+}
 
 # Create directories if they don't exist
-for directory in [UPLOAD_DIR, PHOTOS_DIR, VIDEOS_DIR, KML_DIR]:
+for directory in [UPLOAD_DIR, PHOTOS_DIR, VIDEOS_DIR, KML_DIR, BLOBS_DIR, PARTIAL_DIR]:
     os.makedirs(directory, exist_ok=True)
 
+class StoredPath(str):
+    """
+    Relative path of a saved upload (e.g. "photos/x.jpg") that also carries
+    the SHA-256 and size of its content, computed while the file was streamed
+    to disk.
+    Behaves as a plain string everywhere else.
+    """
+    
+    def __new__(cls, relative_path: str, sha256: Optional[str] = None, size: int = 0):
+        path = super().__new__(cls, relative_path)
+        path.sha256 = sha256
+        path.size = size
+        return path
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 of a file on disk, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def generate_unique_filename(original_filename: str, prefix: str = "") -> str:
     """
     Generate a unique filename with UUID
@@ -32,10 +125,284 @@ def generate_unique_filename(original_filename: str, prefix: str = "") -> str:
     else:
         return f"{unique_id}{ext}"
 
-async def save_photo(file: UploadFile, prefix: str, photo_index: Optional[int] = None) -> str:
+def shard_dir(filename: str) -> str:
+    """
+    Two-level fan-out directory for a file name (e.g. "3f/9a"). Only the part
+    before the first dot is hashed, so a photo's derivatives
+    (x.thumb.webp) land in the same directory as the photo (x.jpg).
+    """
+    digest = hashlib.md5(filename.split('.')[0].encode(), usedforsecurity=False).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}"
+
+def upload_path(folder: str, filename: str) -> str:
+    """Relative path of a new upload (e.g. "photos", "x.jpg" -> "photos/3f/9a/x.jpg")"""
+    return f"{folder}/{shard_dir(filename)}/{filename}"
+
+def is_flat_path(relative_path: str) -> bool:
+    """True for upload paths in the old flat layout (e.g. "photos/x.jpg")"""
+    parts = str(relative_path).split('/')
+    return len(parts) == 2 and parts[0] in UPLOAD_FOLDERS and bool(parts[1])
+
+def sharded_path(relative_path: str) -> str:
+    """Sharded equivalent of a flat-layout path; other paths are returned unchanged"""
+    if not is_flat_path(relative_path):
+        return relative_path
+    folder, filename = str(relative_path).split('/')
+    return upload_path(folder, filename)
+
+def flat_path(relative_path: str) -> str:
+    """Flat-layout equivalent of a sharded path; other paths are returned unchanged"""
+    parts = str(relative_path).split('/')
+    if len(parts) == 4 and parts[0] in UPLOAD_FOLDERS and f"{parts[1]}/{parts[2]}" == shard_dir(parts[3]):
+        return f"{parts[0]}/{parts[3]}"
+    return relative_path
+
+def layout_alternative(relative_path: str) -> Optional[str]:
+    """The same upload path in the other layout, while UPLOAD_LAYOUT_SHIM is on"""
+    if not UPLOAD_LAYOUT_SHIM:
+        return None
+    other = sharded_path(relative_path) if is_flat_path(relative_path) else flat_path(relative_path)
+    return other if other != relative_path else None
+
+def list_plain_uploads(folder: str) -> List[str]:
+    """Relative paths of the plain files under an upload folder, in both layouts"""
+    paths = []
+    for directory, _, names in os.walk(os.path.join(UPLOAD_DIR, folder)):
+        for name in names:
+            if not name.endswith('.tmp'):
+                paths.append(os.path.relpath(os.path.join(directory, name), UPLOAD_DIR).replace(os.sep, '/'))
+    return sorted(paths)
+
+def blob_key(sha256: str) -> str:
+    """Storage key of the content-addressed blob for a SHA-256"""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def legacy_blob_key(sha256: str) -> str:
+    """Blob key in the old flat layout"""
+    return f"blobs/{sha256}"
+
+def upload_temp_path(suffix: str = "") -> str:
+    """Temporary local file for content on its way into the storage backend"""
+    return os.path.join(BLOBS_DIR, f".upload-{uuid.uuid4().hex}{suffix}")
+
+def register_upload(relative_path: str, sha256: str, size: int, existing_only: bool = False,
+                    user_id: Optional[int] = None) -> bool:
+    """
+    Record an upload in stored_files, count it on its blob and record the
+    uploading user as an owner of the content. With existing_only (blob
+    references), only an existing blob of that size that user_id uploaded
+    before is counted; returns False, recording nothing, if there is none.
+    """
+    from sqlalchemy import exists
+    from database import SessionLocal, insert_ignore
+    from models import StoredBlob, StoredBlobOwner, StoredFile
+    
+    if existing_only and user_id is None:
+        return False
+    
+    db = SessionLocal()
+    try:
+        for attempt in range(2):
+            try:
+                db.add(StoredFile(path=relative_path, sha256=sha256, size=size))
+                blobs = db.query(StoredBlob).filter(StoredBlob.sha256 == sha256)
+                if existing_only:
+                    blobs = blobs.filter(StoredBlob.size == size, StoredBlob.ref_count > 0, exists().where(
+                        StoredBlobOwner.sha256 == sha256, StoredBlobOwner.user_id == user_id))
+                updated = blobs.update({StoredBlob.ref_count: StoredBlob.ref_count + 1},
+                                       synchronize_session=False)
+                if not updated:
+                    if existing_only:
+                        db.rollback()
+                        return False
+                    db.add(StoredBlob(sha256=sha256, size=size, ref_count=1))
+                if user_id is not None and not existing_only:
+                    insert_ignore(db, StoredBlobOwner, sha256=sha256, user_id=user_id)
+                db.commit()
+                return True
+            except IntegrityError:
+                # Another upload of the same content created the blob row first
+                db.rollback()
+                if attempt:
+                    raise
+    finally:
+        db.close()
+
+def existing_blobs(files: List[Tuple[str, int]], user_id: int) -> Set[Tuple[str, int]]:
+    """The (sha256, size) pairs whose content is stored and was uploaded by user_id"""
+    from database import SessionLocal
+    from models import StoredBlob, StoredBlobOwner
+    
+    db = SessionLocal()
+    try:
+        rows = db.query(StoredBlob.sha256, StoredBlob.size) \
+            .join(StoredBlobOwner, StoredBlobOwner.sha256 == StoredBlob.sha256) \
+            .filter(StoredBlob.sha256.in_({sha256 for sha256, _ in files}), StoredBlob.ref_count > 0,
+                    StoredBlobOwner.user_id == user_id)
+        return set(rows.all()) & set(files)
+    finally:
+        db.close()
+
+async def read_blob_ref(file: UploadFile) -> Optional[Tuple[str, int]]:
+    """
+    (sha256, size) if a multipart part is a blob reference
+    (BLOB_REF_CONTENT_TYPE) rather than the file itself, else None
+    """
+    if (file.content_type or "").split(";")[0].strip() != BLOB_REF_CONTENT_TYPE:
+        return None
+    
+    invalid = HTTPException(status_code=400, detail=f"Invalid content reference for '{file.filename}'")
+    await file.seek(0)
+    try:
+        reference = json.loads(await file.read(4096))
+        sha256, size = str(reference["sha256"]).lower(), int(reference["size"])
+    except (ValueError, KeyError, TypeError):
+        raise invalid
+    await file.seek(0)
+    
+    if not SHA256_PATTERN.fullmatch(sha256) or size < 0:
+        raise invalid
+    return sha256, size
+
+async def write_upload(file: UploadFile, relative_path: str,
+                       max_size_mb: int = MAX_UPLOAD_SIZE_MB,
+                       user_id: Optional[int] = None) -> StoredPath:
+    """
+    Stream an upload to a temporary file in UPLOAD_CHUNK_SIZE chunks with
+    async file I/O, hashing it on the way (only one chunk is held in memory
+    at a time), then hand it to the storage backend as a content-addressed
+    blob. A blob reference part is linked to the stored content instead
+    (409 unless user_id uploaded that content before).
+    
+    Uploads larger than max_size_mb are rejected with 413 and the partial
+    file is removed.
+    """
+    max_bytes = max_size_mb * 1024 * 1024
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"File '{file.filename}' is larger than the {max_size_mb} MB upload limit"
+    )
+    
+    reference = await read_blob_ref(file)
+    if reference:
+        sha256, size = reference
+        if size > max_bytes:
+            raise too_large
+        # Counted in one statement with the existence check, so the blob
+        # cannot be deleted in between (see delete_file)
+        if not await run_in_threadpool(register_upload, relative_path, sha256, size, True, user_id):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Content of '{file.filename}' is not on the server; send the file itself"
+            )
+        return StoredPath(relative_path, sha256, size)
+    
+    # Multipart parsing already knows the size; reject before writing anything
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+    
+    temp_path = upload_temp_path()
+    await file.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    return await store_file(temp_path, relative_path, digest.hexdigest(), size, user_id)
+
+async def store_file(temp_path: str, relative_path: str, sha256: Optional[str] = None,
+                     size: Optional[int] = None, user_id: Optional[int] = None) -> StoredPath:
     """
-    Save a photo (generic)
+    Store a finished local file under an upload path (content-addressed),
+    uploaded by user_id (None for files the server generates).
+    Takes ownership of temp_path (removed if storing fails); the hash and
+    size are computed if not given.
     """
+    try:
+        if sha256 is None:
+            sha256 = await run_in_threadpool(file_sha256, temp_path)
+        if size is None:
+            size = os.path.getsize(temp_path)
+        
+        # Counted on its blob before the bytes are written: delete_file removes a
+        # blob only while it holds the blob's row, so an upload of the same content
+        # either keeps the blob alive or waits and writes it again
+        await run_in_threadpool(register_upload, relative_path, sha256, size, False, user_id)
+        try:
+            await get_storage().put(temp_path, blob_key(sha256))
+        except BaseException:
+            await run_in_threadpool(delete_file, relative_path)
+            raise
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return StoredPath(relative_path, sha256, size)
+
+async def read_photo_exif(file: UploadFile, user_id: Optional[int] = None) -> Optional[Dict]:
+    """
+    Parse EXIF/GPS from an upload's header without saving it or decoding pixels
+    (for a blob reference, from the stored content user_id uploaded).
+    Returns None if the CV module is unavailable or referenced content is missing.
+    """
+    if extract_exif_header is None:
+        return None
+    
+    reference = await read_blob_ref(file)
+    if reference:
+        if user_id is None or reference not in await run_in_threadpool(existing_blobs, [reference], user_id):
+            return None
+        blob_file = await run_in_threadpool(_blob_local_path, reference[0])
+        return await run_in_threadpool(read_file_exif, blob_file) if blob_file else None
+    
+    await file.seek(0)
+    exif = extract_exif_header(file.file)
+    await file.seek(0)
+    return exif
+
+def read_file_exif(file_path: str) -> Optional[Dict]:
+    """
+    Parse EXIF/GPS from the header of a photo on disk.
+    Returns None if the CV module is unavailable.
+    """
+    if extract_exif_header is None:
+        return None
+    
+    with open(file_path, 'rb') as f:
+        return extract_exif_header(f)
+
+async def save_photo(file: UploadFile, prefix: str, photo_index: Optional[int] = None,
+                     require_gps: Optional[bool] = None, user_id: Optional[int] = None) -> StoredPath:
+    """
+    Save a photo (generic) uploaded by user_id
+    
+    If require_gps is set (default: REQUIRE_PHOTO_GPS), photos whose EXIF
+    header has no GPS coordinates are rejected before anything is written.
+    """
+    if require_gps is None:
+        require_gps = REQUIRE_PHOTO_GPS
+    
+    if require_gps:
+        exif = await read_photo_exif(file, user_id)
+        if exif is not None and not exif['has_gps']:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Photo '{file.filename}' has no GPS location. Enable location tagging in the camera and retake it."
+            )
+    
     if photo_index is not None:
         file_prefix = f"photo_{prefix}_{photo_index}"
     else:
@@ -45,69 +412,192 @@ async def save_photo(file: UploadFile, prefix: str, photo_index: Optional[int] =
         file.filename,
         prefix=file_prefix
     )
-    file_path = os.path.join(PHOTOS_DIR, filename)
-    
-    await file.seek(0)
-    content = await file.read()
-    with open(file_path, 'wb') as f:
-        f.write(content)
     
-    return f"photos/{filename}"
+    # The content hash is used by the CV result cache
+    stored = await write_upload(file, upload_path("photos", filename), user_id=user_id)
+    schedule_photo_derivatives(stored)
+    return stored
+
+def derivative_path(relative_path: str, size: str) -> str:
+    """
+    Relative path of a photo's WebP derivative
+    (e.g. "photos/x.jpg", "thumb" -> "photos/x.thumb.webp")
+    """
+    return f"{os.path.splitext(relative_path)[0]}.{size}.webp"
+
+def get_photo_derivatives(relative_path: Optional[str]) -> Dict[str, str]:
+    """
+    Derivative paths of a photo, as {size: relative path}. Computed from the
+    path alone (no storage lookup); a derivative that is still being
+    generated is not found yet, and clients fall back to the original.
+    """
+    if not relative_path or not relative_path.startswith("photos/"):
+        return {}
+    return {size: derivative_path(relative_path, size) for size in PHOTO_DERIVATIVE_SIZES}
 
-async def save_video(file: UploadFile, batch_id: str) -> str:
+async def store_photo_derivatives(relative_path: str, files: Dict[str, str]) -> List[StoredPath]:
     """
-    Save a manufacturing video
+    Store generated WebP derivatives of a photo ({size: local file}) through
+    the storage backend under their derivative paths, replacing earlier
+    copies. Takes ownership of the files; sizes whose file was not written
+    are skipped.
+    """
+    stored = []
+    for size, temp_path in files.items():
+        if not os.path.exists(temp_path):
+            continue
+        path = derivative_path(str(relative_path), size)
+        await run_in_threadpool(delete_file, path)
+        stored.append(await store_file(temp_path, path))
+    return stored
+
+def schedule_photo_derivatives(relative_path: str) -> bool:
+    """Queue WebP derivative generation for a saved photo on the CV worker pool"""
+    try:
+        from cv.worker import get_cv_executor
+    except ImportError:
+        return False
+    return get_cv_executor().submit_derivatives(relative_path)
+
+async def save_video(file: UploadFile, batch_id: str, user_id: Optional[int] = None) -> StoredPath:
+    """
+    Save a manufacturing video uploaded by user_id
     """
     filename = generate_unique_filename(
         file.filename,
         prefix=f"batch_{batch_id}"
     )
-    file_path = os.path.join(VIDEOS_DIR, filename)
     
-    await file.seek(0)
-    content = await file.read()
-    with open(file_path, 'wb') as f:
-        f.write(content)
-    
-    return f"videos/{filename}"
+    return await write_upload(file, upload_path("videos", filename),
+                              max_size_mb=MAX_VIDEO_UPLOAD_SIZE_MB, user_id=user_id)
 
-async def save_kml(file: UploadFile, prefix: str) -> str:
+async def save_kml(file: UploadFile, prefix: str, user_id: Optional[int] = None) -> StoredPath:
     """
-    Save a KML file (generic)
+    Save a KML file (generic) uploaded by user_id
     """
     filename = generate_unique_filename(
         file.filename,
         prefix=f"kml_{prefix}"
     )
-    file_path = os.path.join(KML_DIR, filename)
     
-    await file.seek(0)
-    content = await file.read()
-    with open(file_path, 'wb') as f:
-        f.write(content)
+    return await write_upload(file, upload_path("kml", filename), user_id=user_id)
+
+def _layout_candidates(relative_path: str) -> List[str]:
+    paths = [str(relative_path)]
+    alternative = layout_alternative(paths[0])
+    if alternative:
+        paths.append(alternative)
+    return paths
+
+def get_stored_sha256(relative_path: str) -> Optional[str]:
+    """Content hash of a content-addressed upload (None for other paths)"""
+    from database import SessionLocal
+    from models import StoredFile
     
-    return f"kml/{filename}"
+    db = SessionLocal()
+    try:
+        return db.query(StoredFile.sha256) \
+            .filter(StoredFile.path.in_(_layout_candidates(relative_path))).limit(1).scalar()
+    finally:
+        db.close()
 
-def get_file_path(relative_path: str) -> Optional[str]:
+def _blob_local_path(sha256: str) -> Optional[str]:
+    storage = get_storage()
+    blob_file = storage.local_path(blob_key(sha256))
+    if blob_file is None and UPLOAD_LAYOUT_SHIM:
+        blob_file = storage.local_path(legacy_blob_key(sha256))
+    return blob_file
+
+def resolve_upload(relative_path: str) -> Optional[Tuple[str, Optional[str]]]:
     """
-    Get absolute file path from relative path
+    Resolve an upload path to (absolute file path, SHA-256)
+    
+    Plain files under the upload directory are returned as they are, with
+    no hash (files from before the content-addressed store, derivatives);
+    other upload paths are looked up in stored_files and resolve to a local
+    copy of their blob (with S3 storage, a read-through cache file). With
+    UPLOAD_LAYOUT_SHIM, flat and sharded paths both resolve, whichever
+    layout the file is in.
     """
     if not relative_path:
         return None
     
-    file_path = os.path.join(UPLOAD_DIR, relative_path)
+    for candidate in _layout_candidates(relative_path):
+        file_path = os.path.normpath(os.path.join(UPLOAD_DIR, candidate))
+        if os.path.commonpath([file_path, UPLOAD_DIR]) != UPLOAD_DIR:
+            return None
+        if os.path.isfile(file_path):
+            return file_path, None
     
-    if os.path.exists(file_path):
-        return file_path
-    else:
+    sha256 = get_stored_sha256(relative_path)
+    if not sha256:
         return None
+    
+    blob_file = _blob_local_path(sha256)
+    return (blob_file, sha256) if blob_file else None
+
+def get_file_path(relative_path: str) -> Optional[str]:
+    """
+    Get absolute file path from relative path (see resolve_upload)
+    """
+    resolved = resolve_upload(relative_path)
+    return resolved[0] if resolved else None
+
+def get_file_url(relative_path: str) -> Optional[str]:
+    """
+    Direct download URL for a content-addressed upload (presigned S3 URL),
+    or None when the file is served by the API
+    """
+    storage = get_storage()
+    if storage.name == "local" or not relative_path:
+        return None
+    
+    sha256 = get_stored_sha256(relative_path)
+    if not sha256:
+        return None
+    key = blob_key(sha256)
+    if UPLOAD_LAYOUT_SHIM and not storage.exists(key):
+        key = legacy_blob_key(sha256)
+    media_type = mimetypes.guess_type(str(relative_path))[0]
+    return storage.url(key, media_type)
 
 def delete_file(relative_path: str) -> bool:
     """
     Delete a file
+    
+    For content-addressed uploads the stored_files row is removed and the
+    blob is deleted once no other upload refers to it. The blob is removed
+    from storage inside the transaction that holds its stored_blobs row, so
+    a concurrent upload of the same content (register_upload) waits for it.
     """
-    file_path = get_file_path(relative_path)
-    if file_path and os.path.exists(file_path):
-        os.remove(file_path)
-        return True
-    return False
+    from database import SessionLocal
+    from models import StoredBlob, StoredBlobOwner, StoredFile
+    
+    db = SessionLocal()
+    try:
+        stored = db.query(StoredFile) \
+            .filter(StoredFile.path.in_(_layout_candidates(relative_path))).first()
+        if stored is None:
+            file_path = get_file_path(relative_path)
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+                return True
+            return False
+        
+        sha256 = stored.sha256
+        db.delete(stored)
+        db.query(StoredBlob).filter(StoredBlob.sha256 == sha256) \
+            .update({StoredBlob.ref_count: StoredBlob.ref_count - 1}, synchronize_session=False)
+        blob = db.query(StoredBlob).filter(StoredBlob.sha256 == sha256).first()
+        if blob is None or blob.ref_count <= 0:
+            storage = get_storage()
+            storage.delete(blob_key(sha256))
+            if UPLOAD_LAYOUT_SHIM:
+                storage.delete(legacy_blob_key(sha256))
+            if blob is not None:
+                db.delete(blob)
+            db.query(StoredBlobOwner).filter(StoredBlobOwner.sha256 == sha256).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return True
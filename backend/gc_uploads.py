@@ -0,0 +1,376 @@
+"""
+Garbage-collect unreferenced uploads
+
+Deleting records (plots, harvests, batches, audits, ...) leaves their
+photos, videos and KML files behind. This mark-and-sweep collector frees
+them:
+
+1. Mark: every upload path stored in the database (record columns,
+   Audit.photos, profile photos, QR codes) is streamed into a compact set of
+   64-bit hashes, together with the same path in the other directory layout
+   and a photo's WebP derivatives
+2. Sweep plain files: the upload tree is walked in parallel (one task per
+   shard directory); unreferenced files are deleted or quarantined
+3. Sweep content-addressed uploads: stored_files rows nobody refers to are
+   released, then blobs without any stored_files row are deleted or
+   quarantined (local directory or S3), as are abandoned temporary uploads
+4. Sweep analysis rows: photo_hashes, photo_analyses and video_fingerprints
+   rows of unreferenced uploads are deleted with them (API workers rebuild
+   their photo hash index when the row count drops, and drop collected videos
+   from their fingerprint index when they come up in a match)
+
+Only files, rows and blobs older than the grace period are touched, so
+uploads whose record is still being saved are never collected. Blobs are
+checked against stored_files once more right before they are removed.
+
+With --quarantine, files are moved under quarantine/<timestamp>/ (in the
+upload directory, or the S3 bucket for blobs) instead of being deleted;
+remove that directory once nothing turned out to be missing.
+
+Usage (from the backend directory):
+    python gc_uploads.py --dry-run
+    python gc_uploads.py [--grace-hours 72] [--quarantine] [--workers 8]
+"""
+import argparse
+import hashlib
+import os
+import re
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from database import SessionLocal, init_db
+from models import (User, Plot, PlotPhoto, BiomassHarvest, Transport, BiomassPreprocessing,
+                    ManufacturingBatch, UnburnableProcess, BiocharApplication, Audit,
+                    StoredBlob, StoredBlobOwner, StoredFile, PhotoHash, PhotoAnalysis,
+                    VideoFingerprint)
+from file_storage import (UPLOAD_DIR, PHOTO_DERIVATIVE_SIZES, derivative_path, sharded_path,
+                          flat_path)
+from storage import get_storage
+
+# (model, upload path columns) for every record table that keeps uploads alive
+REFERENCE_COLUMNS = [
+    (Plot, ['kml_file_path']),
+    (PlotPhoto, ['photo_path']),
+    (BiomassHarvest, ['photo_path_1', 'photo_path_2']),
+    (Transport, ['loading_photo_path', 'unloading_photo_path']),
+    (BiomassPreprocessing, ['photo_before_path', 'photo_after_path']),
+    (ManufacturingBatch, ['video_path', 'photo_path', 'qr_code_path']),
+    (UnburnableProcess, ['photo_path']),
+    (BiocharApplication, ['photo_path', 'kml_file_path']),
+    (User, ['photo_url'])
+]
+
+# (model, upload path column) of analysis rows kept for each photo / video
+ANALYSIS_COLUMNS = [
+    (PhotoHash, 'photo_path'),
+    (PhotoAnalysis, 'photo_path'),
+    (VideoFingerprint, 'video_path')
+]
+
+# Top-level upload directories that are not swept as plain files
+# (blobs are swept through the storage backend)
+SKIP_DIRS = {'blobs', 'quarantine'}
+
+BLOB_NAME = re.compile(r"[0-9a-f]{64}")
+BATCH_SIZE = 500
+
+
+class PathSet:
+    """
+    Set of strings kept as sorted 64-bit hashes (8 bytes per entry). A hash
+    collision can only make an orphan look referenced, never the reverse.
+    """
+
+    def __init__(self):
+        self._hashes = array('Q')
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+    def add(self, value: str):
+        self._hashes.append(self._hash(value))
+
+    def freeze(self):
+        """Sort for lookups; call once after the last add"""
+        self._hashes = array('Q', sorted(set(self._hashes)))
+
+    def __contains__(self, value: str) -> bool:
+        hashed = self._hash(value)
+        index = bisect_left(self._hashes, hashed)
+        return index < len(self._hashes) and self._hashes[index] == hashed
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+def mark(db, cutoff: datetime) -> Tuple[PathSet, PathSet, List[Tuple[int, str]]]:
+    """
+    Collect referenced upload paths and the blobs they keep alive
+
+    Returns:
+        (referenced paths, referenced blob hashes,
+         orphaned stored_files rows [(id, sha256)])
+    """
+    live = PathSet()
+
+    def add_path(path: str):
+        path = path.removeprefix('/uploads/')
+        for candidate in {path, sharded_path(path), flat_path(path)}:
+            live.add(candidate)
+            if candidate.startswith('photos/'):
+                for size in PHOTO_DERIVATIVE_SIZES:
+                    live.add(derivative_path(candidate, size))
+
+    for model, columns in REFERENCE_COLUMNS:
+        for column in columns:
+            attribute = getattr(model, column)
+            for (path,) in db.query(attribute).filter(attribute.isnot(None)).yield_per(10000):
+                add_path(path)
+    for (photos,) in db.query(Audit.photos).filter(Audit.photos.isnot(None)).yield_per(1000):
+        for path in photos or []:
+            if path:
+                add_path(path)
+    live.freeze()
+
+    live_blobs = PathSet()
+    orphans = []
+    rows = db.query(StoredFile.id, StoredFile.path, StoredFile.sha256,
+                    StoredFile.created_at).yield_per(10000)
+    for row_id, path, sha256, created_at in rows:
+        if path in live or (created_at and created_at >= cutoff):
+            live_blobs.add(sha256)
+        else:
+            orphans.append((row_id, sha256))
+    live_blobs.freeze()
+
+    return live, live_blobs, orphans
+
+
+def collect_file(file_path: str, live: PathSet, cutoff_ts: float,
+                 quarantine_dir: Optional[str], dry_run: bool) -> Optional[int]:
+    """Delete or quarantine one plain file if it is unreferenced; returns its size, or None if kept"""
+    relative_path = os.path.relpath(file_path, UPLOAD_DIR).replace(os.sep, '/')
+    if file_path.endswith('.tmp') or relative_path in live:
+        return None
+    try:
+        stat = os.stat(file_path)
+        if stat.st_mtime >= cutoff_ts:
+            return None
+        if not dry_run:
+            if quarantine_dir:
+                # Not os.renames: it prunes emptied directories other sweep tasks are scanning
+                target = os.path.join(quarantine_dir, relative_path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(file_path, target)
+            else:
+                os.remove(file_path)
+    except OSError as e:
+        print(f"  ⚠️ {relative_path}: {e}")
+        return None
+    return stat.st_size
+
+
+def sweep_plain_files(pool: ThreadPoolExecutor, live: PathSet, cutoff_ts: float,
+                      quarantine_dir: Optional[str], dry_run: bool) -> Tuple[int, int]:
+    """
+    Sweep the plain files under photos/, videos/, kml/, profile_photos/, ...
+    One task per shard directory (and one for each top-level directory's own
+    files, the flat layout).
+
+    Returns:
+        (files collected, bytes reclaimed)
+    """
+    def sweep(directory: str, recursive: bool) -> Tuple[int, int]:
+        count = reclaimed = 0
+        if recursive:
+            paths = (os.path.join(current, name)
+                     for current, _, names in os.walk(directory) for name in names)
+        else:
+            paths = (entry.path for entry in os.scandir(directory) if entry.is_file())
+        for file_path in paths:
+            size = collect_file(file_path, live, cutoff_ts, quarantine_dir, dry_run)
+            if size is not None:
+                count += 1
+                reclaimed += size
+        return count, reclaimed
+
+    futures = []
+    for top in sorted(os.listdir(UPLOAD_DIR)):
+        top_path = os.path.join(UPLOAD_DIR, top)
+        if top in SKIP_DIRS or not os.path.isdir(top_path):
+            continue
+        futures.append(pool.submit(sweep, top_path, False))
+        futures.extend(pool.submit(sweep, entry.path, True)
+                       for entry in os.scandir(top_path) if entry.is_dir())
+
+    count = reclaimed = 0
+    for future in futures:
+        files, size = future.result()
+        count += files
+        reclaimed += size
+    return count, reclaimed
+
+
+def release_orphan_records(db, orphans: List[Tuple[int, str]]):
+    """Delete unreferenced stored_files rows and drop them from their blobs' ref counts"""
+    for offset in range(0, len(orphans), BATCH_SIZE):
+        batch = orphans[offset:offset + BATCH_SIZE]
+        db.query(StoredFile).filter(StoredFile.id.in_([row[0] for row in batch])) \
+            .delete(synchronize_session=False)
+        for sha256, released in Counter(row[1] for row in batch).items():
+            db.query(StoredBlob).filter(StoredBlob.sha256 == sha256) \
+                .update({StoredBlob.ref_count: StoredBlob.ref_count - released},
+                        synchronize_session=False)
+        db.commit()
+
+
+def sweep_blobs(db, pool: ThreadPoolExecutor, live_blobs: PathSet, cutoff_ts: float,
+                quarantine_prefix: Optional[str], dry_run: bool) -> Tuple[int, int]:
+    """
+    Delete or quarantine blobs that no stored_files row points at, and
+    abandoned temporary uploads
+
+    Returns:
+        (blobs collected, bytes reclaimed)
+    """
+    storage = get_storage()
+    candidates = []
+    for key, size, modified in storage.list_objects("blobs/"):
+        name = key.rsplit('/', 1)[-1]
+        if modified >= cutoff_ts:
+            continue
+        if BLOB_NAME.fullmatch(name):
+            if name not in live_blobs:
+                candidates.append((key, name, size))
+        elif name.startswith('.upload-'):
+            candidates.append((key, None, size))
+
+    def remove(key: str) -> bool:
+        try:
+            if quarantine_prefix:
+                storage.move(key, f"{quarantine_prefix}/{key}")
+            else:
+                storage.delete(key)
+            return True
+        except Exception as e:
+            print(f"  ⚠️ {key}: {e}")
+            return False
+
+    count = reclaimed = 0
+    for offset in range(0, len(candidates), BATCH_SIZE):
+        batch = candidates[offset:offset + BATCH_SIZE]
+        if not dry_run:
+            # An upload of the same content may have registered since the mark phase
+            hashes = [sha256 for _, sha256, _ in batch if sha256]
+            referenced = {sha256 for (sha256,) in
+                          db.query(StoredFile.sha256).filter(StoredFile.sha256.in_(hashes)).distinct()}
+            batch = [item for item in batch if item[1] not in referenced]
+            collected = [item[1] for item in batch if item[1]]
+            db.query(StoredBlob).filter(StoredBlob.sha256.in_(collected)).delete(synchronize_session=False)
+            db.query(StoredBlobOwner).filter(StoredBlobOwner.sha256.in_(collected)).delete(synchronize_session=False)
+            db.commit()
+            removed = list(pool.map(remove, [key for key, _, _ in batch]))
+        else:
+            removed = [True] * len(batch)
+
+        for (_, _, size), done in zip(batch, removed):
+            if done:
+                count += 1
+                reclaimed += size
+    return count, reclaimed
+
+
+def sweep_analysis_rows(db, live: PathSet, cutoff: datetime, dry_run: bool) -> int:
+    """
+    Delete photo hash, photo analysis and video fingerprint rows of uploads
+    no record refers to (rows newer than the cutoff are kept)
+
+    Returns:
+        rows deleted (or that would be)
+    """
+    deleted = 0
+    for model, column in ANALYSIS_COLUMNS:
+        path_column = getattr(model, column)
+        rows = db.query(model.id, path_column) \
+            .filter(or_(model.created_at.is_(None), model.created_at < cutoff)).yield_per(10000)
+        orphan_ids = [row_id for row_id, path in rows if path not in live]
+        deleted += len(orphan_ids)
+        if dry_run:
+            continue
+        for offset in range(0, len(orphan_ids), BATCH_SIZE):
+            db.query(model).filter(model.id.in_(orphan_ids[offset:offset + BATCH_SIZE])) \
+                .delete(synchronize_session=False)
+            db.commit()
+    return deleted
+
+
+def collect(grace_hours: float, quarantine: bool, workers: int, dry_run: bool = False):
+    init_db()
+    db = SessionLocal()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    cutoff = datetime.utcnow() - timedelta(hours=grace_hours)
+    cutoff_ts = time.time() - grace_hours * 3600
+
+    quarantine_prefix = f"quarantine/{datetime.utcnow():%Y%m%d-%H%M%S}" if quarantine else None
+    quarantine_dir = os.path.join(UPLOAD_DIR, quarantine_prefix) if quarantine else None
+    action = "would be reclaimed" if dry_run else ("quarantined" if quarantine else "reclaimed")
+
+    try:
+        start = time.perf_counter()
+        live, live_blobs, orphans = mark(db, cutoff)
+        print(f"Referenced upload paths (with derivatives and layout variants): {len(live)}, "
+              f"blobs: {len(live_blobs)}")
+
+        files, file_bytes = sweep_plain_files(pool, live, cutoff_ts, quarantine_dir, dry_run)
+        print(f"[OK] Plain files: {files} unreferenced, {file_bytes / 1e6:.1f} MB {action}")
+
+        if not dry_run:
+            release_orphan_records(db, orphans)
+        print(f"[OK] Upload records: {len(orphans)} unreferenced"
+              f"{' (would be released)' if dry_run else ' released'}")
+
+        blobs, blob_bytes = sweep_blobs(db, pool, live_blobs, cutoff_ts, quarantine_prefix, dry_run)
+        print(f"[OK] Blobs: {blobs} unreferenced, {blob_bytes / 1e6:.1f} MB {action}")
+
+        rows = sweep_analysis_rows(db, live, cutoff, dry_run)
+        print(f"[OK] Photo / video analysis rows: {rows} unreferenced"
+              f"{' (would be deleted)' if dry_run else ' deleted'}")
+
+        print(f"[OK] Upload GC finished in {time.perf_counter() - start:.1f}s: "
+              f"{(file_bytes + blob_bytes) / 1e6:.1f} MB {action}"
+              f"{f' (in {quarantine_prefix}/)' if quarantine and not dry_run else ''}")
+
+    except KeyboardInterrupt:
+        db.rollback()
+        print("\n⚠️ Interrupted - rerun to continue")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete uploads no record refers to")
+    parser.add_argument("--grace-hours", type=float, default=72,
+                        help="Only collect uploads older than this (default: 72)")
+    parser.add_argument("--quarantine", action="store_true",
+                        help="Move unreferenced files to quarantine/<timestamp>/ instead of deleting")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Directories / blobs processed in parallel (default: 8)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report what would be reclaimed")
+    args = parser.parse_args()
+
+    collect(grace_hours=args.grace_hours, quarantine=args.quarantine, workers=args.workers,
+            dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
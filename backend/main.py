@@ -5,7 +5,6 @@ Production-ready FastAPI application with authentication, database, and ML integ
 from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 import os
 
@@ -13,7 +12,6 @@ import os
 from database import get_db, init_db
 from models import User
 from auth import hash_password
-from file_storage import UPLOAD_DIR
 
 # Routers
 from routers import (
@@ -96,8 +94,14 @@ async def startup_event():
         print(f"❌ Critical Error during startup: {e}")
         # We don't re-raise here so the app can at least start and show logs
 
-# Mount static files for serving uploads
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background CV worker processes"""
+    try:
+        from cv.worker import get_cv_executor
+        get_cv_executor().shutdown()
+    except ImportError:
+        pass
 
 # Include Routers
 app.include_router(auth_router.router)
@@ -112,6 +116,12 @@ app.include_router(blockchain_router.router)
 app.include_router(customer_router.router)
 from routers import admin
 app.include_router(admin.router)
+from routers import uploads as uploads_router
+app.include_router(uploads_router.router)
+from routers import resumable_uploads as resumable_uploads_router
+app.include_router(resumable_uploads_router.router)
+from routers import bundles as bundles_router
+app.include_router(bundles_router.router)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,61 @@
+"""
+Lightweight in-process metrics for Harit Swaraj
+Shared by the ML shadow evaluator, CV worker pool and other instrumented code
+"""
+import threading
+from typing import Dict, Optional
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket latency histogram (milliseconds)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot = +Inf
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float):
+        """Record one latency sample"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if elapsed_ms <= bound:
+                index = i
+                break
+
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def _quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket that contains it"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        """Return a JSON-serializable view of the histogram"""
+        with self._lock:
+            labels = [f"le_{bound}ms" for bound in self.buckets] + ["le_inf"]
+            return {
+                'count': self.count,
+                'mean_ms': round(self.total_ms / self.count, 3) if self.count else None,
+                'max_ms': round(self.max_ms, 3),
+                'p50_ms': self._quantile(0.50),
+                'p95_ms': self._quantile(0.95),
+                'p99_ms': self._quantile(0.99),
+                'buckets': dict(zip(labels, self.counts))
+            }
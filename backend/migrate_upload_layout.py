@@ -0,0 +1,229 @@
+"""
+Migrate existing uploads to the sharded directory layout
+
+Uploads used to be kept flat (uploads/photos/x.jpg, blobs/<sha256>). New
+uploads fan out over two levels of hashed subdirectories
+(photos/3f/9a/x.jpg, blobs/3f/9a/<sha256>, see file_storage.py); this
+moves everything written before that while the app keeps running:
+
+1. Upload paths, in batches: the batch's plain files (originals and their
+   WebP derivatives) are moved in parallel, then every database column that
+   stores those paths is rewritten in one transaction - record photo / KML /
+   video columns, Audit.photos, stored_files, the photo analysis, hash and
+   video fingerprint tables, and finished resumable uploads
+2. Blobs of the content-addressed store are moved to their sharded keys in
+   parallel (local directory or S3)
+
+Between moving a batch and committing its paths, the app still finds the
+files through the layout shim (UPLOAD_LAYOUT_SHIM), so nothing 404s. The
+command can be stopped (Ctrl+C) and rerun at any point: moved files and
+rewritten rows are skipped. Once it reports nothing left to migrate, set
+UPLOAD_LAYOUT_SHIM=false.
+
+Usage (from the backend directory):
+    python migrate_upload_layout.py --dry-run
+    python migrate_upload_layout.py --workers 8 --batch-size 500
+"""
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import case
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import SessionLocal, init_db
+from models import (Plot, PlotPhoto, BiomassHarvest, Transport, BiomassPreprocessing,
+                    ManufacturingBatch, UnburnableProcess, BiocharApplication, Audit,
+                    PhotoHash, PhotoAnalysis, VideoAnalysis, VideoFingerprint, StoredFile,
+                    ResumableUpload)
+from file_storage import (UPLOAD_DIR, UPLOAD_FOLDERS, is_flat_path, sharded_path,
+                          list_plain_uploads, blob_key)
+from storage import get_storage
+
+# (model, upload path columns) for every table that stores upload paths
+PATH_COLUMNS = [
+    (Plot, ['kml_file_path']),
+    (PlotPhoto, ['photo_path']),
+    (BiomassHarvest, ['photo_path_1', 'photo_path_2']),
+    (Transport, ['loading_photo_path', 'unloading_photo_path']),
+    (BiomassPreprocessing, ['photo_before_path', 'photo_after_path']),
+    (ManufacturingBatch, ['video_path', 'photo_path']),
+    (UnburnableProcess, ['photo_path']),
+    (BiocharApplication, ['photo_path', 'kml_file_path']),
+    (PhotoHash, ['photo_path']),
+    (PhotoAnalysis, ['photo_path']),
+    (VideoAnalysis, ['video_path']),
+    (VideoFingerprint, ['video_path']),
+    (StoredFile, ['path']),
+    (ResumableUpload, ['file_path'])
+]
+
+LEGACY_BLOB_KEY = re.compile(r"blobs/([0-9a-f]{64})")
+
+
+def collect_flat_paths(db) -> Tuple[List[str], Dict[str, Set[int]]]:
+    """
+    Flat-layout upload paths on disk or referenced in the database
+
+    Returns:
+        (sorted paths, {path: ids of the audits that list it})
+    """
+    paths = set()
+    for folder in UPLOAD_FOLDERS:
+        paths.update(path for path in list_plain_uploads(folder) if is_flat_path(path))
+
+    for model, columns in PATH_COLUMNS:
+        for column in columns:
+            attribute = getattr(model, column)
+            for (path,) in db.query(attribute).filter(attribute.isnot(None)):
+                if is_flat_path(path):
+                    paths.add(path)
+
+    audit_references = {}
+    for audit_id, photos in db.query(Audit.id, Audit.photos):
+        for path in photos or []:
+            if path and is_flat_path(path):
+                paths.add(path)
+                audit_references.setdefault(path, set()).add(audit_id)
+
+    return sorted(paths), audit_references
+
+
+def move_plain_file(relative_path: str) -> str:
+    """Move one flat file to its sharded location; returns 'moved', 'absent' or 'conflict'"""
+    source = os.path.join(UPLOAD_DIR, relative_path)
+    if not os.path.isfile(source):
+        return 'absent'  # content-addressed upload, or moved by an earlier run
+
+    target = os.path.join(UPLOAD_DIR, sharded_path(relative_path))
+    if os.path.exists(target):
+        return 'conflict'
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.rename(source, target)
+    return 'moved'
+
+
+def rewrite_references(db, mapping: Dict[str, str], audit_references: Dict[str, Set[int]]):
+    """Point every stored path in mapping at its new location (one transaction)"""
+    for model, columns in PATH_COLUMNS:
+        for column in columns:
+            attribute = getattr(model, column)
+            db.query(model).filter(attribute.in_(mapping)) \
+                .update({attribute: case(mapping, value=attribute)}, synchronize_session=False)
+
+    audit_ids = set()
+    for path in mapping:
+        audit_ids.update(audit_references.get(path, ()))
+    if audit_ids:
+        for audit in db.query(Audit).filter(Audit.id.in_(audit_ids)):
+            audit.photos = [mapping.get(path, path) for path in audit.photos or []]
+
+    db.commit()
+
+
+def migrate_paths(db, pool: ThreadPoolExecutor, batch_size: int, dry_run: bool) -> int:
+    """Move flat upload files and rewrite their paths; returns the paths left over"""
+    paths, audit_references = collect_flat_paths(db)
+    print(f"Flat upload paths: {len(paths)}")
+    if dry_run or not paths:
+        return len(paths)
+
+    start = time.perf_counter()
+    counts = {'moved': 0, 'absent': 0, 'conflict': 0}
+    failed = 0
+    for offset in range(0, len(paths), batch_size):
+        batch = paths[offset:offset + batch_size]
+        results = list(pool.map(move_plain_file, batch))
+        for path, result in zip(batch, results):
+            counts[result] += 1
+            if result == 'conflict':
+                print(f"  ⚠️ {sharded_path(path)} already exists, left {path} in place")
+
+        mapping = {path: sharded_path(path) for path, result in zip(batch, results)
+                   if result != 'conflict'}
+        try:
+            rewrite_references(db, mapping, audit_references)
+        except SQLAlchemyError as e:
+            db.rollback()
+            failed += len(mapping)
+            print(f"  ⚠️ Batch at {batch[0]} not rewritten (files resolve through the shim): {e}")
+
+        done = offset + len(batch)
+        print(f"  {done}/{len(paths)}  {done / (time.perf_counter() - start):.0f} paths/s")
+
+    print(f"[OK] Paths migrated in {time.perf_counter() - start:.1f}s: {counts['moved']} files moved, "
+          f"{counts['absent']} stored only in the database, {counts['conflict']} conflicts, "
+          f"{failed} not rewritten")
+    return counts['conflict'] + failed
+
+
+def migrate_blobs(pool: ThreadPoolExecutor, batch_size: int, dry_run: bool) -> int:
+    """Move content-addressed blobs to their sharded keys; returns the blobs left over"""
+    storage = get_storage()
+    legacy_keys = [key for key, _, _ in storage.list_objects("blobs/") if LEGACY_BLOB_KEY.fullmatch(key)]
+    print(f"Flat blobs ({storage.name} storage): {len(legacy_keys)}")
+    if dry_run or not legacy_keys:
+        return len(legacy_keys)
+
+    def move_blob(key: str) -> bool:
+        try:
+            storage.move(key, blob_key(LEGACY_BLOB_KEY.fullmatch(key).group(1)))
+            return True
+        except Exception as e:
+            print(f"  ⚠️ {key}: {e}")
+            return False
+
+    start = time.perf_counter()
+    failed = 0
+    for offset in range(0, len(legacy_keys), batch_size):
+        batch = legacy_keys[offset:offset + batch_size]
+        failed += sum(1 for moved in pool.map(move_blob, batch) if not moved)
+        print(f"  {offset + len(batch)}/{len(legacy_keys)}")
+
+    print(f"[OK] Blobs migrated in {time.perf_counter() - start:.1f}s: "
+          f"{len(legacy_keys) - failed} moved, {failed} failed")
+    return failed
+
+
+def migrate(workers: int, batch_size: int, dry_run: bool = False):
+    init_db()
+    db = SessionLocal()
+    pool = ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        remaining = migrate_paths(db, pool, batch_size, dry_run)
+        remaining += migrate_blobs(pool, batch_size, dry_run)
+        if dry_run:
+            print(f"Dry run: {remaining} paths and blobs would be migrated")
+        elif remaining:
+            print(f"⚠️ {remaining} paths or blobs left in the flat layout - rerun to retry, "
+                  f"keep UPLOAD_LAYOUT_SHIM on")
+        else:
+            print("[OK] Nothing left in the flat layout - UPLOAD_LAYOUT_SHIM can be set to false")
+
+    except KeyboardInterrupt:
+        db.rollback()
+        print("\n⚠️ Interrupted - committed batches are kept, rerun to continue")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move uploads to the sharded directory layout")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Files / blobs moved in parallel (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Paths rewritten per database transaction (default: 500)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only count what would be migrated")
+    args = parser.parse_args()
+
+    migrate(workers=args.workers, batch_size=args.batch_size, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
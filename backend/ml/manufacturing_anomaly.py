@@ -29,6 +29,10 @@ except ImportError as e:
     # Re-raise the error so main.py can catch it and load mock models
     raise ImportError(f"Missing ML dependency: {e}") from e
 
+import os
+import time
+from .shadow import ShadowEvaluator
+
 
 class ManufacturingAnomalyDetector:
     """
@@ -46,7 +50,8 @@ class ManufacturingAnomalyDetector:
     - reason: explanation
     """
     
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, train_if_missing: bool = True):
+        self.train_if_missing = train_if_missing
         self.model_path = model_path or "backend/ml/models/isolation_forest.pkl"
         self.scaler_path = model_path.replace(".pkl", "_scaler.pkl") if model_path else "backend/ml/models/scaler.pkl"
         self.kiln_encoding = {
@@ -59,6 +64,8 @@ class ManufacturingAnomalyDetector:
         self.model = None
         self.scaler = None
         self.training_data = []
+        self.candidate = None  # Optional shadow model (see enable_shadow)
+        self.shadow = None
         self._initialize()
     
     def _initialize(self):
@@ -71,6 +78,9 @@ class ManufacturingAnomalyDetector:
                 self.scaler = pickle.load(f)
             print(f"[OK] Loaded pre-trained model from {self.model_path}")
         except FileNotFoundError:
+            if not self.train_if_missing:
+                # Candidate models are evaluated as shipped, never replaced
+                raise
             # Create initial model with synthetic training data
             print("[WARNING] Model not found. Training with synthetic data...")
             self._train_initial_model()
@@ -125,6 +135,14 @@ class ManufacturingAnomalyDetector:
         """Encode categorical kiln type to numerical value"""
         return self.kiln_encoding.get(kiln_type, 1)  # Default to Batch Retort
     
+    def enable_shadow(self, candidate: "ManufacturingAnomalyDetector"):
+        """
+        Run a candidate model in shadow mode next to this one.
+        The candidate never affects the returned prediction.
+        """
+        self.candidate = candidate
+        self.shadow = ShadowEvaluator("manufacturing_anomaly")
+    
     def predict(self, biomass_input: float, biochar_output: float, 
                 kiln_type: str) -> dict:
         """
@@ -138,7 +156,27 @@ class ManufacturingAnomalyDetector:
         Returns:
             dict with ml_status, confidence_score, reason
         """
+        start = time.perf_counter()
+        result = self._predict(biomass_input, biochar_output, kiln_type)
         
+        if self.shadow is not None:
+            self.shadow.record_primary((time.perf_counter() - start) * 1000)
+            candidate = self.candidate
+            self.shadow.submit(
+                lambda: candidate._predict(biomass_input, biochar_output, kiln_type)["ml_status"],
+                result["ml_status"],
+                {
+                    "biomass_input": biomass_input,
+                    "biochar_output": biochar_output,
+                    "kiln_type": kiln_type
+                }
+            )
+        
+        return result
+    
+    def _predict(self, biomass_input: float, biochar_output: float,
+                 kiln_type: str) -> dict:
+        """Run the model without shadow instrumentation"""
         if not self.model or not self.scaler:
             raise RuntimeError("Model not initialized")
         
@@ -229,6 +267,15 @@ class ManufacturingAnomalyDetector:
 # Global model instance
 anomaly_detector = ManufacturingAnomalyDetector()
 
+# Optional candidate model evaluated in shadow mode (e.g. a retrained model)
+_shadow_model_path = os.getenv("ANOMALY_SHADOW_MODEL_PATH")
+if _shadow_model_path:
+    try:
+        anomaly_detector.enable_shadow(ManufacturingAnomalyDetector(_shadow_model_path, train_if_missing=False))
+        print(f"[OK] Shadow anomaly model enabled: {_shadow_model_path}")
+    except (OSError, pickle.UnpicklingError) as e:
+        print(f"[WARNING] Shadow anomaly model not loaded, shadowing disabled: {e}")
+
 
 def get_anomaly_detector() -> ManufacturingAnomalyDetector:
     """Get the anomaly detector instance (singleton)"""
@@ -24,12 +24,17 @@ try:
 except ImportError as e:
     raise ImportError(f"Missing ML dependency: {e}") from e
 
+import time
+from .shadow import ShadowEvaluator
+
 
 class PlotVerifier:
     """ML-based plot verification system for fraud detection"""
     
     def __init__(self):
         self.area_detector = None
+        self.candidate_area_detector = None  # Optional shadow model
+        self.shadow = None
         self.existing_plots = []  # In-memory storage (replace with DB in production)
         self.model_dir = os.path.join(os.path.dirname(__file__), 'models')
         os.makedirs(self.model_dir, exist_ok=True)
@@ -46,6 +51,16 @@ class PlotVerifier:
             print("[WARNING] No existing model found, training initial model...")
             self._train_initial_models()
     
+    def load_shadow_model(self, model_path: str):
+        """
+        Load a candidate area detector and evaluate it in shadow mode.
+        The candidate never affects the returned verification report.
+        """
+        with open(model_path, 'rb') as f:
+            self.candidate_area_detector = pickle.load(f)
+        self.shadow = ShadowEvaluator("plot_verification")
+        print(f"[OK] Shadow area detector enabled: {model_path}")
+    
     def _train_initial_models(self):
         """Train initial models with synthetic data"""
         # Generate synthetic area data (0.5 to 10 hectares, normal distribution)
@@ -177,24 +192,26 @@ class PlotVerifier:
         
         return features
     
-    def check_area_anomaly(self, area_hectares: float) -> Dict:
+    def check_area_anomaly(self, area_hectares: float, detector=None) -> Dict:
         """
         Check if plot area is anomalous
         
         Args:
             area_hectares: Plot area in hectares
+            detector: Optional model to use instead of the production area detector
             
         Returns:
             Detection result dictionary
         """
-        if self.area_detector is None:
+        detector = detector if detector is not None else self.area_detector
+        if detector is None:
             return {'is_anomaly': False, 'reason': 'Model not loaded'}
         
         area_array = np.array([[area_hectares]])
         
         # Predict (-1 = anomaly, 1 = normal)
-        prediction = self.area_detector.predict(area_array)[0]
-        anomaly_score = self.area_detector.score_samples(area_array)[0]
+        prediction = detector.predict(area_array)[0]
+        anomaly_score = detector.score_samples(area_array)[0]
         
         is_anomaly = (prediction == -1)
         
@@ -405,7 +422,9 @@ class PlotVerifier:
         features = self.extract_features(polygon, farmer_id)
         
         # Run all detection methods
+        start = time.perf_counter()
         area_check = self.check_area_anomaly(features['area_hectares'])
+        area_elapsed_ms = (time.perf_counter() - start) * 1000
         shape_check = self.check_shape_similarity(polygon)
         overlap_check = self.check_overlaps(polygon)
         cluster_check = self.check_spatial_clustering(polygon, farmer_id)
@@ -416,6 +435,25 @@ class PlotVerifier:
             area_check, shape_check, overlap_check, cluster_check
         )
         
+        # Shadow-evaluate the candidate area model against the same geometry checks
+        if self.shadow is not None:
+            self.shadow.record_primary(area_elapsed_ms)
+            geometry_suspicious = (shape_check['is_suspicious'] or
+                                   overlap_check['is_suspicious'] or
+                                   cluster_check['is_suspicious'])
+            area_hectares = features['area_hectares']
+            candidate = self.candidate_area_detector
+            
+            def run_candidate() -> str:
+                candidate_check = self.check_area_anomaly(area_hectares, detector=candidate)
+                suspicious = candidate_check['is_anomaly'] or geometry_suspicious
+                return 'suspicious' if suspicious else 'verified'
+            
+            self.shadow.submit(run_candidate, report['plot_status'], {
+                'plot_id': plot_id,
+                'area_hectares': round(area_hectares, 4)
+            })
+        
         # Store plot for future comparisons (in production, save to database)
         self.existing_plots.append({
             'plot_id': plot_id,
@@ -551,4 +589,12 @@ def get_plot_verifier() -> PlotVerifier:
     if _verifier is None:
         _verifier = PlotVerifier()
         _verifier.load_models()
+        
+        # Optional candidate model evaluated in shadow mode (e.g. a retrained model)
+        shadow_model_path = os.getenv("PLOT_AREA_SHADOW_MODEL_PATH")
+        if shadow_model_path:
+            try:
+                _verifier.load_shadow_model(shadow_model_path)
+            except FileNotFoundError:
+                print(f"[WARNING] Shadow area model not found: {shadow_model_path}")
     return _verifier
@@ -0,0 +1,117 @@
+"""
+Shadow-Mode Model Evaluation
+============================
+Runs a candidate model side-by-side with the production model without
+touching the response that is returned to the caller.
+
+How it works:
+- The production model runs inline, exactly as before, and its inference
+  latency is recorded.
+- The candidate model is submitted to a small background thread pool, so it
+  never adds latency to the request path.
+- Both latencies go into fixed-bucket histograms and the candidate's status is
+  compared with the production status to build an agreement rate.
+
+Stats are exposed through the admin API so promotion of a retrained model is
+based on measured cost and behaviour.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from metrics import LatencyHistogram
+
+
+class ShadowEvaluator:
+    """
+    Compares a candidate model against the production model off the request path.
+
+    Args:
+        name: Name used in stats and thread names
+        max_pending: Maximum queued shadow evaluations; extra ones are dropped
+                     so a slow candidate can never build an unbounded backlog
+    """
+
+    def __init__(self, name: str, max_pending: int = 100):
+        self.name = name
+        self.max_pending = max_pending
+        self.primary_latency = LatencyHistogram()
+        self.candidate_latency = LatencyHistogram()
+        self.comparisons = 0
+        self.agreements = 0
+        self.errors = 0
+        self.dropped = 0
+        self.recent_disagreements = deque(maxlen=20)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shadow-{name}")
+
+    def record_primary(self, elapsed_ms: float):
+        """Record the production model's inference latency"""
+        self.primary_latency.observe(elapsed_ms)
+
+    def submit(self, candidate_fn: Callable[[], str], primary_status: str, context: Optional[Dict] = None):
+        """
+        Schedule a candidate evaluation in the background.
+
+        Args:
+            candidate_fn: Callable that runs the candidate model and returns its status
+            primary_status: Status returned by the production model
+            context: Optional details kept with disagreement samples
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending += 1
+
+        self._executor.submit(self._run, candidate_fn, primary_status, context or {})
+
+    def _run(self, candidate_fn: Callable[[], str], primary_status: str, context: Dict):
+        try:
+            start = time.perf_counter()
+            candidate_status = candidate_fn()
+            self.candidate_latency.observe((time.perf_counter() - start) * 1000)
+
+            with self._lock:
+                self.comparisons += 1
+                if candidate_status == primary_status:
+                    self.agreements += 1
+                else:
+                    self.recent_disagreements.append({
+                        'primary_status': primary_status,
+                        'candidate_status': candidate_status,
+                        'context': context,
+                        'timestamp': datetime.utcnow().isoformat()
+                    })
+        except Exception as e:
+            print(f"⚠️ Shadow evaluation error ({self.name}): {e}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict:
+        """Return latency histograms and agreement statistics"""
+        with self._lock:
+            comparisons = self.comparisons
+            agreements = self.agreements
+            summary = {
+                'comparisons': comparisons,
+                'agreements': agreements,
+                'agreement_rate': round(agreements / comparisons, 4) if comparisons else None,
+                'errors': self.errors,
+                'dropped': self.dropped,
+                'pending': self._pending,
+                'recent_disagreements': list(self.recent_disagreements)
+            }
+
+        summary['latency'] = {
+            'primary': self.primary_latency.snapshot(),
+            'candidate': self.candidate_latency.snapshot()
+        }
+        return summary
@@ -1,7 +1,7 @@
 """
 Database models for Harit Swaraj MRV System
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -249,3 +249,145 @@ class Audit(Base):
     
     auditor = relationship("User", back_populates="audits")
     plot = relationship("Plot", back_populates="audits")
+
+class PhotoHash(Base):
+    __tablename__ = "photo_hashes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    photo_path = Column(String(255), unique=True, nullable=False, index=True)
+    perceptual_hash = Column(String(64), nullable=False)
+    source = Column(String(30), nullable=False)  # 'plot', 'harvest', 'preprocessing', 'transport', 'batch', 'unburnable', 'application', 'audit'
+    record_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PhotoAnalysis(Base):
+    __tablename__ = "photo_analyses"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    photo_path = Column(String(255), unique=True, nullable=False, index=True)
+    source = Column(String(30), nullable=False)  # Same values as PhotoHash.source
+    record_id = Column(Integer)
+    
+    quality_score = Column(Float)
+    has_gps = Column(Integer, default=0)
+    gps_latitude = Column(Float)
+    gps_longitude = Column(Float)
+    photo_timestamp = Column(DateTime)
+    perceptual_hash = Column(String(64))
+    biochar_detected = Column(Boolean)
+    biochar_confidence = Column(Float)
+    is_duplicate = Column(Boolean, default=False)
+    cv_analysis = Column(JSON)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CVResultCache(Base):
+    __tablename__ = "cv_result_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False, index=True)
+    result = Column(JSON, nullable=False)  # Raw analyze_photo output
+    hits = Column(Integer, default=0)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class VideoAnalysis(Base):
+    __tablename__ = "video_analyses"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("manufacturing_batches.id"), index=True)
+    video_path = Column(String(255), unique=True, nullable=False, index=True)
+    
+    duration_s = Column(Float)
+    frames_sampled = Column(Integer)
+    quality_score = Column(Float)
+    flame_detected = Column(Boolean)
+    smoke_detected = Column(Boolean)
+    biochar_detected = Column(Boolean)
+    summary = Column(JSON)  # Full analyze_video output (phases, ratios, warnings)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class VideoFingerprint(Base):
+    __tablename__ = "video_fingerprints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    video_path = Column(String(255), unique=True, nullable=False, index=True)
+    batch_id = Column(Integer, ForeignKey("manufacturing_batches.id"), index=True)
+    interval_s = Column(Float)  # Seconds between fingerprint frames
+    frame_hashes = Column(JSON, nullable=False)  # 64-bit dHash hex per frame (null for blank frames)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class StoredBlob(Base):
+    __tablename__ = "stored_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=1)  # stored_files rows pointing at this blob
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class StoredBlobOwner(Base):
+    __tablename__ = "stored_blob_owners"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # Uploaded this content
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (UniqueConstraint('sha256', 'user_id'),)
+
+class StoredFile(Base):
+    __tablename__ = "stored_files"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    path = Column(String(255), unique=True, nullable=False, index=True)  # Upload path kept in records, e.g. "photos/x.jpg"
+    sha256 = Column(String(64), nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ResumableUpload(Base):
+    __tablename__ = "resumable_uploads"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    upload_id = Column(String(32), unique=True, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String(10), nullable=False)  # 'photo', 'video'
+    filename = Column(String(255), nullable=False)
+    total_size = Column(Integer, nullable=False)
+    offset = Column(Integer, nullable=False, default=0)  # Bytes received (the partial file may hold more)
+    status = Column(String(20), nullable=False, default='uploading')  # 'uploading', 'receiving', 'finalizing', 'finalized'
+    
+    # Set by finalize
+    target = Column(String(20))  # 'batch', 'plot', 'audit'
+    target_id = Column(Integer)
+    file_path = Column(String(255))
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+    
+    id = Column(Integer, primary_key=True, index=True)  # Sync cursor of the workers' revocation filters
+    jti = Column(String(32), index=True)  # One revoked token (logout)
+    user_id = Column(Integer, index=True)  # All of a user's tokens with tv < token_version
+    token_version = Column(Integer)
+    expires_at = Column(DateTime, nullable=False, index=True)  # Revoked tokens have expired by then
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class UserTokenVersion(Base):
+    __tablename__ = "user_token_versions"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Only ever raised: tokens carry it as tv
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column(String(200), primary_key=True)  # e.g. "login:ip:1.2.3.4", "login:user:farmer1"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)  # Unix time of the last refill
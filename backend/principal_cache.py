@@ -0,0 +1,166 @@
+"""
+Principal cache for Harit Swaraj
+Routes that need the user's profile (get_current_profile) used to load the
+User row on every request. Each worker now keeps the resolved principal (the
+user's profile and role, without the password hash) in a TTL/LRU cache keyed
+by the token subject; tokens without uid / role claims (issued before they
+were added) are resolved through it as well.
+
+- Entries carry the user's version stamp; invalidate() bumps it whenever a
+  profile, role or password changes, so an entry read before the change is
+  never served again (and a lookup racing with the change is not cached)
+- The cache is per worker process: changes made through another worker
+  reach this one after at most PRINCIPAL_CACHE_TTL_S seconds
+- PRINCIPAL_CACHE_SIZE=0 turns the cache off
+- Hit rate and counters at GET /admin/auth/principal-cache
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_S = float(os.getenv("PRINCIPAL_CACHE_TTL_S", "60"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Read-only snapshot of the authenticated user, shared between requests
+    Principals built from token claims only have id, username and role
+    """
+    id: int
+    username: str
+    role: str
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    aadhaar_number: Optional[str] = None
+    address: Optional[str] = None
+    photo_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            full_name=user.full_name,
+            phone_number=user.phone_number,
+            aadhaar_number=user.aadhaar_number,
+            address=user.address,
+            photo_url=user.photo_url,
+            created_at=user.created_at
+        )
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> "Principal":
+        """Identity and role only, from the claims of an access token"""
+        return cls(id=payload["uid"], username=payload["sub"], role=payload["role"])
+
+
+class PrincipalCache:
+    """Thread-safe TTL/LRU cache of principals keyed by (subject, version)"""
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl_s: float = PRINCIPAL_CACHE_TTL_S):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # subject -> (version, expires, principal)
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def version(self, subject: str) -> int:
+        """Current version stamp of a subject; read it before loading the user"""
+        with self._lock:
+            return self._versions.get(subject, 0)
+
+    def get(self, subject: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                self.misses += 1
+                return None
+            version, expires, principal = entry
+            if version != self._versions.get(subject, 0) or expires < time.monotonic():
+                del self._entries[subject]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return principal
+
+    def put(self, subject: str, principal: Principal, version: int):
+        """Cache a principal loaded while the subject had the given version"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self._versions.get(subject, 0):
+                return  # Changed while it was being loaded
+            self._entries[subject] = (version, time.monotonic() + self.ttl_s, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, subject: str):
+        """Drop a subject's entry after its profile, role or password changed"""
+        with self._lock:
+            self._versions[subject] = self._versions.get(subject, 0) + 1
+            self._entries.pop(subject, None)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for subject in self._entries:
+                self._versions[subject] = self._versions.get(subject, 0) + 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_s': self.ttl_s,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+_cache: Optional[PrincipalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_principal_cache() -> PrincipalCache:
+    """Return the worker's principal cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PrincipalCache()
+    return _cache
+
+
+def invalidate_principal(username: str):
+    """Call after changing a user's profile, role or password"""
+    get_principal_cache().invalidate(username)
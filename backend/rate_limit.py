@@ -0,0 +1,226 @@
+"""
+Rate limiting of login and registration for Harit Swaraj
+Every login and registration attempt runs argon2, so a burst of attempts
+can keep all cores busy. Attempts are limited with token buckets before any
+hashing starts:
+
+- Per client IP: AUTH_RATE_LIMIT_IP_PER_MIN attempts a minute, bursts of
+  AUTH_RATE_LIMIT_IP_BURST
+- Per username: AUTH_RATE_LIMIT_USER_PER_MIN / _USER_BURST, against
+  password guessing spread over many addresses
+- Over the limit -> 429 with Retry-After (seconds until the next attempt)
+
+Bucket state:
+- memory (default): per worker process, so the effective limit is the
+  configured one times the number of workers
+- db: shared by all workers through the rate_limit_buckets table, in the
+  main database or in AUTH_RATE_LIMIT_DATABASE_URL (e.g. a SQLite file next
+  to the workers); each attempt is one conditional UPDATE. If the database
+  fails, attempts are let through.
+
+Behind reverse proxies, set AUTH_RATE_LIMIT_PROXY_HOPS to their number
+(e.g. 1 for nginx in front of the workers): the client address is then the
+X-Forwarded-For entry that many places from the right, the one the
+outermost trusted proxy appended. Entries further left come from the client
+and can be forged. Counters are at GET /admin/auth/rate-limit.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import case, create_engine, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import RateLimitBucket
+
+AUTH_RATE_LIMIT_ENABLED = os.getenv("AUTH_RATE_LIMIT_ENABLED", "true").lower() == "true"
+AUTH_RATE_LIMIT_IP_PER_MIN = float(os.getenv("AUTH_RATE_LIMIT_IP_PER_MIN", "20"))
+AUTH_RATE_LIMIT_IP_BURST = float(os.getenv("AUTH_RATE_LIMIT_IP_BURST", "10"))
+AUTH_RATE_LIMIT_USER_PER_MIN = float(os.getenv("AUTH_RATE_LIMIT_USER_PER_MIN", "10"))
+AUTH_RATE_LIMIT_USER_BURST = float(os.getenv("AUTH_RATE_LIMIT_USER_BURST", "5"))
+AUTH_RATE_LIMIT_BACKEND = os.getenv("AUTH_RATE_LIMIT_BACKEND", "memory").lower()
+AUTH_RATE_LIMIT_DATABASE_URL = os.getenv("AUTH_RATE_LIMIT_DATABASE_URL")
+AUTH_RATE_LIMIT_PROXY_HOPS = int(os.getenv("AUTH_RATE_LIMIT_PROXY_HOPS", "0"))
+AUTH_RATE_LIMIT_MAX_KEYS = int(os.getenv("AUTH_RATE_LIMIT_MAX_KEYS", "100000"))
+
+
+class MemoryBuckets:
+    """Token buckets of this worker; least recently used keys are dropped beyond max_keys"""
+    name = "memory"
+
+    def __init__(self, max_keys: int = AUTH_RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate_per_s: float, burst: float) -> float:
+        """Take one token; returns 0 if allowed, else the seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate_per_s)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            return (1 - tokens) / rate_per_s
+
+    def size(self) -> Optional[int]:
+        return len(self._buckets)
+
+
+class DatabaseBuckets:
+    """Token buckets in the rate_limit_buckets table, shared by all workers"""
+    name = "db"
+
+    def __init__(self, database_url: Optional[str] = AUTH_RATE_LIMIT_DATABASE_URL):
+        if database_url:
+            connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+            self.engine = create_engine(database_url, connect_args=connect_args)
+        else:
+            from database import engine
+            self.engine = engine
+        RateLimitBucket.__table__.create(self.engine, checkfirst=True)
+        self._last_cleanup = time.time()
+
+    def take(self, key: str, rate_per_s: float, burst: float) -> float:
+        now = time.time()
+        refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate_per_s
+        refilled = case((refilled > burst, burst), else_=refilled)
+
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.key == key, refilled >= 1)
+                .values(tokens=refilled - 1, updated_at=now)
+            )
+            if result.rowcount:
+                return 0.0
+            row = conn.execute(
+                RateLimitBucket.__table__.select().where(RateLimitBucket.key == key)
+            ).first()
+
+        if row is None:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(RateLimitBucket.__table__.insert().values(
+                        key=key, tokens=burst - 1, updated_at=now))
+                self._cleanup(now, burst / rate_per_s)
+                return 0.0
+            except IntegrityError:
+                return self.take(key, rate_per_s, burst)  # Another worker created it first
+
+        tokens = min(burst, row.tokens + (now - row.updated_at) * rate_per_s)
+        return max((1 - tokens) / rate_per_s, 0.001)
+
+    def _cleanup(self, now: float, refill_s: float):
+        """Every few minutes, delete buckets that have refilled completely"""
+        if now - self._last_cleanup < 300:
+            return
+        self._last_cleanup = now
+        with self.engine.begin() as conn:
+            conn.execute(RateLimitBucket.__table__.delete().where(RateLimitBucket.updated_at < now - refill_s))
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class AuthRateLimiter:
+    """Per-IP and per-username limits for login and registration"""
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or (DatabaseBuckets() if AUTH_RATE_LIMIT_BACKEND == "db" else MemoryBuckets())
+        self.limits = {
+            'ip': (AUTH_RATE_LIMIT_IP_PER_MIN / 60, AUTH_RATE_LIMIT_IP_BURST),
+            'user': (AUTH_RATE_LIMIT_USER_PER_MIN / 60, AUTH_RATE_LIMIT_USER_BURST)
+        }
+        self._lock = threading.Lock()
+        self.allowed: Dict[str, int] = {}
+        self.throttled: Dict[str, int] = {}
+        self.errors = 0
+
+    def _count(self, counter: Dict[str, int], key: str):
+        with self._lock:
+            counter[key] = counter.get(key, 0) + 1
+
+    def check(self, action: str, client_ip: str, username: str) -> float:
+        """
+        Take one attempt from the client's and the username's bucket
+        Returns 0 if allowed, else the seconds to wait
+        """
+        for scope, value in (('ip', client_ip), ('user', username.strip().lower())):
+            rate_per_s, burst = self.limits[scope]
+            try:
+                wait_s = self.buckets.take(f"{action}:{scope}:{value}", rate_per_s, burst)
+            except SQLAlchemyError as e:
+                self.errors += 1
+                print(f"⚠️ Rate limit state unavailable, attempt allowed: {e}")
+                continue
+            if wait_s > 0:
+                self._count(self.throttled, f"{action}:{scope}")
+                return wait_s
+        self._count(self.allowed, action)
+        return 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': AUTH_RATE_LIMIT_ENABLED,
+                'backend': self.buckets.name,
+                'buckets': self.buckets.size(),
+                'limits': {
+                    'ip': {'per_min': AUTH_RATE_LIMIT_IP_PER_MIN, 'burst': AUTH_RATE_LIMIT_IP_BURST},
+                    'user': {'per_min': AUTH_RATE_LIMIT_USER_PER_MIN, 'burst': AUTH_RATE_LIMIT_USER_BURST}
+                },
+                'allowed': dict(self.allowed),
+                'throttled': dict(self.throttled),
+                'errors': self.errors
+            }
+
+
+_limiter: Optional[AuthRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_auth_rate_limiter() -> AuthRateLimiter:
+    """Return the worker's login / registration rate limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AuthRateLimiter()
+    return _limiter
+
+
+def client_ip(request: Request, proxy_hops: int = AUTH_RATE_LIMIT_PROXY_HOPS) -> str:
+    """Client address, from X-Forwarded-For as written by proxy_hops trusted proxies"""
+    if proxy_hops > 0:
+        forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",")
+                     if entry.strip()]
+        if forwarded:
+            return forwarded[max(0, len(forwarded) - proxy_hops)]
+    return request.client.host if request.client else "unknown"
+
+
+def enforce_auth_rate_limit(request: Request, action: str, username: str):
+    """
+    Raise 429 with Retry-After if this login / registration attempt is over
+    the limit. Blocking with the db backend: call through run_in_threadpool.
+    """
+    if not AUTH_RATE_LIMIT_ENABLED:
+        return
+    wait_s = get_auth_rate_limiter().check(action, client_ip(request), username)
+    if wait_s > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(max(1, math.ceil(wait_s)))}
+        )
@@ -4,6 +4,9 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models import User
 from auth import get_current_user
+from principal_cache import get_principal_cache
+from token_revocation import get_revocation_filter
+from rate_limit import get_auth_rate_limiter
 from populate_sample_data import (
     clear_existing_data,
     create_sample_plots,
@@ -15,6 +18,15 @@ from populate_sample_data import (
     create_sample_applications,
     create_sample_audits
 )
+try:
+    from ml.manufacturing_anomaly import get_anomaly_detector
+    from ml.plot_verification import get_plot_verifier
+except ImportError:
+    from ml.mock_ml import get_anomaly_detector, get_plot_verifier
+try:
+    from cv.worker import get_cv_executor
+except ImportError:
+    get_cv_executor = None
 
 router = APIRouter(
     prefix="/admin",
@@ -77,3 +89,99 @@ async def populate_sample_data(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to populate data: {str(e)}"
         )
+
+
+@router.get("/ml/shadow-stats")
+async def get_shadow_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Shadow-mode comparison of candidate ML models against production models:
+    per-model inference latency histograms and status agreement rates.
+    Only accessible by users with 'admin' role.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can perform this action"
+        )
+    
+    stats = {}
+    for name, model in [
+        ("manufacturing_anomaly", get_anomaly_detector()),
+        ("plot_verification", get_plot_verifier())
+    ]:
+        shadow = getattr(model, "shadow", None)
+        stats[name] = {"enabled": False} if shadow is None else {"enabled": True, **shadow.stats()}
+    
+    return stats
+
+@router.get("/cv/metrics")
+async def get_cv_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Background CV worker pool metrics: queue length, throughput counters
+    and per-photo analysis latency histogram.
+    Only accessible by users with 'admin' role.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can perform this action"
+        )
+    
+    if get_cv_executor is None:
+        return {"enabled": False}
+    
+    return {"enabled": True, **get_cv_executor().metrics()}
+
+@router.get("/auth/principal-cache")
+async def get_principal_cache_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Principal cache of this worker: hit rate, size and invalidations.
+    Only accessible by users with 'admin' role.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can perform this action"
+        )
+    
+    return get_principal_cache().stats()
+
+@router.get("/auth/revocations")
+async def get_revocation_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Token revocation filter of this worker: revoked tokens and users,
+    bloom filter fill, checks and rejections, table polls.
+    Only accessible by users with 'admin' role.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can perform this action"
+        )
+    
+    return get_revocation_filter().stats()
+
+@router.get("/auth/rate-limit")
+async def get_rate_limit_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Login / registration rate limiter of this worker: allowed attempts and
+    throttled attempts by action and scope (ip / user).
+    Only accessible by users with 'admin' role.
+    """
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can perform this action"
+        )
+    
+    return get_auth_rate_limiter().stats()
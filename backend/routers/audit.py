@@ -1,20 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from datetime import datetime
 import json
+import os
 
 from database import get_db
-from models import User, Audit, Plot
+from models import (User, Audit, Plot, ManufacturingBatch, UnburnableProcess,
+                    Distribution, BiocharApplication)
 from schemas import AuditResponse
 from auth import get_current_user
-from file_storage import save_photo
+from file_storage import save_photo, get_file_path
+try:
+    from cv.worker import schedule_photo_analysis, get_cv_executor
+    from cv.biochar_batch import detect_biochar_batch
+except ImportError:
+    schedule_photo_analysis = None
+    get_cv_executor = None
+    detect_biochar_batch = None
 
 router = APIRouter(
     prefix="/audit",
     tags=["Independent Audit"]
 )
 
+# Photos scored per /plants/{owner_id}/biochar-review call (page size limit)
+BIOCHAR_REVIEW_MAX_PHOTOS = int(os.getenv("BIOCHAR_REVIEW_MAX_PHOTOS", "100"))
+
 @router.post("/submit", response_model=AuditResponse, status_code=status.HTTP_201_CREATED)
 async def submit_audit(
     type: str = Form(..., description="'field', 'manufacturing', 'application'"),
@@ -51,7 +64,8 @@ async def submit_audit(
     photo_paths = []
     if photos:
         for idx, photo in enumerate(photos):
-            path = await save_photo(photo, f"audit_{type}_{current_user.id}_{datetime.now().timestamp()}_{idx}")
+            path = await save_photo(photo, f"audit_{type}_{current_user.id}_{datetime.now().timestamp()}_{idx}",
+                                    user_id=current_user.id)
             photo_paths.append(path)
             
     # Parse JSON fields if provided
@@ -78,6 +92,12 @@ async def submit_audit(
     db.add(audit)
     db.commit()
     db.refresh(audit)
+    
+    # Analyse photos in the background CV worker pool
+    if schedule_photo_analysis:
+        for path in photo_paths:
+            schedule_photo_analysis(path, 'audit', audit.id)
+    
     return audit
 
 @router.get("/list", response_model=List[AuditResponse])
@@ -91,6 +111,95 @@ async def list_audits(
         return db.query(Audit).all()
     raise HTTPException(status_code=403, detail="Not authorized")
 
+@router.get("/plants/{owner_id}/biochar-review")
+async def review_plant_biochar(
+    owner_id: int,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(BIOCHAR_REVIEW_MAX_PHOTOS, ge=1, le=BIOCHAR_REVIEW_MAX_PHOTOS),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Score the batch, unburnable and application photos of a biochar plant
+    for biochar presence in one batched pass, strongest evidence first
+    (Auditor/Admin)
+    
+    Photos are paged (in batch, unburnable, application order by record id)
+    with offset / limit, at most BIOCHAR_REVIEW_MAX_PHOTOS per call; ranks
+    and totals cover the requested page, next_offset is null on the last one.
+    """
+    if current_user.role not in ['auditor', 'admin']:
+        raise HTTPException(status_code=403, detail="Only auditors can review plants")
+    
+    owner = db.query(User).filter(User.id == owner_id, User.role == 'owner').first()
+    if not owner:
+        raise HTTPException(status_code=404, detail="Plant owner not found")
+    
+    if detect_biochar_batch is None:
+        raise HTTPException(status_code=503, detail="Computer vision module is not available")
+    
+    # (photo_path, source, record_id, batch_id) for every photo of the plant
+    photos = []
+    batch_ids = []
+    for batch in db.query(ManufacturingBatch).filter(ManufacturingBatch.user_id == owner_id) \
+            .order_by(ManufacturingBatch.id):
+        batch_ids.append(batch.id)
+        if batch.photo_path:
+            photos.append((batch.photo_path, 'batch', batch.id, batch.id))
+    for process in db.query(UnburnableProcess).filter(UnburnableProcess.batch_id.in_(batch_ids)) \
+            .order_by(UnburnableProcess.id):
+        if process.photo_path:
+            photos.append((process.photo_path, 'unburnable', process.id, process.batch_id))
+    for application, batch_id in db.query(BiocharApplication, Distribution.batch_id) \
+            .join(Distribution, BiocharApplication.distribution_id == Distribution.id) \
+            .filter(Distribution.batch_id.in_(batch_ids)) \
+            .order_by(BiocharApplication.id):
+        if application.photo_path:
+            photos.append((application.photo_path, 'application', application.id, batch_id))
+    
+    total_photos = len(photos)
+    photos = photos[offset:offset + limit]
+    # May download from object storage: off the event loop
+    file_paths = await run_in_threadpool(lambda: [get_file_path(photo[0]) for photo in photos])
+    available = list(zip(photos, file_paths))
+    missing = [photo[0] for photo, file_path in available if not file_path]
+    available = [(photo, file_path) for photo, file_path in available if file_path]
+    
+    detections = []
+    if available:
+        detections = await get_cv_executor().run(
+            detect_biochar_batch, [file_path for _, file_path in available]
+        )
+    
+    results = []
+    for (photo_path, source, record_id, batch_id), detection in zip((p for p, _ in available), detections):
+        detection.pop('path', None)
+        results.append({
+            'photo_path': photo_path,
+            'source': source,
+            'record_id': record_id,
+            'batch_id': batch_id,
+            **detection
+        })
+    results.sort(key=lambda r: ('error' in r, -r.get('biochar_confidence', 0.0), -r.get('dark_pixel_ratio', 0.0)))
+    for rank, result in enumerate(results, 1):
+        result['rank'] = rank
+    
+    scored = [r for r in results if 'error' not in r]
+    return {
+        'owner_id': owner.id,
+        'plant': owner.full_name or owner.username,
+        'total_photos': total_photos,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + limit if offset + limit < total_photos else None,
+        'photos_reviewed': len(scored),
+        'with_biochar': sum(1 for r in scored if r['biochar_detected']),
+        'mean_confidence': round(sum(r['biochar_confidence'] for r in scored) / len(scored), 4) if scored else None,
+        'missing_files': missing,
+        'results': results
+    }
+
 @router.get("/{id}", response_model=AuditResponse)
 async def get_audit(
     id: int,
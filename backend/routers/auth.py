@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from datetime import datetime, timedelta
 import os, shutil, uuid
 
 from database import get_db
 from models import User
 from schemas import UserRegister, UserLogin, Token, UserResponse, ProfileUpdate
 from auth import (
-    authenticate_user, create_access_token, get_current_user, hash_password
+    ACCESS_TOKEN_EXPIRE_MINUTES, authenticate_user, create_user_token, get_current_user,
+    get_current_profile, get_token_payload, hash_password_async
 )
+from principal_cache import invalidate_principal
+from token_revocation import revoke_token, revoke_user_tokens
+from rate_limit import enforce_auth_rate_limit
 
 router = APIRouter(
     prefix="/auth",
@@ -19,7 +24,9 @@ UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads",
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, request: Request, db: Session = Depends(get_db)):
+    await run_in_threadpool(enforce_auth_rate_limit, request, "register", user_data.username)
+    
     if db.query(User).filter(User.username == user_data.username).first():
         raise HTTPException(status_code=400, detail="Username taken")
         
@@ -29,7 +36,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     new_user = User(
         username=user_data.username,
         email=user_data.email,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password_async(user_data.password),
         role=user_data.role,
         full_name=user_data.full_name
     )
@@ -37,7 +44,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(new_user)
     
-    access_token = create_access_token(data={"sub": new_user.username})
+    access_token = create_user_token(db, new_user)
     return {
         "access_token": access_token, 
         "token_type": "bearer",
@@ -55,12 +62,13 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=Token)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, credentials.username, credentials.password)
+async def login(credentials: UserLogin, request: Request, db: Session = Depends(get_db)):
+    await run_in_threadpool(enforce_auth_rate_limit, request, "login", credentials.username)
+    user = await authenticate_user(db, credentials.username, credentials.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
         
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_user_token(db, user)
     return {
         "access_token": access_token, 
         "token_type": "bearer",
@@ -77,8 +85,22 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
         }
     }
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(payload: dict = Depends(get_token_payload), db: Session = Depends(get_db)):
+    """Revoke the token of this request"""
+    if payload.get("jti"):
+        revoke_token(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Revoke every token issued to the current user, on all devices"""
+    revoke_user_tokens(db, current_user.id, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
 @router.get("/me", response_model=UserResponse)
-async def get_my_info(current_user: User = Depends(get_current_user)):
+async def get_my_info(current_user: User = Depends(get_current_profile)):
     return current_user
 
 @router.put("/profile", response_model=UserResponse)
@@ -100,6 +122,7 @@ async def update_profile(
         user.address = profile_data.address
         
     db.commit()
+    invalidate_principal(user.username)
     db.refresh(user)
     return user
 
@@ -107,7 +130,7 @@ async def update_profile(
 async def upload_profile_photo(
     photo: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_profile)
 ):
     """Upload a profile photo for the current user"""
     # Validate file type
@@ -134,5 +157,6 @@ async def upload_profile_photo(
     user = db.query(User).filter(User.id == current_user.id).first()
     user.photo_url = f"/uploads/profile_photos/{filename}"
     db.commit()
+    invalidate_principal(user.username)
     db.refresh(user)
     return user
@@ -0,0 +1,289 @@
+"""
+Bundle upload of offline-collected field data
+A field officer's day of plots (KML boundary and photos) and harvests is
+sent as one zip instead of one request per record:
+
+    manifest.json
+    PLT-101/boundary.kml
+    PLT-101/1.jpg
+    HB-101/side1.jpg
+
+manifest.json (see schemas.BundleManifest):
+    {
+      "plots": [{"plot_id": "PLT-101", "type": "Wood", "species": "Teak",
+                 "area": 2.5, "expected_biomass": 4.0, "village": "...",
+                 "kml": "PLT-101/boundary.kml", "photos": ["PLT-101/1.jpg"]}],
+      "harvests": [{"biomass_batch_id": "HB-101", "plot_id": "PLT-101",
+                    "actual_harvested_ton": 1.5, "photo_1": "HB-101/side1.jpg"}]
+    }
+
+- Zip members are streamed chunk by chunk from the uploaded archive into the
+  content-addressed store through save_photo / save_kml (same size limits
+  and GPS check as the single-record routes); nothing is unpacked to disk
+  or memory as a whole
+- Every item is validated on its own (missing files, duplicate IDs, unknown
+  plots, rejected photos) and gets a result; the records of all valid items
+  are created in one transaction
+- Plot verification, photo analysis and derivatives run in the background;
+  bundled plots stay 'pending' until their verification has run
+"""
+import json
+import mimetypes
+import os
+import threading
+import zipfile
+import zlib
+from typing import Dict, List
+
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+
+from database import SessionLocal, get_db
+from models import User, Plot, PlotPhoto, BiomassHarvest
+from schemas import BundleManifest, BundleUploadResponse
+from auth import get_current_user
+from file_storage import StoredPath, save_photo, save_kml, get_file_path, delete_file
+from routers.plot import plot_verifier, sanitize_for_json
+try:
+    from cv.worker import schedule_photo_analysis
+except ImportError:
+    schedule_photo_analysis = None
+
+BUNDLE_MAX_SIZE_MB = int(os.getenv("BUNDLE_MAX_SIZE_MB", "500"))
+MANIFEST_NAME = "manifest.json"
+MAX_MANIFEST_BYTES = 1024 * 1024
+
+# The plot verifier keeps its comparison history in memory
+_verify_lock = threading.Lock()
+
+router = APIRouter(
+    prefix="/bundles",
+    tags=["Bundle Upload"]
+)
+
+
+class BundleItemError(Exception):
+    pass
+
+
+async def _save_member(archive: zipfile.ZipFile, name: str, save, prefix: str, user_id: int) -> StoredPath:
+    """Stream one zip member into the upload store with save_photo / save_kml, as user_id's upload"""
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        raise BundleItemError(f"File '{name}' is not in the bundle")
+
+    try:
+        with archive.open(info) as member:
+            upload = UploadFile(
+                member,
+                filename=os.path.basename(name),
+                size=info.file_size,
+                headers=Headers({"content-type": mimetypes.guess_type(name)[0] or "application/octet-stream"})
+            )
+            return await save(upload, prefix, user_id=user_id)
+    except HTTPException as e:
+        raise BundleItemError(e.detail)
+    except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError) as e:
+        raise BundleItemError(f"Could not read '{name}' from the bundle: {e}")
+
+
+def verify_bundle_plots(plot_ids: List[int]):
+    """Run plot verification for bundled plots (background task)"""
+    db = SessionLocal()
+    try:
+        for plot_id in plot_ids:
+            plot = db.query(Plot).filter(Plot.id == plot_id).first()
+            kml_file = get_file_path(plot.kml_file_path) if plot else None
+            if not kml_file:
+                continue
+            try:
+                with open(kml_file, 'rb') as f:
+                    kml_content = f.read().decode('utf-8', errors='ignore')
+                with _verify_lock:
+                    verification = plot_verifier.verify_plot(kml_content, str(plot.owner_id), plot.plot_id)
+            except Exception as e:
+                print(f"⚠️ Verification failed for bundled plot {plot.plot_id}: {e}")
+                continue
+            plot.status = "verified" if verification.get("plot_status") == "verified" else "suspicious"
+            plot.verification_data = sanitize_for_json(verification)
+            db.commit()
+    finally:
+        db.close()
+
+
+@router.post("/upload", response_model=BundleUploadResponse)
+async def upload_bundle(
+    background_tasks: BackgroundTasks,
+    bundle: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Register plots and harvests collected offline from one zip with a
+    manifest.json (Farmer/Owner). Returns a result per item.
+    """
+    if current_user.role not in ['farmer', 'owner']:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    if bundle.size is not None and bundle.size > BUNDLE_MAX_SIZE_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"Bundle is larger than the {BUNDLE_MAX_SIZE_MB} MB limit")
+
+    try:
+        archive = zipfile.ZipFile(bundle.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Bundle is not a valid zip file")
+
+    with archive:
+        try:
+            info = archive.getinfo(MANIFEST_NAME)
+            if info.file_size > MAX_MANIFEST_BYTES:
+                raise HTTPException(status_code=400, detail=f"{MANIFEST_NAME} is too large")
+            with archive.open(info) as f:
+                manifest = BundleManifest.model_validate(json.loads(f.read(MAX_MANIFEST_BYTES)))
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Bundle has no {MANIFEST_NAME}")
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid {MANIFEST_NAME}: {e}")
+
+        errors: Dict[int, str] = {}
+        stored: Dict[int, List[StoredPath]] = {}
+
+        def fail(index: int, message: str):
+            errors.setdefault(index, message)
+
+        # Plots: IDs must be new, then KML and photos are stored
+        plot_codes = [item.plot_id for item in manifest.plots]
+        taken = {code for (code,) in db.query(Plot.plot_id).filter(Plot.plot_id.in_(plot_codes))}
+        seen = set()
+        for index, item in enumerate(manifest.plots):
+            if item.plot_id in taken or item.plot_id in seen:
+                fail(index, "Plot ID already exists")
+            seen.add(item.plot_id)
+            if index in errors:
+                continue
+            paths = stored.setdefault(index, [])
+            try:
+                for photo_index, name in enumerate(item.photos):
+                    paths.append(await _save_member(archive, name, save_photo, f"{item.plot_id}_{photo_index}",
+                                                    current_user.id))
+                paths.append(await _save_member(archive, item.kml, save_kml, item.plot_id, current_user.id))
+            except BundleItemError as e:
+                fail(index, str(e))
+
+        # Harvests: plot from this bundle (if it succeeded) or already registered
+        valid_plots = {item.plot_id for index, item in enumerate(manifest.plots) if index not in errors}
+        known_plots = {code: plot_id for code, plot_id in db.query(Plot.plot_id, Plot.id).filter(
+            Plot.plot_id.in_([item.plot_id for item in manifest.harvests]))}
+        batch_ids = [item.biomass_batch_id for item in manifest.harvests]
+        taken = {batch_id for (batch_id,) in db.query(BiomassHarvest.biomass_batch_id)
+                 .filter(BiomassHarvest.biomass_batch_id.in_(batch_ids))}
+        seen = set()
+        offset = len(manifest.plots)
+        for position, item in enumerate(manifest.harvests):
+            index = offset + position
+            if item.biomass_batch_id in taken or item.biomass_batch_id in seen:
+                fail(index, "Biomass batch ID already exists")
+            elif item.plot_id not in known_plots and item.plot_id not in valid_plots:
+                fail(index, f"Plot '{item.plot_id}' not found")
+            seen.add(item.biomass_batch_id)
+            if index in errors:
+                continue
+            paths = stored.setdefault(index, [])
+            try:
+                for side, name in ((1, item.photo_1), (2, item.photo_2)):
+                    paths.append(await _save_member(archive, name, save_photo,
+                                                    f"harvest_{item.biomass_batch_id}_{side}", current_user.id)
+                                 if name else None)
+            except BundleItemError as e:
+                fail(index, str(e))
+
+    # All records of valid items in one transaction
+    plots: Dict[int, Plot] = {}
+    harvests: Dict[int, BiomassHarvest] = {}
+    try:
+        for index, item in enumerate(manifest.plots):
+            if index in errors:
+                continue
+            *photo_paths, kml_path = stored[index]
+            plot = Plot(
+                plot_id=item.plot_id,
+                owner_id=current_user.id,
+                type=item.type,
+                species=item.species,
+                area=item.area,
+                expected_biomass=item.expected_biomass,
+                survey_number=item.survey_number,
+                village=item.village,
+                taluka=item.taluka,
+                district=item.district,
+                status="pending",
+                kml_file_path=kml_path
+            )
+            plot.photos = [
+                PlotPhoto(photo_path=path, photo_index=photo_index, has_gps=0)
+                for photo_index, path in enumerate(photo_paths)
+            ]
+            db.add(plot)
+            plots[index] = plot
+        db.flush()
+
+        new_plot_ids = {plot.plot_id: plot.id for plot in plots.values()}
+        for position, item in enumerate(manifest.harvests):
+            index = offset + position
+            if index in errors:
+                continue
+            photo_path_1, photo_path_2 = stored[index]
+            harvest = BiomassHarvest(
+                biomass_batch_id=item.biomass_batch_id,
+                plot_id=new_plot_ids.get(item.plot_id) or known_plots[item.plot_id],
+                actual_harvested_ton=item.actual_harvested_ton,
+                photo_path_1=photo_path_1,
+                photo_path_2=photo_path_2,
+                user_id=current_user.id
+            )
+            db.add(harvest)
+            harvests[index] = harvest
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        for paths in stored.values():
+            for path in paths:
+                if path:
+                    await run_in_threadpool(delete_file, path)
+        raise HTTPException(status_code=409, detail="Bundle could not be saved (records changed meanwhile), retry")
+
+    # Files of failed items are not referenced by anything
+    for index in errors:
+        for path in stored.get(index, []):
+            if path:
+                await run_in_threadpool(delete_file, path)
+
+    results = []
+    for index, item in enumerate(manifest.plots):
+        plot = plots.get(index)
+        results.append({"kind": "plot", "key": item.plot_id, "status": "created" if plot else "failed",
+                        "id": plot.id if plot else None, "error": errors.get(index)})
+    for position, item in enumerate(manifest.harvests):
+        harvest = harvests.get(offset + position)
+        results.append({"kind": "harvest", "key": item.biomass_batch_id,
+                        "status": "created" if harvest else "failed",
+                        "id": harvest.id if harvest else None, "error": errors.get(offset + position)})
+
+    # Verification and CV analysis in the background
+    if plots:
+        background_tasks.add_task(verify_bundle_plots, [plot.id for plot in plots.values()])
+    if schedule_photo_analysis:
+        for index, plot in plots.items():
+            for path in stored[index][:-1]:
+                schedule_photo_analysis(path, 'plot', plot.id)
+        for index, harvest in harvests.items():
+            for path in stored[index]:
+                schedule_photo_analysis(path, 'harvest', harvest.id)
+
+    created = len(plots) + len(harvests)
+    return {"created": created, "failed": len(results) - created, "items": results}
@@ -8,6 +8,10 @@ from models import User, Distribution, BiocharApplication, ManufacturingBatch
 from schemas import DistributionResponse, ApplicationResponse, DistributionUpdate
 from auth import get_current_user
 from file_storage import save_photo, save_kml
+try:
+    from cv.worker import schedule_photo_analysis
+except ImportError:
+    schedule_photo_analysis = None
 
 router = APIRouter(
     prefix="/distribution",
@@ -70,8 +74,8 @@ async def record_application(
     if not dist:
         raise HTTPException(status_code=400, detail=f"Distribution ID '{distribution_id}' not found")
         
-    photo_path = await save_photo(photo, f"application_{dist.id}")
-    kml_path = await save_kml(kml_file, f"application_{dist.id}")
+    photo_path = await save_photo(photo, f"application_{dist.id}", user_id=current_user.id)
+    kml_path = await save_kml(kml_file, f"application_{dist.id}", user_id=current_user.id)
     
     app = BiocharApplication(
         distribution_id=dist.id,
@@ -83,6 +87,11 @@ async def record_application(
     db.add(app)
     db.commit()
     db.refresh(app)
+    
+    # Analyse photo in the background CV worker pool
+    if schedule_photo_analysis:
+        schedule_photo_analysis(photo_path, 'application', app.id)
+    
     return app
 
 @router.get("/list", response_model=List[DistributionResponse])
@@ -185,7 +194,7 @@ async def record_unburnable(
     if not batch:
         raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
 
-    photo_path = await save_photo(photo, f"unburnable_{batch_id}")
+    photo_path = await save_photo(photo, f"unburnable_{batch_id}", user_id=current_user.id)
     
     from models import UnburnableProcess
     unburn = UnburnableProcess(
@@ -198,4 +207,8 @@ async def record_unburnable(
     
     db.add(unburn)
     db.commit()
+    
+    if schedule_photo_analysis:
+        schedule_photo_analysis(photo_path, 'unburnable', unburn.id)
+    
     return {"status": "certified", "batch_id": batch_id, "message": "Sequestration permanence verified"}
@@ -8,6 +8,10 @@ from models import User, Plot, BiomassHarvest, BiomassPreprocessing
 from schemas import HarvestResponse, PreprocessingResponse, HarvestUpdate
 from auth import get_current_user
 from file_storage import save_photo
+try:
+    from cv.worker import schedule_photo_analysis
+except ImportError:
+    schedule_photo_analysis = None
 
 router = APIRouter(
     prefix="/harvest",
@@ -37,8 +41,8 @@ async def create_harvest(
         raise HTTPException(status_code=404, detail="Plot not found")
     
     # Save photos if provided
-    photo_path_1 = await save_photo(photo_1, f"harvest_{biomass_batch_id}_1") if photo_1 and photo_1.filename else None
-    photo_path_2 = await save_photo(photo_2, f"harvest_{biomass_batch_id}_2") if photo_2 and photo_2.filename else None
+    photo_path_1 = await save_photo(photo_1, f"harvest_{biomass_batch_id}_1", user_id=current_user.id) if photo_1 and photo_1.filename else None
+    photo_path_2 = await save_photo(photo_2, f"harvest_{biomass_batch_id}_2", user_id=current_user.id) if photo_2 and photo_2.filename else None
     
     new_harvest = BiomassHarvest(
         biomass_batch_id=biomass_batch_id,
@@ -52,6 +56,12 @@ async def create_harvest(
     db.add(new_harvest)
     db.commit()
     db.refresh(new_harvest)
+    
+    # Analyse photos in the background CV worker pool
+    if schedule_photo_analysis:
+        schedule_photo_analysis(photo_path_1, 'harvest', new_harvest.id)
+        schedule_photo_analysis(photo_path_2, 'harvest', new_harvest.id)
+    
     return new_harvest
 
 @router.get("/list", response_model=List[HarvestResponse])
@@ -144,8 +154,8 @@ async def preprocess_biomass(
     if not harvest:
         raise HTTPException(status_code=400, detail=f"Harvest ID '{harvest_id}' not found")
         
-    photo_before_path = await save_photo(photo_before, f"preprocess_{harvest.id}_before") if photo_before and photo_before.filename else None
-    photo_after_path = await save_photo(photo_after, f"preprocess_{harvest.id}_after") if photo_after and photo_after.filename else None
+    photo_before_path = await save_photo(photo_before, f"preprocess_{harvest.id}_before", user_id=current_user.id) if photo_before and photo_before.filename else None
+    photo_after_path = await save_photo(photo_after, f"preprocess_{harvest.id}_after", user_id=current_user.id) if photo_after and photo_after.filename else None
     
     preprocess = BiomassPreprocessing(
         harvest_id=harvest.id,
@@ -157,4 +167,9 @@ async def preprocess_biomass(
     db.add(preprocess)
     db.commit()
     db.refresh(preprocess)
+    
+    if schedule_photo_analysis:
+        schedule_photo_analysis(photo_before_path, 'preprocessing', preprocess.id)
+        schedule_photo_analysis(photo_after_path, 'preprocessing', preprocess.id)
+    
     return preprocess
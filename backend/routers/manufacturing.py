@@ -4,10 +4,15 @@ from typing import Optional, List
 from datetime import datetime
 
 from database import get_db
-from models import User, ManufacturingBatch, UnburnableProcess
+from models import User, ManufacturingBatch, UnburnableProcess, VideoAnalysis
 from schemas import BatchResponse, UnburnableMethodResponse, BatchUpdate
 from auth import get_current_user
 from file_storage import save_video, save_photo
+try:
+    from cv.worker import schedule_photo_analysis, schedule_video_analysis
+except ImportError:
+    schedule_photo_analysis = None
+    schedule_video_analysis = None
 try:
     from ml.manufacturing_anomaly import get_anomaly_detector
 except ImportError:
@@ -57,8 +62,8 @@ async def create_manufacturing_batch(
 
     final_status = "flagged" if (rule_status == "flagged" or ml_prediction.get("ml_status") == "flagged") else "verified"
     
-    video_path = await save_video(video, batch_id) if video else None
-    photo_path = await save_photo(photo, f"batch_{batch_id}") if photo else None
+    video_path = await save_video(video, batch_id, user_id=current_user.id) if video else None
+    photo_path = await save_photo(photo, f"batch_{batch_id}", user_id=current_user.id) if photo else None
     
     new_batch = ManufacturingBatch(
         batch_id=batch_id,
@@ -79,6 +84,13 @@ async def create_manufacturing_batch(
     db.add(new_batch)
     db.commit()
     db.refresh(new_batch)
+    
+    # Analyse photo and kiln video in the background CV worker pool
+    if schedule_photo_analysis:
+        schedule_photo_analysis(photo_path, 'batch', new_batch.id)
+    if schedule_video_analysis:
+        schedule_video_analysis(video_path, new_batch.id)
+    
     return new_batch
 
 @router.get("/batches", response_model=List[BatchResponse])
@@ -107,6 +119,37 @@ async def get_batch(
         
     return batch
 
+@router.get("/batches/{id}/video-analysis")
+async def get_batch_video_analysis(
+    id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Keyframe analysis summary of the batch's kiln video
+    (flame/smoke/char phases, frame quality, biochar at the end of the burn)
+    """
+    batch = db.query(ManufacturingBatch).filter(ManufacturingBatch.id == id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+        
+    if current_user.role == 'owner' and batch.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this batch")
+    
+    if not batch.video_path:
+        raise HTTPException(status_code=404, detail="Batch has no video")
+    
+    analysis = db.query(VideoAnalysis).filter(VideoAnalysis.video_path == batch.video_path).first()
+    if not analysis:
+        return {"batch_id": batch.id, "video_path": batch.video_path, "status": "pending"}
+    
+    return {
+        "batch_id": batch.id,
+        "video_path": batch.video_path,
+        "status": "analysed",
+        **analysis.summary
+    }
+
 @router.put("/batches/{id}", response_model=BatchResponse)
 async def update_batch(
     id: int,
@@ -178,7 +221,7 @@ async def process_unburnable(
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
         
-    photo_path = await save_photo(photo, f"unburnable_{batch_id}")
+    photo_path = await save_photo(photo, f"unburnable_{batch_id}", user_id=current_user.id)
     
     process = UnburnableProcess(
         batch_id=batch_id,
@@ -191,4 +234,8 @@ async def process_unburnable(
     db.add(process)
     db.commit()
     db.refresh(process)
+    
+    if schedule_photo_analysis:
+        schedule_photo_analysis(photo_path, 'unburnable', process.id)
+    
     return process
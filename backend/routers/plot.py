@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from datetime import datetime
@@ -8,6 +9,10 @@ from models import User, Plot, PlotPhoto
 from schemas import PlotResponse, PlotUpdate
 from auth import get_current_user
 from file_storage import save_photo, save_kml, get_file_path
+try:
+    from cv.worker import schedule_photo_analysis
+except ImportError:
+    schedule_photo_analysis = None
 try:
     from ml.plot_verification import get_plot_verifier
 except ImportError:
@@ -41,6 +46,11 @@ router = APIRouter(
     tags=["Biomass Plots"]
 )
 
+def read_kml(kml_path: str) -> bytes:
+    """Read a stored KML file (may download it from object storage)"""
+    with open(get_file_path(kml_path), 'rb') as f:
+        return f.read()
+
 @router.post("/register-plot", status_code=status.HTTP_201_CREATED)
 async def register_plot(
     plot_id: str = Form(...),
@@ -69,10 +79,17 @@ async def register_plot(
     if db.query(Plot).filter(Plot.plot_id == plot_id).first():
         raise HTTPException(status_code=400, detail="Plot ID already exists")
 
+    # Save photos first, so a rejected photo (e.g. no GPS) leaves no plot behind
+    photos = [photo_0, photo_1, photo_2, photo_3]
+    photo_paths = []
+    for idx, photo in enumerate(photos):
+        if photo:
+            photo_paths.append((idx, await save_photo(photo, f"{plot_id}_{idx}", user_id=current_user.id)))
+
     # Save KML
-    kml_path = await save_kml(kml_file, plot_id)
-    await kml_file.seek(0)
-    kml_content = await kml_file.read()
+    kml_path = await save_kml(kml_file, plot_id, user_id=current_user.id)
+    # Read back from storage: the part may have been a reference to stored content
+    kml_content = await run_in_threadpool(read_kml, kml_path)
     
     # Verify Plot
     verification = plot_verifier.verify_plot(kml_content.decode('utf-8', errors='ignore'), str(current_user.id), plot_id)
@@ -98,66 +115,20 @@ async def register_plot(
     db.commit()
     db.refresh(new_plot)
     
-    # Import CV analyzer for GPS extraction
-    try:
-        from cv.cv_analyzer import extract_exif
-    except ImportError:
-        extract_exif = None
-    
-    # Process photos and extract GPS
-    photos = [photo_0, photo_1, photo_2, photo_3]
-    gps_coordinates_list = []
-    
-    for idx, photo in enumerate(photos):
-        if photo:
-            path = await save_photo(photo, f"{plot_id}_{idx}")
-            
-            # Extract GPS from photo
-            has_gps_data = False
-            gps_lat = None
-            gps_lon = None
-            photo_ts = None
-            
-            if extract_exif:
-                try:
-                    exif_info = extract_exif(path)
-                    if exif_info.get('has_gps') and exif_info.get('gps_coordinates'):
-                        has_gps_data = True
-                        gps_lat = exif_info['gps_coordinates'][0]
-                        gps_lon = exif_info['gps_coordinates'][1]
-                        photo_ts = exif_info.get('timestamp')
-                        gps_coordinates_list.append(exif_info['gps_coordinates'])
-                        
-                        # Store full analysis
-                        cv_analysis = {
-                            'camera_make': exif_info.get('camera_make'),
-                            'camera_model': exif_info.get('camera_model'),
-                            'timestamp': exif_info.get('timestamp')
-                        }
-                except Exception as e:
-                    print(f"GPS extraction error for photo {idx}: {e}")
-            
-            plot_photo = PlotPhoto(
-                plot_id=new_plot.id,
-                photo_path=path,
-                photo_index=idx,
-                has_gps=1 if has_gps_data else 0,
-                gps_latitude=gps_lat,
-                gps_longitude=gps_lon,
-                photo_timestamp=datetime.fromisoformat(photo_ts) if photo_ts else None,
-                cv_analysis=sanitize_for_json(cv_analysis) if has_gps_data else None
-            )
-            db.add(plot_photo)
-    
-    # Update plot with average GPS coordinates if available
-    if gps_coordinates_list:
-        avg_lat = sum(coord[0] for coord in gps_coordinates_list) / len(gps_coordinates_list)
-        avg_lon = sum(coord[1] for coord in gps_coordinates_list) / len(gps_coordinates_list)
-        # Note: Plot model needs gps_latitude and gps_longitude fields
-        # new_plot.gps_latitude = avg_lat
-        # new_plot.gps_longitude = avg_lon
+    # GPS, quality and duplicate checks run in the background CV pool
+    for idx, path in photo_paths:
+        db.add(PlotPhoto(
+            plot_id=new_plot.id,
+            photo_path=path,
+            photo_index=idx,
+            has_gps=0
+        ))
     
     db.commit()
+    
+    if schedule_photo_analysis:
+        for _, path in photo_paths:
+            schedule_photo_analysis(path, 'plot', new_plot.id)
 
     return {"message": "Plot registered", "plot_id": plot_id, "status": initial_status}
 
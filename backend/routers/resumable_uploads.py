@@ -0,0 +1,419 @@
+"""
+Resumable uploads (tus-style) for large files over unreliable mobile links
+
+1. POST   /resumable-uploads                     declare filename, size, kind
+2. PATCH  /resumable-uploads/{upload_id}         send bytes from Upload-Offset
+3. HEAD   /resumable-uploads/{upload_id}         after a dropped connection,
+                                                 ask how many bytes arrived
+4. POST   /resumable-uploads/{upload_id}/finalize  attach the file to a batch,
+                                                 plot or audit record
+
+Chunks are written straight to PARTIAL_DIR/<upload_id>.part (outside the
+served upload directory) as they arrive; whatever reached the disk before a
+connection dropped counts, so a retry only resends the missing bytes.
+
+The upload row is the authority across worker processes: a PATCH claims
+the upload ('uploading' -> 'receiving') with a conditional UPDATE that also
+checks Upload-Offset, and finalize claims it ('uploading' -> 'finalizing')
+the same way, so concurrent requests get 409 instead of writing or storing
+the same file twice. Finalize is idempotent: repeating it returns the same
+attachment.
+"""
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import aiofiles
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+
+from database import get_db
+from models import User, ResumableUpload, ManufacturingBatch, Plot, PlotPhoto, Audit
+from schemas import ResumableUploadCreate, ResumableUploadFinalize, ResumableUploadResponse
+from auth import get_current_user
+from file_storage import (PARTIAL_DIR, MAX_UPLOAD_SIZE_MB, MAX_VIDEO_UPLOAD_SIZE_MB,
+                          REQUIRE_PHOTO_GPS, generate_unique_filename, upload_path, store_file,
+                          read_file_exif, schedule_photo_derivatives)
+try:
+    from cv.worker import schedule_photo_analysis, schedule_video_analysis
+except ImportError:
+    schedule_photo_analysis = None
+    schedule_video_analysis = None
+
+RESUMABLE_UPLOAD_EXPIRY_HOURS = int(os.getenv("RESUMABLE_UPLOAD_EXPIRY_HOURS", "48"))
+# Claims not renewed for this long can be taken over (the holder died)
+RESUMABLE_UPLOAD_LEASE_S = int(os.getenv("RESUMABLE_UPLOAD_LEASE_S", "60"))
+RESUMABLE_UPLOAD_FINALIZE_TIMEOUT_S = int(os.getenv("RESUMABLE_UPLOAD_FINALIZE_TIMEOUT_S", "3600"))
+
+TUS_VERSION = "1.0.0"
+UPLOAD_LIMITS_MB = {'photo': MAX_UPLOAD_SIZE_MB, 'video': MAX_VIDEO_UPLOAD_SIZE_MB}
+# Which upload kinds each record type accepts
+TARGET_KINDS = {'batch': ('photo', 'video'), 'plot': ('photo',), 'audit': ('photo',)}
+
+router = APIRouter(
+    prefix="/resumable-uploads",
+    tags=["Resumable Uploads"]
+)
+
+os.makedirs(PARTIAL_DIR, exist_ok=True)
+
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(PARTIAL_DIR, f"{upload_id}.part")
+
+
+def _claim(db: Session, upload: ResumableUpload, claim_status: str,
+           takeover_s: Dict[str, int], *criteria) -> Optional[datetime]:
+    """
+    Move an upload from 'uploading' to claim_status in one conditional UPDATE
+    (with any extra criteria), so only one request of any worker gets it.
+    Claims in a takeover_s status older than its seconds are taken over.
+    Returns the lease (the claim's updated_at), or None if not claimed.
+    """
+    now = datetime.utcnow()
+    claimable = [ResumableUpload.status == 'uploading'] + [
+        and_(ResumableUpload.status == held, ResumableUpload.updated_at < now - timedelta(seconds=seconds))
+        for held, seconds in takeover_s.items()
+    ]
+    claimed = db.query(ResumableUpload) \
+        .filter(ResumableUpload.id == upload.id, or_(*claimable), *criteria) \
+        .update({ResumableUpload.status: claim_status, ResumableUpload.updated_at: now},
+                synchronize_session=False)
+    db.commit()
+    return now if claimed else None
+
+
+def _renew(db: Session, upload: ResumableUpload, lease: datetime, **values) -> Optional[datetime]:
+    """
+    Renew a claim and update columns (e.g. offset, or status to release it)
+    Returns the new lease, or None if the claim was taken over meanwhile
+    """
+    now = datetime.utcnow()
+    values = {getattr(ResumableUpload, name): value for name, value in values.items()}
+    renewed = db.query(ResumableUpload) \
+        .filter(ResumableUpload.id == upload.id, ResumableUpload.updated_at == lease) \
+        .update({**values, ResumableUpload.updated_at: now}, synchronize_session=False)
+    db.commit()
+    return now if renewed else None
+
+
+def _offset_headers(upload: ResumableUpload, offset: int) -> dict:
+    return {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(upload.total_size),
+        "Cache-Control": "no-store"
+    }
+
+
+def _get_upload(db: Session, upload_id: str, current_user: User) -> ResumableUpload:
+    upload = db.query(ResumableUpload).filter(ResumableUpload.upload_id == upload_id).first()
+    if not upload or upload.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def expire_stale_uploads(db: Session) -> int:
+    """Delete uploads (and partial files) untouched for RESUMABLE_UPLOAD_EXPIRY_HOURS"""
+    cutoff = datetime.utcnow() - timedelta(hours=RESUMABLE_UPLOAD_EXPIRY_HOURS)
+    stale = db.query(ResumableUpload).filter(ResumableUpload.updated_at < cutoff).all()
+    for upload in stale:
+        path = _part_path(upload.upload_id)
+        if os.path.exists(path):
+            os.remove(path)
+        db.delete(upload)
+    if stale:
+        db.commit()
+    return len(stale)
+
+
+@router.post("", response_model=ResumableUploadResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    data: ResumableUploadCreate,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a resumable upload. Send the bytes with PATCH to the returned Location.
+    """
+    if data.kind not in UPLOAD_LIMITS_MB:
+        raise HTTPException(status_code=400, detail="kind must be 'photo' or 'video'")
+
+    max_size_mb = UPLOAD_LIMITS_MB[data.kind]
+    if data.size > max_size_mb * 1024 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File '{data.filename}' is larger than the {max_size_mb} MB upload limit"
+        )
+
+    expire_stale_uploads(db)
+
+    upload = ResumableUpload(
+        upload_id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        kind=data.kind,
+        filename=os.path.basename(data.filename),
+        total_size=data.size,
+        offset=0
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+
+    # Create the partial file now so HEAD reports offset 0
+    open(_part_path(upload.upload_id), 'wb').close()
+
+    response.headers.update(_offset_headers(upload, 0))
+    response.headers["Location"] = f"{router.prefix}/{upload.upload_id}"
+    return upload
+
+
+@router.head("/{upload_id}")
+async def get_upload_offset(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Bytes received so far (Upload-Offset header); resume the PATCH from there"""
+    upload = _get_upload(db, upload_id, current_user)
+    return Response(status_code=200, headers=_offset_headers(upload, upload.offset))
+
+
+@router.get("/{upload_id}", response_model=ResumableUploadResponse)
+async def get_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload status (offset, and the attached file once finalized)"""
+    return _get_upload(db, upload_id, current_user)
+
+
+@router.patch("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Append the request body at Upload-Offset (must equal the bytes received
+    so far). The body is written to disk as it streams in.
+    """
+    upload = _get_upload(db, upload_id, current_user)
+    if upload.status in ('finalizing', 'finalized'):
+        raise HTTPException(status_code=409, detail="Upload already finalized")
+
+    try:
+        client_offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Offset header required")
+
+    lease = _claim(db, upload, 'receiving', {'receiving': RESUMABLE_UPLOAD_LEASE_S},
+                   ResumableUpload.offset == client_offset)
+    if lease is None:
+        db.refresh(upload)
+        if upload.status in ('finalizing', 'finalized'):
+            raise HTTPException(status_code=409, detail="Upload already finalized")
+        if upload.status == 'receiving':
+            raise HTTPException(status_code=409, detail="Another chunk of this upload is in progress")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload-Offset {client_offset} does not match received bytes",
+            headers=_offset_headers(upload, upload.offset)
+        )
+
+    offset = client_offset
+    too_long = False
+    renewed_at = time.monotonic()
+    try:
+        try:
+            async with aiofiles.open(_part_path(upload_id), 'r+b') as f:
+                # Bytes past the recorded offset are from a chunk that never got counted
+                await f.truncate(offset)
+                await f.seek(offset)
+                async for chunk in request.stream():
+                    remaining = upload.total_size - offset
+                    if len(chunk) > remaining:
+                        chunk = chunk[:remaining]
+                        too_long = True
+                    await f.write(chunk)
+                    offset += len(chunk)
+                    if too_long:
+                        break
+                    if time.monotonic() - renewed_at > RESUMABLE_UPLOAD_LEASE_S / 4:
+                        await f.flush()
+                        lease = _renew(db, upload, lease, offset=offset)
+                        if lease is None:
+                            raise HTTPException(status_code=409, detail="Upload was taken over by another request")
+                        renewed_at = time.monotonic()
+        except ClientDisconnect:
+            pass  # Keep what arrived; the client resumes from HEAD's offset
+    finally:
+        if lease is not None:
+            _renew(db, upload, lease, offset=offset, status='uploading')
+
+    if too_long:
+        raise HTTPException(
+            status_code=413,
+            detail="Chunk goes past the declared upload size",
+            headers=_offset_headers(upload, offset)
+        )
+
+    return Response(status_code=204, headers=_offset_headers(upload, offset))
+
+
+def _attach(db: Session, upload: ResumableUpload, data: ResumableUploadFinalize,
+            current_user: User):
+    """
+    Check the target record and return (file prefix, attach callback,
+    schedule callback) for the finalized file
+    """
+    is_admin = current_user.role == 'admin'
+
+    if data.target == 'batch':
+        batch = db.query(ManufacturingBatch).filter(ManufacturingBatch.id == data.target_id).first()
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        if batch.user_id != current_user.id and not is_admin:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        def attach(path):
+            if upload.kind == 'video':
+                batch.video_path = path
+            else:
+                batch.photo_path = path
+
+        def schedule(path):
+            if upload.kind == 'video' and schedule_video_analysis:
+                schedule_video_analysis(path, batch.id)
+            elif upload.kind == 'photo' and schedule_photo_analysis:
+                schedule_photo_analysis(path, 'batch', batch.id)
+
+        return f"batch_{batch.batch_id}", attach, schedule
+
+    if data.target == 'plot':
+        plot = db.query(Plot).filter(Plot.id == data.target_id).first()
+        if not plot:
+            raise HTTPException(status_code=404, detail="Plot not found")
+        if plot.owner_id != current_user.id and not is_admin:
+            raise HTTPException(status_code=403, detail="Not authorized")
+
+        last = db.query(PlotPhoto.photo_index).filter(PlotPhoto.plot_id == plot.id) \
+            .order_by(PlotPhoto.photo_index.desc()).first()
+        photo_index = last[0] + 1 if last else 0
+
+        def attach(path):
+            db.add(PlotPhoto(plot_id=plot.id, photo_path=path, photo_index=photo_index, has_gps=0))
+
+        def schedule(path):
+            if schedule_photo_analysis:
+                schedule_photo_analysis(path, 'plot', plot.id)
+
+        return f"{plot.plot_id}_{photo_index}", attach, schedule
+
+    audit = db.query(Audit).filter(Audit.id == data.target_id).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    if audit.auditor_id != current_user.id and not is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    photo_index = len(audit.photos or [])
+
+    def attach(path):
+        # Reassign so SQLAlchemy sees the JSON change
+        audit.photos = (audit.photos or []) + [path]
+
+    def schedule(path):
+        if schedule_photo_analysis:
+            schedule_photo_analysis(path, 'audit', audit.id)
+
+    return (f"audit_{audit.type}_{current_user.id}_{datetime.now().timestamp()}_{photo_index}",
+            attach, schedule)
+
+
+def _finalized(upload: ResumableUpload, data: ResumableUploadFinalize) -> ResumableUpload:
+    """Answer a repeated finalize with the attachment it made"""
+    if (upload.target, upload.target_id) != (data.target, data.target_id):
+        raise HTTPException(status_code=409, detail="Upload already attached to another record")
+    return upload
+
+
+@router.post("/{upload_id}/finalize", response_model=ResumableUploadResponse)
+async def finalize_upload(
+    upload_id: str,
+    data: ResumableUploadFinalize,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Store a fully received upload and attach it to a batch (photo or video),
+    plot (photo) or audit (photo)
+    """
+    upload = _get_upload(db, upload_id, current_user)
+    if upload.status == 'finalized':
+        return _finalized(upload, data)
+
+    if data.target not in TARGET_KINDS:
+        raise HTTPException(status_code=400, detail="target must be 'batch', 'plot' or 'audit'")
+    if upload.kind not in TARGET_KINDS[data.target]:
+        raise HTTPException(status_code=400, detail=f"A {data.target} does not accept {upload.kind} uploads")
+
+    if upload.offset != upload.total_size:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload incomplete: {upload.offset} of {upload.total_size} bytes received",
+            headers=_offset_headers(upload, upload.offset)
+        )
+
+    lease = _claim(db, upload, 'finalizing',
+                   {'receiving': RESUMABLE_UPLOAD_LEASE_S, 'finalizing': RESUMABLE_UPLOAD_FINALIZE_TIMEOUT_S},
+                   ResumableUpload.offset == ResumableUpload.total_size)
+    if lease is None:
+        db.refresh(upload)
+        if upload.status == 'finalized':
+            return _finalized(upload, data)
+        raise HTTPException(status_code=409, detail="Upload is being finalized by another request, retry",
+                            headers={"Retry-After": "1"})
+
+    part_path = _part_path(upload_id)
+    try:
+        if not os.path.exists(part_path):
+            raise HTTPException(status_code=410, detail="Upload data is gone, start a new upload")
+
+        if upload.kind == 'photo' and REQUIRE_PHOTO_GPS:
+            exif = read_file_exif(part_path)
+            if exif is not None and not exif['has_gps']:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Photo '{upload.filename}' has no GPS location. Enable location tagging in the camera and retake it."
+                )
+
+        prefix, attach, schedule = _attach(db, upload, data, current_user)
+        folder = "videos" if upload.kind == 'video' else "photos"
+        path = await store_file(part_path, upload_path(folder, generate_unique_filename(upload.filename, prefix)),
+                                user_id=upload.user_id)
+
+        attach(path)
+        upload.status = 'finalized'
+        upload.offset = upload.total_size
+        upload.target = data.target
+        upload.target_id = data.target_id
+        upload.file_path = str(path)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        _renew(db, upload, lease, status='uploading')
+        raise
+    db.refresh(upload)
+
+    if upload.kind == 'photo':
+        schedule_photo_derivatives(path)
+    schedule(path)
+
+    return upload
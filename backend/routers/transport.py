@@ -8,6 +8,10 @@ from models import User, Transport, BiomassHarvest, Distribution
 from schemas import TransportResponse, TransportUpdate
 from auth import get_current_user
 from file_storage import save_photo
+try:
+    from cv.worker import schedule_photo_analysis
+except ImportError:
+    schedule_photo_analysis = None
 
 router = APIRouter(
     prefix="/transport",
@@ -43,8 +47,8 @@ async def record_transport(
     if current_user.role not in ['owner', 'admin']:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    loading_path = await save_photo(loading_photo, f"transport_{shipment_id}_load") if loading_photo and loading_photo.filename else None
-    unloading_path = await save_photo(unloading_photo, f"transport_{shipment_id}_unload") if unloading_photo and unloading_photo.filename else None
+    loading_path = await save_photo(loading_photo, f"transport_{shipment_id}_load", user_id=current_user.id) if loading_photo and loading_photo.filename else None
+    unloading_path = await save_photo(unloading_photo, f"transport_{shipment_id}_unload", user_id=current_user.id) if unloading_photo and unloading_photo.filename else None
     
     actual_harvest_id = None
     if harvest_id:
@@ -91,6 +95,12 @@ async def record_transport(
     db.add(transport)
     db.commit()
     db.refresh(transport)
+    
+    # Analyse photos in the background CV worker pool
+    if schedule_photo_analysis:
+        schedule_photo_analysis(loading_path, 'transport', transport.id)
+        schedule_photo_analysis(unloading_path, 'transport', transport.id)
+    
     return transport
 
 @router.get("/list", response_model=List[TransportResponse])
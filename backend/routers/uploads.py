@@ -0,0 +1,248 @@
+"""
+Serving of uploaded files
+Resolves /uploads/<path> through file_storage.resolve_upload, so both plain
+files and content-addressed uploads (stored_files -> blob) are served.
+Only the published folders (SERVED_FOLDERS) are served; blobs/, temporary
+uploads, the GC quarantine and any dot file are not.
+With S3 storage, content-addressed uploads redirect to a presigned URL so
+the bytes do not pass through the API.
+
+HTTP caching:
+- Content-addressed uploads never change: strong ETag (the SHA-256) and
+  Cache-Control "immutable" for UPLOADS_IMMUTABLE_MAX_AGE seconds
+- Plain files (older uploads, derivatives that can be regenerated) get an
+  ETag from size and mtime and must be revalidated (cheap 304)
+- If-None-Match -> 304, single byte ranges (Range / If-Range) -> 206 for
+  video scrubbing, unsatisfiable ranges -> 416
+
+Sending the bytes:
+- Behind nginx, set UPLOADS_ACCEL_REDIRECT_PREFIX (e.g. /_uploads) and the
+  API only answers with X-Accel-Redirect; nginx then serves the file with
+  sendfile and handles ranges itself:
+      location /_uploads/ { internal; alias /app/backend/uploads/; }
+- Otherwise the file is sent with the ASGI zero-copy / pathsend extensions
+  when the server offers them, and in chunks from a thread when not
+
+Upload pre-check: POST /uploads/precheck tells a client which files (by
+SHA-256 and size) it uploaded before and the server still has, so retries
+and photos shared across records are sent as a small blob reference part
+instead of the bytes (see file_storage.read_blob_ref).
+
+Benchmark: benchmarks/uploads_serving.py
+"""
+import mimetypes
+import os
+import posixpath
+from email.utils import formatdate
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, Response
+
+from models import User
+from schemas import UploadPrecheckRequest, UploadPrecheckResponse
+from auth import get_current_user
+from file_storage import (UPLOAD_DIR, UPLOAD_FOLDERS, BLOB_REF_CONTENT_TYPE, resolve_upload, get_file_url,
+                          existing_blobs)
+
+UPLOADS_IMMUTABLE_MAX_AGE = int(os.getenv("UPLOADS_IMMUTABLE_MAX_AGE", "31536000"))
+UPLOADS_ACCEL_REDIRECT_PREFIX = os.getenv("UPLOADS_ACCEL_REDIRECT_PREFIX", "").rstrip("/")
+
+# Top-level upload folders clients may read (profile photos and certificate
+# QR codes are written there by routers/auth.py and routers/blockchain.py)
+SERVED_FOLDERS = UPLOAD_FOLDERS + ('profile_photos', 'qr_codes')
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["Uploads"]
+)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a Range header into an inclusive (start, end) byte range.
+    Returns None to send the whole file (no header, malformed or multiple
+    ranges); raises RangeNotSatisfiable if the range lies outside the file.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    first, last = (part.strip() for part in spec.split("-", 1))
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - suffix), size - 1
+
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def is_served_path(relative_path: str) -> bool:
+    """True if relative_path is inside a published folder and names no dot file"""
+    parts = posixpath.normpath(relative_path.replace("\\", "/")).split("/")
+    return len(parts) > 1 and parts[0] in SERVED_FOLDERS and not any(part.startswith(".") for part in parts)
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class UploadFileResponse(Response):
+    """
+    Sends one byte range of a file. Uses the ASGI zero-copy send (any range)
+    or path send (whole file) extension when the server supports them.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, start: int, length: int, full_file: bool,
+                 status_code: int, headers: dict, media_type: str):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.full_file = full_file
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.init_headers({**headers, "content-length": str(length)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code,
+                    "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": self.start, "count": self.length})
+            return
+        if "http.response.pathsend" in extensions and self.full_file:
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank under us; end the response
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+@router.post("/precheck", response_model=UploadPrecheckResponse)
+async def precheck_uploads(
+    request: UploadPrecheckRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Check which of the files the current user uploaded before are still on
+    the server, by SHA-256 and size. For those, send a part with content type reference_content_type and body
+    {"sha256": ..., "size": ...} in place of the file on any upload route.
+    """
+    files = [(item.sha256.lower(), item.size) for item in request.files]
+    existing = await run_in_threadpool(existing_blobs, files, current_user.id)
+    return {
+        "files": [
+            {"sha256": sha256, "size": size, "exists": (sha256, size) in existing}
+            for sha256, size in files
+        ],
+        "reference_content_type": BLOB_REF_CONTENT_TYPE
+    }
+
+
+@router.api_route("/{relative_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(relative_path: str, request: Request):
+    """Serve an uploaded photo, video or KML file"""
+    if not is_served_path(relative_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Database lookups and storage calls (S3 requests): off the event loop
+    url = await run_in_threadpool(get_file_url, relative_path)
+    if url:
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "private, max-age=300"})
+
+    resolved = await run_in_threadpool(resolve_upload, relative_path)
+    if not resolved:
+        raise HTTPException(status_code=404, detail="File not found")
+    file_path, sha256 = resolved
+
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    size = stat_result.st_size
+
+    if sha256:
+        etag = f'"{sha256}"'
+        cache_control = f"public, max-age={UPLOADS_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        etag = f'"{size:x}-{stat_result.st_mtime_ns:x}"'
+        cache_control = "public, no-cache"
+
+    # Blobs have no extension; the content type comes from the upload path
+    media_type = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "accept-ranges": "bytes"
+    }
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if UPLOADS_ACCEL_REDIRECT_PREFIX and os.path.commonpath([file_path, UPLOAD_DIR]) == UPLOAD_DIR:
+        internal_path = os.path.relpath(file_path, UPLOAD_DIR).replace(os.sep, "/")
+        return Response(status_code=200, media_type=media_type, headers={
+            **headers,
+            "x-accel-redirect": f"{UPLOADS_ACCEL_REDIRECT_PREFIX}/{quote(internal_path)}"
+        })
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+
+    if byte_range is None:
+        return UploadFileResponse(file_path, 0, size, True, 200, headers, media_type)
+
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return UploadFileResponse(file_path, start, end - start + 1, start == 0 and end == size - 1,
+                              206, headers, media_type)
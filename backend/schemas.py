@@ -1,6 +1,33 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, computed_field
 from datetime import datetime
-from typing import List, Optional
+from typing import ClassVar, Dict, List, Optional, Tuple
+
+# --- Photo derivatives ---
+class PhotoDerivativesMixin(BaseModel):
+    """
+    Adds photo_derivatives to a response: {original path: {size: path}} for
+    the photo fields listed in _photo_fields (thumb/medium WebP copies, named
+    after the photo; clients fall back to the original while one is missing)
+    """
+    _photo_fields: ClassVar[Tuple[str, ...]] = ()
+
+    @computed_field
+    @property
+    def photo_derivatives(self) -> Dict[str, Dict[str, str]]:
+        from file_storage import get_photo_derivatives
+
+        paths = []
+        for field in self._photo_fields:
+            value = getattr(self, field, None)
+            paths.extend(value if isinstance(value, list) else [value])
+
+        derivatives = {}
+        for path in paths:
+            if isinstance(path, str) and path not in derivatives:
+                found = get_photo_derivatives(path)
+                if found:
+                    derivatives[path] = found
+        return derivatives
 
 # --- User & Auth ---
 class UserRegister(BaseModel):
@@ -51,7 +78,9 @@ class PlotUpdate(BaseModel):
     taluka: Optional[str] = None
     district: Optional[str] = None
 
-class PlotPhotoResponse(BaseModel):
+class PlotPhotoResponse(PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photo_path',)
+
     id: int
     photo_path: str
     photo_index: int
@@ -97,7 +126,9 @@ class HarvestCreate(HarvestBase):
 class HarvestUpdate(BaseModel):
     actual_harvested_ton: Optional[float] = None
 
-class HarvestResponse(HarvestBase):
+class HarvestResponse(HarvestBase, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photo_path_1', 'photo_path_2')
+
     id: int
     user_id: int
     photo_path_1: Optional[str]
@@ -112,7 +143,9 @@ class PreprocessingCreate(BaseModel):
     harvest_id: int
     method: str
 
-class PreprocessingResponse(PreprocessingCreate):
+class PreprocessingResponse(PreprocessingCreate, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photo_before_path', 'photo_after_path')
+
     id: int
     photo_before_path: Optional[str]
     photo_after_path: Optional[str]
@@ -145,7 +178,9 @@ class TransportUpdate(BaseModel):
     route_to: Optional[str] = None
     quantity_kg: Optional[float] = None
 
-class TransportResponse(TransportBase):
+class TransportResponse(TransportBase, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('loading_photo_path', 'unloading_photo_path')
+
     id: int
     loading_photo_path: Optional[str]
     unloading_photo_path: Optional[str]
@@ -172,7 +207,9 @@ class BatchUpdate(BaseModel):
     species: Optional[str] = None
     status: Optional[str] = None
 
-class BatchResponse(BatchBase):
+class BatchResponse(BatchBase, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photo_path',)
+
     id: int
     ratio: float
     co2_removed: float
@@ -198,7 +235,9 @@ class UnburnableMethodCreate(BaseModel):
     biochar_weight: float
     clay_weight: float
 
-class UnburnableMethodResponse(UnburnableMethodCreate):
+class UnburnableMethodResponse(UnburnableMethodCreate, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photo_path',)
+
     id: int
     photo_path: Optional[str]
     created_at: datetime
@@ -255,7 +294,9 @@ class CustomerResponse(CustomerBase):
 class ApplicationCreate(BaseModel):
     purpose: str
 
-class ApplicationResponse(ApplicationCreate):
+class ApplicationResponse(ApplicationCreate, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photo_path',)
+
     id: int
     photo_path: Optional[str]
     kml_file_path: Optional[str]
@@ -288,7 +329,9 @@ class AuditBase(BaseModel):
 class AuditCreate(AuditBase):
     pass
 
-class AuditResponse(AuditBase):
+class AuditResponse(AuditBase, PhotoDerivativesMixin):
+    _photo_fields: ClassVar[Tuple[str, ...]] = ('photos',)
+
     id: int
     auditor_id: int
     date: datetime
@@ -296,3 +339,79 @@ class AuditResponse(AuditBase):
     
     class Config:
         from_attributes = True
+
+# --- Resumable Uploads ---
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)  # Total bytes
+    kind: str  # 'photo', 'video'
+
+class ResumableUploadFinalize(BaseModel):
+    target: str  # 'batch' (photo or video), 'plot' (photo), 'audit' (photo)
+    target_id: int  # Database id of the batch, plot or audit
+
+class ResumableUploadResponse(BaseModel):
+    upload_id: str
+    kind: str
+    filename: str
+    total_size: int
+    offset: int
+    status: str
+    target: Optional[str] = None
+    target_id: Optional[int] = None
+    file_path: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# --- Bundle upload (manifest.json inside the zip) ---
+class BundlePlot(BaseModel):
+    plot_id: str
+    type: str
+    species: str
+    area: float
+    expected_biomass: float
+    survey_number: Optional[str] = None
+    village: Optional[str] = None
+    taluka: Optional[str] = None
+    district: Optional[str] = None
+    kml: str  # File name inside the zip
+    photos: List[str] = Field(default_factory=list, max_length=4)
+
+class BundleHarvest(BaseModel):
+    biomass_batch_id: str
+    plot_id: str  # Plot ID of a plot in this bundle or already registered
+    actual_harvested_ton: float
+    photo_1: Optional[str] = None
+    photo_2: Optional[str] = None
+
+class BundleManifest(BaseModel):
+    plots: List[BundlePlot] = Field(default_factory=list, max_length=500)
+    harvests: List[BundleHarvest] = Field(default_factory=list, max_length=500)
+
+class BundleItemResult(BaseModel):
+    kind: str  # 'plot', 'harvest'
+    key: str  # plot_id / biomass_batch_id
+    status: str  # 'created', 'failed'
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BundleUploadResponse(BaseModel):
+    created: int
+    failed: int
+    items: List[BundleItemResult]
+
+class UploadPrecheckFile(BaseModel):
+    sha256: str = Field(..., pattern="^[0-9a-fA-F]{64}$")
+    size: int = Field(..., ge=0)  # Bytes
+
+class UploadPrecheckRequest(BaseModel):
+    files: List[UploadPrecheckFile] = Field(..., min_length=1, max_length=100)
+
+class UploadPrecheckResult(UploadPrecheckFile):
+    exists: bool  # Send a blob reference part instead of the file
+
+class UploadPrecheckResponse(BaseModel):
+    files: List[UploadPrecheckResult]
+    reference_content_type: str
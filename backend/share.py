@@ -67,7 +67,7 @@ else:
         # We should try to distinguish.
         # Harit Swaraj API routes: /auth, /dashboard, /biomass, etc.
         # If the path starts with a known API prefix, we should 404 (or pass).
-        api_prefixes = ["auth", "dashboard", "biomass", "harvest", "transport", "manufacturing", "distribution", "audit", "blockchain", "docs", "openapi.json", "uploads"]
+        api_prefixes = ["auth", "dashboard", "biomass", "harvest", "transport", "manufacturing", "distribution", "audit", "blockchain", "docs", "openapi.json", "uploads", "resumable-uploads", "bundles"]
         
         for prefix in api_prefixes:
             if full_path.startswith(prefix):
@@ -0,0 +1,342 @@
+"""
+Upload storage backends for Harit Swaraj
+Where the content-addressed upload blobs (see file_storage.py) are kept.
+
+- LocalStorage: files under the upload directory (default)
+- S3Storage: any S3-compatible object store (AWS S3, MinIO, Cloudflare R2),
+  so several app instances can share one set of uploads
+
+Select with STORAGE_BACKEND=local|s3. The S3 backend needs boto3 and:
+    S3_BUCKET, S3_ENDPOINT_URL (for MinIO/R2), S3_REGION, and credentials in
+    AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY
+
+S3 specifics:
+- Large uploads are sent as multipart uploads, parts in parallel
+- Clients are redirected to presigned GET URLs instead of streaming through
+  the API
+- Files the server itself reads (CV analysis, KML parsing) go through a
+  local read-through cache; blobs never change, so cached copies never go
+  stale
+"""
+import asyncio
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PRESIGN_EXPIRES_S = int(os.getenv("S3_PRESIGN_EXPIRES_S", "3600"))
+# S3 parts must be at least 5 MB (except the last one)
+S3_MULTIPART_PART_MB = max(5, int(os.getenv("S3_MULTIPART_PART_MB", "8")))
+S3_MULTIPART_CONCURRENCY = int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))
+
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR") or os.path.join(
+    os.path.dirname(__file__), 'data', 'storage_cache'
+)
+STORAGE_CACHE_MAX_MB = int(os.getenv("STORAGE_CACHE_MAX_MB", "1024"))
+
+
+class StorageBackend(ABC):
+    """
+    Interface for blob storage. Keys are upload-relative paths such as
+    "blobs/<sha256>".
+
+    Everything except put() is blocking (disk or network I/O): call it from
+    async code through run_in_threadpool.
+    """
+    name = "base"
+
+    @abstractmethod
+    async def put(self, temp_path: str, key: str):
+        """Store a finished local file under key (takes ownership of temp_path)"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """True if key is stored"""
+
+    @abstractmethod
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of a local copy of key for reading, or None if it does not exist"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove key (nothing happens if it does not exist)"""
+
+    @abstractmethod
+    def move(self, source: str, target: str):
+        """Rename a key (drops source if target already exists)"""
+
+    @abstractmethod
+    def list_objects(self, prefix: str) -> Iterator[Tuple[str, int, float]]:
+        """(key, size, modified timestamp) of every key under a prefix such as "blobs/", at any depth"""
+
+    def url(self, key: str, media_type: Optional[str] = None) -> Optional[str]:
+        """Direct download URL for clients, or None to serve the file through the API"""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Blobs stored as files under a local directory"""
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    async def put(self, temp_path: str, key: str):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.remove(temp_path)
+            os.utime(target)  # freshly referenced again: keep it out of the GC grace period
+        else:
+            os.replace(temp_path, target)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def delete(self, key: str):
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def move(self, source: str, target: str):
+        target_path = self._path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if os.path.exists(target_path):
+            self.delete(source)
+        else:
+            os.replace(self._path(source), target_path)
+
+    def list_objects(self, prefix: str) -> Iterator[Tuple[str, int, float]]:
+        for directory, _, names in os.walk(self._path(prefix)):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield (os.path.relpath(path, self.root).replace(os.sep, "/"),
+                       stat.st_size, stat.st_mtime)
+
+
+class S3Storage(StorageBackend):
+    """
+    Blobs stored in an S3-compatible bucket, with a size-bounded local
+    read-through cache (least recently used files are evicted first)
+    """
+    name = "s3"
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 region: str = S3_REGION, cache_dir: str = STORAGE_CACHE_DIR,
+                 cache_max_mb: int = STORAGE_CACHE_MAX_MB,
+                 part_size_mb: int = S3_MULTIPART_PART_MB,
+                 concurrency: int = S3_MULTIPART_CONCURRENCY,
+                 presign_expires_s: int = S3_PRESIGN_EXPIRES_S):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_mb * 1024 * 1024
+        self.part_size = part_size_mb * 1024 * 1024
+        self.concurrency = concurrency
+        self.presign_expires_s = presign_expires_s
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=BotoConfig(signature_version='s3v4',
+                              max_pool_connections=max(10, concurrency * 2))
+        )
+        self._cache_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    async def put(self, temp_path: str, key: str):
+        try:
+            if not await run_in_threadpool(self.exists, key):
+                size = os.path.getsize(temp_path)
+                if size <= self.part_size:
+                    await run_in_threadpool(self.client.upload_file, temp_path, self.bucket, key)
+                else:
+                    await self._multipart_upload(temp_path, key, size)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        # The uploaded bytes are the blob: keep them as the cached copy
+        self._add_to_cache(temp_path, key)
+
+    async def _multipart_upload(self, temp_path: str, key: str, size: int):
+        """Upload a file in part_size parts, up to `concurrency` parts at a time"""
+        upload = await run_in_threadpool(
+            self.client.create_multipart_upload, Bucket=self.bucket, Key=key
+        )
+        upload_id = upload['UploadId']
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        def read_part(offset: int) -> bytes:
+            with open(temp_path, 'rb') as f:
+                f.seek(offset)
+                return f.read(self.part_size)
+
+        async def send_part(number: int, offset: int) -> dict:
+            async with semaphore:
+                body = await run_in_threadpool(read_part, offset)
+                response = await run_in_threadpool(
+                    self.client.upload_part, Bucket=self.bucket, Key=key,
+                    UploadId=upload_id, PartNumber=number, Body=body
+                )
+                return {'PartNumber': number, 'ETag': response['ETag']}
+
+        try:
+            parts = await asyncio.gather(*[
+                send_part(number, offset)
+                for number, offset in enumerate(range(0, size, self.part_size), 1)
+            ])
+            await run_in_threadpool(
+                self.client.complete_multipart_upload, Bucket=self.bucket, Key=key,
+                UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            await run_in_threadpool(
+                self.client.abort_multipart_upload, Bucket=self.bucket, Key=key,
+                UploadId=upload_id
+            )
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            os.utime(path)  # mark as recently used
+            return path
+
+        temp_path = os.path.join(self.cache_dir, f".download-{uuid.uuid4().hex}")
+        try:
+            self.client.download_file(self.bucket, key, temp_path)
+        except ClientError as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return self._add_to_cache(temp_path, key)
+
+    def _add_to_cache(self, temp_path: str, key: str) -> str:
+        path = self._cache_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        self._trim_cache(keep=path)
+        return path
+
+    def _trim_cache(self, keep: str):
+        """Evict least recently used cached files above cache_max_bytes"""
+        with self._cache_lock:
+            entries = []
+            total = 0
+            for directory, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    if name.startswith('.download-'):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total <= self.cache_max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def move(self, source: str, target: str):
+        if not self.exists(target):
+            # Managed copy: switches to multipart copy for large objects
+            self.client.copy({'Bucket': self.bucket, 'Key': source}, self.bucket, target)
+        self.client.delete_object(Bucket=self.bucket, Key=source)
+
+        cached = self._cache_path(source)
+        if os.path.exists(cached):
+            self._add_to_cache(cached, target)
+
+    def list_objects(self, prefix: str) -> Iterator[Tuple[str, int, float]]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'], item['Size'], item['LastModified'].timestamp()
+
+    def url(self, key: str, media_type: Optional[str] = None) -> Optional[str]:
+        params = {'Bucket': self.bucket, 'Key': key}
+        if media_type:
+            params['ResponseContentType'] = media_type
+        return self.client.generate_presigned_url(
+            'get_object', Params=params, ExpiresIn=self.presign_expires_s
+        )
+
+
+# Shared storage backend
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """Get the configured storage backend (singleton)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "s3":
+                    _storage = S3Storage(S3_BUCKET)
+                    print(f"[OK] Upload storage: S3 bucket '{S3_BUCKET}'"
+                          f"{f' at {S3_ENDPOINT_URL}' if S3_ENDPOINT_URL else ''}")
+                else:
+                    from file_storage import UPLOAD_DIR
+                    _storage = LocalStorage(UPLOAD_DIR)
+    return _storage
@@ -0,0 +1,37 @@
+"""
+Shared fixtures for the backend tests
+Run from the backend directory: python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base
+import models  # noqa: F401  (registers the tables on Base)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Empty SQLite database with every table, in a temporary file"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}",
+                           connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
@@ -0,0 +1,28 @@
+from io import BytesIO
+
+from cv.cv_analyzer import EMPTY_EXIF, extract_exif_header, read_exif_block
+
+TIFF = b'MM\x00\x2a\x00\x00\x00\x08\x00\x00'  # Big-endian header, empty IFD
+
+
+def segment(marker: bytes, payload: bytes, length: int = None) -> bytes:
+    length = len(payload) + 2 if length is None else length
+    return b'\xff' + marker + length.to_bytes(2, 'big') + payload
+
+
+def test_exif_block_is_read_after_other_segments():
+    jpeg = b'\xff\xd8' + segment(b'\xe0', b'JFIF\x00' + bytes(9)) + segment(b'\xe1', b'Exif\x00\x00' + TIFF) + b'\xff\xda'
+    assert read_exif_block(BytesIO(jpeg)) == TIFF
+
+
+def test_corrupt_or_truncated_app1_segment_has_no_exif():
+    for length in (0, 1):
+        jpeg = b'\xff\xd8' + segment(b'\xe1', b'Exif\x00\x00' + TIFF, length=length) + bytes(1000)
+        assert read_exif_block(BytesIO(jpeg)) is None
+        assert extract_exif_header(jpeg) == EMPTY_EXIF
+
+    # The header promises more bytes than the file holds
+    truncated = b'\xff\xd8' + segment(b'\xe1', b'Exif\x00\x00' + TIFF, length=4000)
+    assert read_exif_block(BytesIO(truncated)) == TIFF
+    assert read_exif_block(BytesIO(b'\xff\xd8\xff\xe1\x00')) is None
+    assert extract_exif_header(truncated) == EMPTY_EXIF
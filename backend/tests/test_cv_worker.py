@@ -0,0 +1,31 @@
+import asyncio
+
+from cv.worker import CVExecutor
+
+
+def test_queue_bound_applies_to_a_synchronous_burst():
+    async def burst():
+        executor = CVExecutor(max_workers=1, max_queue=3)
+        accepted = [executor._spawn(asyncio.sleep(0.01)) for _ in range(5)]
+        assert executor.queue_length == 3
+        await asyncio.gather(*executor._tasks)
+        return executor, accepted
+
+    executor, accepted = asyncio.run(burst())
+    assert accepted == [True, True, True, False, False]
+    assert executor.rejected == 2
+    assert executor.submitted == 3
+    assert executor.queue_length == 0
+
+
+def test_queue_frees_up_when_tasks_finish():
+    async def scenario():
+        executor = CVExecutor(max_workers=1, max_queue=1)
+        assert executor._spawn(asyncio.sleep(0))
+        assert not executor._spawn(asyncio.sleep(0))
+        await asyncio.gather(*executor._tasks)
+        return executor._spawn(asyncio.sleep(0)), executor
+
+    accepted, executor = asyncio.run(scenario())
+    assert accepted
+    assert executor.rejected == 1
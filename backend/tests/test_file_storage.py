@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+import database
+import file_storage
+import storage
+from file_storage import blob_key, delete_file, existing_blobs, register_upload, store_file
+from models import StoredBlob, StoredBlobOwner, StoredFile
+from storage import LocalStorage
+
+CONTENT = b"kiln photo bytes"
+SHA = hashlib.sha256(CONTENT).hexdigest()
+
+
+class PausingStorage(LocalStorage):
+    """Local storage whose delete() waits until the test lets it continue"""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.deleting = threading.Event()
+        self.resume = threading.Event()
+
+    def delete(self, key):
+        self.deleting.set()
+        self.resume.wait(5)
+        super().delete(key)
+
+
+@pytest.fixture
+def local_storage(tmp_path, session_factory, monkeypatch):
+    backend = PausingStorage(str(tmp_path / "uploads"))
+    backend.resume.set()
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    monkeypatch.setattr(storage, "_storage", backend)
+    monkeypatch.setattr(file_storage, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    return backend
+
+
+def store(tmp_path, relative_path, user_id=1):
+    temp_path = tmp_path / f"upload-{relative_path.replace('/', '_')}"
+    temp_path.write_bytes(CONTENT)
+    return asyncio.run(store_file(str(temp_path), relative_path, user_id=user_id))
+
+
+def test_store_during_delete_of_the_same_content(tmp_path, local_storage, session_factory):
+    store(tmp_path, "photos/aa/bb/first.jpg")
+
+    local_storage.resume.clear()
+    deleter = threading.Thread(target=delete_file, args=("photos/aa/bb/first.jpg",))
+    deleter.start()
+    assert local_storage.deleting.wait(5)
+
+    # The delete holds the blob row; the new upload must not finish before it
+    storer = threading.Thread(target=store, args=(tmp_path, "photos/cc/dd/second.jpg"))
+    storer.start()
+    storer.join(0.5)
+    local_storage.resume.set()
+    deleter.join(5)
+    storer.join(10)
+
+    assert local_storage.exists(blob_key(SHA))
+    db = session_factory()
+    assert db.query(StoredBlob).filter(StoredBlob.sha256 == SHA).one().ref_count == 1
+    assert [row.path for row in db.query(StoredFile)] == ["photos/cc/dd/second.jpg"]
+    db.close()
+
+
+def test_reference_to_deleted_content_is_not_recorded(tmp_path, local_storage, session_factory):
+    store(tmp_path, "photos/aa/bb/first.jpg")
+    assert register_upload("photos/aa/bb/ref.jpg", SHA, len(CONTENT), existing_only=True, user_id=1)
+    assert not register_upload("photos/aa/bb/bad.jpg", SHA, len(CONTENT) + 1, existing_only=True, user_id=1)
+
+    delete_file("photos/aa/bb/first.jpg")
+    delete_file("photos/aa/bb/ref.jpg")
+    assert not local_storage.exists(blob_key(SHA))
+    assert not register_upload("photos/aa/bb/late.jpg", SHA, len(CONTENT), existing_only=True, user_id=1)
+
+    db = session_factory()
+    assert db.query(StoredFile).count() == 0
+    assert db.query(StoredBlob).count() == 0
+    assert db.query(StoredBlobOwner).count() == 0
+    db.close()
+
+
+def test_only_uploaders_can_find_or_reference_content(tmp_path, local_storage):
+    store(tmp_path, "photos/aa/bb/first.jpg", user_id=1)
+    files = [(SHA, len(CONTENT))]
+
+    assert existing_blobs(files, 1) == set(files)
+    assert existing_blobs(files, 2) == set()
+    assert not register_upload("photos/aa/bb/other.jpg", SHA, len(CONTENT), existing_only=True, user_id=2)
+    assert not register_upload("photos/aa/bb/anon.jpg", SHA, len(CONTENT), existing_only=True)
+
+    # Sending the bytes makes the second user an owner too
+    store(tmp_path, "photos/cc/dd/second.jpg", user_id=2)
+    assert existing_blobs(files, 2) == set(files)
+    assert register_upload("photos/aa/bb/other.jpg", SHA, len(CONTENT), existing_only=True, user_id=2)
+
+
+def test_failed_store_removes_the_temp_file(tmp_path, local_storage, session_factory, monkeypatch):
+    def unavailable(*args):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(file_storage, "register_upload", unavailable)
+    with pytest.raises(RuntimeError):
+        store(tmp_path, "photos/aa/bb/first.jpg")
+    assert not list(tmp_path.glob("upload-*"))
+
+    # The blob write fails after the upload was counted: the row is dropped too
+    monkeypatch.setattr(file_storage, "register_upload", register_upload)
+    monkeypatch.setattr(local_storage, "put", unavailable)
+    with pytest.raises(RuntimeError):
+        store(tmp_path, "photos/aa/bb/first.jpg")
+    assert not list(tmp_path.glob("upload-*"))
+    db = session_factory()
+    assert db.query(StoredFile).count() == 0
+    db.close()
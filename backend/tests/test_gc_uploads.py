@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import gc_uploads
+from gc_uploads import PathSet, collect_file, sweep_analysis_rows
+from models import PhotoAnalysis, PhotoHash, VideoFingerprint
+
+
+def test_analysis_rows_of_unreferenced_uploads_are_deleted(db):
+    old = datetime.utcnow() - timedelta(hours=100)
+    for path, created_at in (('photos/aa/bb/kept.jpg', old), ('photos/aa/bb/gone.jpg', old),
+                             ('photos/aa/bb/new.jpg', datetime.utcnow())):
+        db.add(PhotoHash(photo_path=path, perceptual_hash='0' * 16, source='harvest', created_at=created_at))
+        db.add(PhotoAnalysis(photo_path=path, source='harvest', created_at=created_at))
+    db.add(VideoFingerprint(video_path='videos/aa/bb/gone.mp4', frame_hashes=[], created_at=old))
+    db.commit()
+
+    live = PathSet()
+    live.add('photos/aa/bb/kept.jpg')
+    live.freeze()
+    cutoff = datetime.utcnow() - timedelta(hours=72)
+
+    assert sweep_analysis_rows(db, live, cutoff, dry_run=True) == 3
+    assert db.query(PhotoHash).count() == 3
+    assert sweep_analysis_rows(db, live, cutoff, dry_run=False) == 3
+    for model in (PhotoHash, PhotoAnalysis):
+        assert sorted(path for (path,) in db.query(model.photo_path)) == \
+            ['photos/aa/bb/kept.jpg', 'photos/aa/bb/new.jpg']
+    assert db.query(VideoFingerprint).count() == 0
+
+
+def test_quarantine_keeps_the_emptied_directory(tmp_path, monkeypatch):
+    upload_dir = tmp_path / "uploads"
+    photo = upload_dir / "photos" / "aa" / "bb" / "orphan.jpg"
+    photo.parent.mkdir(parents=True)
+    photo.write_bytes(b"bytes")
+    monkeypatch.setattr(gc_uploads, "UPLOAD_DIR", str(upload_dir))
+
+    live = PathSet()
+    live.freeze()
+    quarantine_dir = upload_dir / "quarantine" / "run"
+    assert collect_file(str(photo), live, float("inf"), str(quarantine_dir), dry_run=False) == 5
+
+    # Other sweep tasks may still be listing the directory
+    assert photo.parent.is_dir()
+    assert (quarantine_dir / "photos" / "aa" / "bb" / "orphan.jpg").read_bytes() == b"bytes"
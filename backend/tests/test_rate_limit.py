@@ -0,0 +1,79 @@
+import pytest
+from starlette.requests import Request
+
+import rate_limit
+from rate_limit import AuthRateLimiter, DatabaseBuckets, MemoryBuckets, client_ip
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "db"])
+def buckets(request, tmp_path, clock):
+    if request.param == "memory":
+        return MemoryBuckets(max_keys=100)
+    return DatabaseBuckets(f"sqlite:///{tmp_path / 'rate_limits.db'}")
+
+
+def test_bucket_allows_a_burst_then_refills(buckets, clock):
+    # 1 token every 2 s, bursts of 3
+    assert [buckets.take("login:ip:10.0.0.1", 0.5, 3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("login:ip:10.0.0.1", 0.5, 3) == pytest.approx(2.0)
+    assert buckets.take("login:ip:10.0.0.2", 0.5, 3) == 0
+
+    clock.now += 1
+    assert buckets.take("login:ip:10.0.0.1", 0.5, 3) == pytest.approx(1.0)
+    clock.now += 1
+    assert buckets.take("login:ip:10.0.0.1", 0.5, 3) == 0
+
+    # Never more than the burst, however long the key was idle
+    clock.now += 3600
+    assert [buckets.take("login:ip:10.0.0.1", 0.5, 3) for _ in range(4)][-1] > 0
+
+
+def test_memory_buckets_drop_least_recently_used_keys(clock):
+    buckets = MemoryBuckets(max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        buckets.take(key, 1, 5)
+    assert buckets.size() == 2
+    assert list(buckets._buckets) == ["a", "c"]
+
+
+def test_limiter_checks_ip_and_username(clock):
+    limiter = AuthRateLimiter(MemoryBuckets())
+    limiter.limits = {'ip': (1 / 60, 3), 'user': (1 / 60, 2)}
+
+    assert limiter.check("login", "10.0.0.1", "farmer1") == 0
+    assert limiter.check("login", "10.0.0.2", " Farmer1 ") == 0
+    assert limiter.check("login", "10.0.0.3", "farmer1") > 0  # Same user from a third address
+    assert limiter.check("login", "10.0.0.1", "owner1") == 0
+    assert limiter.check("login", "10.0.0.1", "auditor1") == 0
+    assert limiter.check("login", "10.0.0.1", "admin") > 0  # Fourth attempt from one address
+    assert limiter.stats()['throttled'] == {'login:user': 1, 'login:ip': 1}
+
+
+def request_from(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 40000)})
+
+
+def test_client_ip_trusts_only_the_proxies_entries():
+    spoofed = request_from("10.0.0.9", "1.1.1.1, 203.0.113.7")
+    assert client_ip(spoofed, proxy_hops=0) == "10.0.0.9"
+    assert client_ip(spoofed, proxy_hops=1) == "203.0.113.7"
+    assert client_ip(request_from("10.0.0.9", "1.1.1.1, 203.0.113.7, 10.0.0.8"), proxy_hops=2) == "203.0.113.7"
+    assert client_ip(request_from("10.0.0.9", "203.0.113.7"), proxy_hops=2) == "203.0.113.7"
+    assert client_ip(request_from("10.0.0.9"), proxy_hops=1) == "10.0.0.9"
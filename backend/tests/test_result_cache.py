@@ -0,0 +1,59 @@
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from cv.result_cache import CVResultCache
+from models import CVResultCache as CacheEntry
+
+SHA = "ab" * 32
+RESULT = {"perceptual_hash": "ffff0000ffff0000", "quality_score": 0.9}
+
+
+def test_put_is_idempotent_across_caches(session_factory):
+    # Two workers: separate caches, so the memory tier does not hide the second insert
+    for cache in (CVResultCache(), CVResultCache()):
+        db = session_factory()
+        cache.put(db, SHA, RESULT)
+        db.close()
+
+    db = session_factory()
+    assert db.query(CacheEntry).filter(CacheEntry.sha256 == SHA).count() == 1
+    assert CVResultCache().get(db, SHA) == RESULT
+    db.close()
+
+
+def test_concurrent_puts_of_the_same_bytes(session_factory):
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def put():
+        db = session_factory()
+        try:
+            barrier.wait()
+            CVResultCache().put(db, SHA, RESULT)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=put) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db = session_factory()
+    assert db.query(CacheEntry).count() == 1
+    db.close()
+
+
+def test_database_error_does_not_propagate(tmp_path):
+    # No tables: the insert fails, the caller carries on with a usable session
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    db = sessionmaker(bind=engine)()
+    cache = CVResultCache()
+    cache.put(db, SHA, RESULT)
+    assert cache.get(db, SHA) == RESULT  # memory tier still has it
+    db.close()
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import database
+import file_storage
+import storage
+from auth import get_current_user
+from database import get_db
+from models import ManufacturingBatch, ResumableUpload, User
+from routers import resumable_uploads
+from storage import LocalStorage
+
+VIDEO = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path, session_factory, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    monkeypatch.setattr(storage, "_storage", LocalStorage(str(tmp_path / "uploads")))
+    monkeypatch.setattr(file_storage, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(resumable_uploads, "PARTIAL_DIR", str(tmp_path / "partial"))
+    monkeypatch.setattr(resumable_uploads, "schedule_video_analysis", None)
+    (tmp_path / "partial").mkdir()
+
+    db = session_factory()
+    user = User(username="owner1", email="owner1@example.com", password_hash="x", role="owner")
+    db.add(user)
+    db.commit()
+    db.add(ManufacturingBatch(batch_id="BATCH-1", biomass_input=1, biochar_output=0.3, ratio=0.3,
+                              co2_removed=0.8, kiln_type="Kon-Tiki", status="pending",
+                              rule_status="pending", user_id=user.id))
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+
+    def session():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(resumable_uploads.router)
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[get_current_user] = lambda: user
+    return TestClient(app)
+
+
+def set_state(session_factory, upload_id, status, age_s=0):
+    """Make the upload look claimed by a request of another worker"""
+    db = session_factory()
+    db.query(ResumableUpload).filter(ResumableUpload.upload_id == upload_id).update({
+        ResumableUpload.status: status,
+        ResumableUpload.updated_at: datetime.utcnow() - timedelta(seconds=age_s)
+    })
+    db.commit()
+    db.close()
+
+
+def start(client):
+    response = client.post("/resumable-uploads", json={"filename": "kiln.mp4", "size": len(VIDEO), "kind": "video"})
+    assert response.status_code == 201
+    return response.json()["upload_id"]
+
+
+def patch(client, upload_id, offset, body):
+    return client.patch(f"/resumable-uploads/{upload_id}", content=body,
+                        headers={"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"})
+
+
+def test_chunks_advance_the_recorded_offset(client, tmp_path):
+    upload_id = start(client)
+    assert not (tmp_path / "uploads" / "partial").exists()
+
+    assert patch(client, upload_id, 0, VIDEO[:4000]).headers["Upload-Offset"] == "4000"
+    response = patch(client, upload_id, 0, VIDEO[:4000])
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "4000"
+
+    # Bytes on disk past the recorded offset (a chunk whose worker died) are dropped
+    with open(tmp_path / "partial" / f"{upload_id}.part", "ab") as f:
+        f.write(b"garbage")
+    assert client.head(f"/resumable-uploads/{upload_id}").headers["Upload-Offset"] == "4000"
+    assert patch(client, upload_id, 4000, VIDEO[4000:]).status_code == 204
+    assert (tmp_path / "partial" / f"{upload_id}.part").read_bytes() == VIDEO
+
+
+def test_one_chunk_at_a_time_across_workers(client, session_factory):
+    upload_id = start(client)
+
+    set_state(session_factory, upload_id, "receiving")
+    response = patch(client, upload_id, 0, VIDEO)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Another chunk of this upload is in progress"
+
+    # The other worker stopped renewing its claim
+    set_state(session_factory, upload_id, "receiving", age_s=resumable_uploads.RESUMABLE_UPLOAD_LEASE_S + 1)
+    assert patch(client, upload_id, 0, VIDEO).status_code == 204
+    assert client.get(f"/resumable-uploads/{upload_id}").json()["status"] == "uploading"
+
+
+def test_finalize_is_claimed_once(client, session_factory):
+    upload_id = start(client)
+    patch(client, upload_id, 0, VIDEO)
+    target = {"target": "batch", "target_id": 1}
+
+    set_state(session_factory, upload_id, "finalizing")
+    response = client.post(f"/resumable-uploads/{upload_id}/finalize", json=target)
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+
+    set_state(session_factory, upload_id, "uploading")
+    first = client.post(f"/resumable-uploads/{upload_id}/finalize", json=target)
+    assert first.status_code == 200
+    assert first.json()["status"] == "finalized"
+    assert client.post(f"/resumable-uploads/{upload_id}/finalize", json=target).json() == first.json()
+    assert client.post(f"/resumable-uploads/{upload_id}/finalize",
+                       json={"target": "batch", "target_id": 2}).status_code == 409
+
+    db = session_factory()
+    assert db.query(ManufacturingBatch.video_path).scalar() == first.json()["file_path"]
+    db.close()
+    assert file_storage.get_file_path(first.json()["file_path"])
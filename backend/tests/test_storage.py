@@ -0,0 +1,106 @@
+"""
+S3Storage against an S3-compatible server
+Uses MinIO (or any S3 endpoint) when S3_TEST_ENDPOINT_URL is set, with the
+credentials in AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY, e.g.
+    docker run -p 9000:9000 minio/minio server /data
+    S3_TEST_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=minioadmin \
+        AWS_SECRET_ACCESS_KEY=minioadmin python -m pytest -q tests/test_storage.py
+and otherwise a local moto server.
+"""
+import asyncio
+import os
+import urllib.request
+import uuid
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from storage import S3Storage, StorageBackend
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    endpoint = os.getenv("S3_TEST_ENDPOINT_URL")
+    if endpoint:
+        yield endpoint
+        return
+
+    moto_server = pytest.importorskip("moto.server")
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3_storage(s3_endpoint, tmp_path):
+    bucket = f"harit-swaraj-test-{uuid.uuid4().hex[:12]}"
+    backend = S3Storage(bucket, endpoint_url=s3_endpoint, cache_dir=str(tmp_path / "cache"),
+                        part_size_mb=5, concurrency=2)
+    backend.client.create_bucket(Bucket=bucket)
+    yield backend
+    for key, _, _ in list(backend.list_objects("")):
+        backend.client.delete_object(Bucket=bucket, Key=key)
+    backend.client.delete_bucket(Bucket=bucket)
+
+
+def temp_file(tmp_path, content: bytes) -> str:
+    path = tmp_path / f"upload-{uuid.uuid4().hex}"
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_backends_implement_the_whole_interface():
+    class Partial(StorageBackend):
+        def exists(self, key):
+            return False
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_put_read_move_and_delete(s3_storage, tmp_path):
+    content = b"kml file bytes" * 100
+    asyncio.run(s3_storage.put(temp_file(tmp_path, content), "blobs/ab/cd/abcd"))
+
+    assert s3_storage.exists("blobs/ab/cd/abcd")
+    assert not s3_storage.exists("blobs/ab/cd/missing")
+    assert [(key, size) for key, size, _ in s3_storage.list_objects("blobs/")] == \
+        [("blobs/ab/cd/abcd", len(content))]
+
+    # Read through the cache, then download again once it was evicted
+    with open(s3_storage.local_path("blobs/ab/cd/abcd"), "rb") as f:
+        assert f.read() == content
+    os.remove(s3_storage._cache_path("blobs/ab/cd/abcd"))
+    with open(s3_storage.local_path("blobs/ab/cd/abcd"), "rb") as f:
+        assert f.read() == content
+    assert s3_storage.local_path("blobs/ab/cd/missing") is None
+
+    with urllib.request.urlopen(s3_storage.url("blobs/ab/cd/abcd", "application/vnd.google-earth.kml+xml")) as r:
+        assert r.read() == content
+        assert r.headers["Content-Type"] == "application/vnd.google-earth.kml+xml"
+
+    s3_storage.move("blobs/ab/cd/abcd", "blobs/ef/01/ef01")
+    assert not s3_storage.exists("blobs/ab/cd/abcd")
+    assert s3_storage.exists("blobs/ef/01/ef01")
+
+    s3_storage.delete("blobs/ef/01/ef01")
+    assert not s3_storage.exists("blobs/ef/01/ef01")
+    assert s3_storage.local_path("blobs/ef/01/ef01") is None
+
+
+def test_large_files_are_sent_in_parts(s3_storage, tmp_path):
+    content = os.urandom(1024) * (11 * 1024)  # 11 MB: three 5 MB parts
+    asyncio.run(s3_storage.put(temp_file(tmp_path, content), "blobs/large"))
+
+    head = s3_storage.client.head_object(Bucket=s3_storage.bucket, Key="blobs/large")
+    assert head["ContentLength"] == len(content)
+    assert head["ETag"].strip('"').endswith("-3")
+
+    os.remove(s3_storage._cache_path("blobs/large"))
+    with open(s3_storage.local_path("blobs/large"), "rb") as f:
+        assert f.read() == content
@@ -0,0 +1,112 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import token_revocation
+from models import TokenRevocation
+from token_revocation import (BloomFilter, RevocationFilter, current_token_version, revoke_token,
+                              revoke_user_tokens)
+
+
+@pytest.fixture
+def revocations(session_factory, monkeypatch):
+    """This worker's filter, reading the test database"""
+    monkeypatch.setattr(token_revocation, "SessionLocal", session_factory)
+    monkeypatch.setattr(token_revocation, "_filter", RevocationFilter())
+    return token_revocation._filter
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(bits=1 << 16)
+    added = [uuid.uuid4().hex for _ in range(1000)]
+    for key in added:
+        bloom.add(key)
+
+    assert all(key in bloom for key in added)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 50  # ~0.1% expected at this load
+    assert 0 < bloom.fill_ratio() < 0.2
+
+
+def test_revoked_tokens_and_user_versions_are_rejected(db, revocations):
+    expires = datetime.utcnow() + timedelta(hours=1)
+    revoke_token(db, "a" * 32, expires)
+    assert revocations.is_revoked({"jti": "a" * 32, "uid": 1, "tv": 0})
+    assert not revocations.is_revoked({"jti": "b" * 32, "uid": 1, "tv": 0})
+
+    assert current_token_version(db, 1) == 0
+    revoke_user_tokens(db, 1, timedelta(hours=1))
+    assert current_token_version(db, 1) == 1
+    assert revocations.is_revoked({"jti": "b" * 32, "uid": 1, "tv": 0})
+    assert not revocations.is_revoked({"jti": "b" * 32, "uid": 1, "tv": 1})
+    assert not revocations.is_revoked({"jti": "b" * 32, "uid": 2, "tv": 0})
+    assert revocations.stats()["rejected"] == 2
+
+
+def test_sync_picks_up_other_workers_revocations(db, revocations):
+    expires = datetime.utcnow() + timedelta(hours=1)
+    db.add_all([TokenRevocation(id=5, jti="c" * 32, expires_at=expires),
+                TokenRevocation(id=6, user_id=3, token_version=2, expires_at=expires)])
+    db.commit()
+    revocations.sync()
+    assert revocations.is_revoked({"jti": "c" * 32})
+    assert revocations.is_revoked({"uid": 3, "tv": 1})
+
+    # Committed after the poll with an id below the cursor: read again while recent
+    db.add(TokenRevocation(id=4, jti="d" * 32, expires_at=expires))
+    db.commit()
+    revocations.sync()
+    assert revocations.is_revoked({"jti": "d" * 32})
+    assert revocations.stats()["polls"] == 2
+
+
+def test_prune_forgets_expired_revocations(db, revocations):
+    now = datetime.utcnow()
+    db.add_all([TokenRevocation(jti="e" * 32, expires_at=now + timedelta(seconds=1)),
+                TokenRevocation(jti="f" * 32, expires_at=now + timedelta(hours=1)),
+                TokenRevocation(user_id=7, token_version=1, expires_at=now + timedelta(seconds=1))])
+    db.commit()
+    revocations.sync()
+    assert revocations.stats()["revoked_tokens"] == 2
+
+    revocations.prune(now + timedelta(seconds=2))
+    assert not revocations.is_revoked({"jti": "e" * 32, "uid": 7, "tv": 0})
+    assert revocations.is_revoked({"jti": "f" * 32})
+    assert revocations.stats()["revoked_users"] == 0
+
+    # The periodic prune in sync also deletes the expired rows
+    db.query(TokenRevocation).filter(TokenRevocation.jti == "e" * 32) \
+        .update({TokenRevocation.expires_at: now - timedelta(seconds=1)})
+    db.commit()
+    revocations._last_prune = time.monotonic() - token_revocation.PRUNE_INTERVAL_S - 1
+    revocations.sync()
+    db.expire_all()
+    assert [row.jti for row in db.query(TokenRevocation).filter(TokenRevocation.jti.isnot(None))] == ["f" * 32]
+
+
+def test_token_version_survives_expired_revocations(db, revocations):
+    revoke_user_tokens(db, 1, timedelta(hours=1))
+    revoke_user_tokens(db, 1, timedelta(hours=1))
+    assert current_token_version(db, 1) == 2
+
+    # The revocations expire and are pruned; tokens issued meanwhile carry tv=2
+    db.query(TokenRevocation).delete()
+    db.commit()
+    revocations.prune(datetime.utcnow() + timedelta(hours=2))
+    assert current_token_version(db, 1) == 2
+    assert not revocations.is_revoked({"uid": 1, "tv": 2})
+
+    revoke_user_tokens(db, 1, timedelta(hours=1))
+    assert current_token_version(db, 1) == 3
+    assert revocations.is_revoked({"uid": 1, "tv": 2})
+    assert not revocations.is_revoked({"uid": 1, "tv": 3})
+
+
+def test_version_starts_above_revocations_from_before_the_version_table(db, revocations):
+    db.add(TokenRevocation(user_id=4, token_version=5, expires_at=datetime.utcnow() + timedelta(hours=1)))
+    db.commit()
+    assert current_token_version(db, 4) == 5
+    revoke_user_tokens(db, 4, timedelta(hours=1))
+    assert current_token_version(db, 4) == 6
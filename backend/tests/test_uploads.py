@@ -0,0 +1,33 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import database
+import file_storage
+from routers import uploads
+
+
+@pytest.fixture
+def client(tmp_path, session_factory, monkeypatch):
+    root = tmp_path / "uploads"
+    for relative_path in ("photos/ab/cd/field.jpg", "profile_photos/user_1.jpg", "blobs/ab/cd/" + "a" * 64,
+                          "blobs/.upload-0123", "partial/0123.part", "quarantine/photos/old.jpg",
+                          "photos/.hidden"):
+        (root / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (root / relative_path).write_bytes(b"bytes")
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    monkeypatch.setattr(file_storage, "UPLOAD_DIR", str(root))
+
+    app = FastAPI()
+    app.include_router(uploads.router)
+    return TestClient(app)
+
+
+def test_only_published_folders_are_served(client):
+    assert client.get("/uploads/photos/ab/cd/field.jpg").content == b"bytes"
+    assert client.get("/uploads/profile_photos/user_1.jpg").status_code == 200
+
+    for relative_path in ("blobs/ab/cd/" + "a" * 64, "blobs/.upload-0123", "partial/0123.part",
+                          "quarantine/photos/old.jpg", "photos/.hidden", "photos/../blobs/.upload-0123",
+                          "photos", "missing/x.jpg"):
+        assert client.get(f"/uploads/{relative_path}").status_code == 404, relative_path
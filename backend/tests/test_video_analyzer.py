@@ -0,0 +1,61 @@
+import numpy as np
+
+from cv import video_analyzer
+from cv.video_analyzer import VIDEO_MAX_FINGERPRINT_FRAMES, VIDEO_SEEK_MIN_GAP_S, analyze_video
+
+
+class FakeCapture:
+    """An hour of 30 fps video; counts the frames decoded to reach the requested ones"""
+
+    def __init__(self, path, fps=30.0, frame_count=30 * 3600):
+        self.fps = fps
+        self.frame_count = frame_count
+        self.position = 0
+        self.grabs = self.seeks = 0
+        self.rng = np.random.default_rng(34)
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return {video_analyzer.cv2.CAP_PROP_FPS: self.fps,
+                video_analyzer.cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+                video_analyzer.cv2.CAP_PROP_FRAME_WIDTH: 64,
+                video_analyzer.cv2.CAP_PROP_FRAME_HEIGHT: 48}[prop]
+
+    def set(self, prop, value):
+        self.seeks += 1
+        self.position = int(value)
+
+    def grab(self):
+        if self.position >= self.frame_count:
+            return False
+        self.grabs += 1
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        return True, self.rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+def test_long_video_decodes_a_bounded_number_of_frames(monkeypatch):
+    captures = []
+
+    def open_capture(path):
+        captures.append(FakeCapture(path))
+        return captures[-1]
+
+    monkeypatch.setattr(video_analyzer.cv2, "VideoCapture", open_capture)
+
+    result = analyze_video("kiln.mp4", max_samples=60)
+    capture = captures[0]
+
+    assert result['frames_sampled'] == 60
+    assert len(result['fingerprint']['hashes']) == VIDEO_MAX_FINGERPRINT_FRAMES
+    # The fingerprinted start is walked frame by frame, the rest is one seek per sample
+    fingerprint_span = VIDEO_MAX_FINGERPRINT_FRAMES * int(video_analyzer.VIDEO_FINGERPRINT_INTERVAL_S * capture.fps)
+    assert capture.grabs <= fingerprint_span + 60 * (int(VIDEO_SEEK_MIN_GAP_S * capture.fps) + 1)
+    assert capture.grabs < capture.frame_count // 10
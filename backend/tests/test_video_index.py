@@ -0,0 +1,86 @@
+import random
+
+from cv.video_index import VIDEO_QUERY_PROBE_FRAMES, VideoFingerprintIndex
+from models import VideoFingerprint
+
+
+def fingerprint(rng, frames):
+    return ['%016x' % rng.getrandbits(64) for _ in range(frames)]
+
+
+def perturb(rng, hashes, bits):
+    """Flip `bits` random bits of every frame hash (the same footage sampled slightly apart)"""
+    perturbed = []
+    for frame_hash in hashes:
+        value = int(frame_hash, 16)
+        for bit in rng.sample(range(64), bits):
+            value ^= 1 << bit
+        perturbed.append('%016x' % value)
+    return perturbed
+
+
+def test_trimmed_clip_matches_at_its_offset():
+    rng = random.Random(35)
+    original = fingerprint(rng, 600)
+    index = VideoFingerprintIndex()
+    index.load([('videos/original.mp4', 1, original)] +
+               [(f'videos/other_{i}.mp4', i + 2, fingerprint(rng, 600)) for i in range(20)])
+
+    # Longer than the probe budget, and beyond the probe radius on a third of the frames
+    clip = original[100:100 + 2 * VIDEO_QUERY_PROBE_FRAMES]
+    clip = [frame if i % 3 else perturb(rng, [frame], 9)[0] for i, frame in enumerate(clip)]
+
+    matches = index.query(clip)
+    assert [m['video_path'] for m in matches] == ['videos/original.mp4']
+    assert matches[0]['offset_frames'] == 100
+    assert matches[0]['matched_frames'] == len(clip)
+    assert matches[0]['coverage'] == 1.0
+
+
+def test_unrelated_and_excluded_videos_do_not_match():
+    rng = random.Random(36)
+    original = fingerprint(rng, 120)
+    index = VideoFingerprintIndex()
+    index.load([('videos/original.mp4', 1, original)])
+
+    assert index.query(fingerprint(rng, 120)) == []
+    assert index.query(perturb(rng, original, 3), exclude_path='videos/original.mp4') == []
+    assert index.query([None] * 10) == []
+
+
+def test_removed_videos_no_longer_match(db):
+    rng = random.Random(44)
+    original = fingerprint(rng, 120)
+    index = VideoFingerprintIndex()
+    index.add(db, 'videos/original.mp4', 1, original, 1.0)
+    index.add(db, 'videos/other.mp4', 2, fingerprint(rng, 120), 1.0)
+    assert [m['video_path'] for m in index.query(original)] == ['videos/original.mp4']
+
+    assert index.remove(db, ['videos/original.mp4', 'videos/missing.mp4']) == 1
+    assert index.query(original) == []
+    assert not index.contains('videos/original.mp4')
+    assert [path for (path,) in db.query(VideoFingerprint.video_path)] == ['videos/other.mp4']
+
+
+def test_refresh_picks_up_other_workers_fingerprints(db):
+    rng = random.Random(45)
+    original, other = fingerprint(rng, 120), fingerprint(rng, 120)
+    index, other_worker = VideoFingerprintIndex(), VideoFingerprintIndex()
+    index.refresh(db, full=True)
+
+    other_worker.add(db, 'videos/original.mp4', 1, original, 1.0)
+    assert index.query(original) == []
+    index.refresh(db)
+    assert [m['video_path'] for m in index.query(original)] == ['videos/original.mp4']
+
+    # Both workers stored the same video: the first row is kept
+    index.add(db, 'videos/other.mp4', 2, other, 1.0)
+    other_worker.add(db, 'videos/other.mp4', 3, other, 1.0)
+    assert db.query(VideoFingerprint.batch_id).filter(VideoFingerprint.video_path == 'videos/other.mp4').scalar() == 2
+
+    # Deleted by another process: the row count no longer matches and the index is rebuilt
+    db.query(VideoFingerprint).filter(VideoFingerprint.video_path == 'videos/original.mp4').delete()
+    db.commit()
+    index.refresh(db)
+    assert index.query(original) == []
+    assert len(index) == 1
@@ -0,0 +1,245 @@
+"""
+Token revocation for Harit Swaraj
+Access tokens carry the user id, role and token version (uid / role / tv)
+plus a token id (jti), so get_current_user authenticates a request without
+reading the database. Tokens that must stop working before they expire are
+listed in the token_revocations table:
+
+- Logout revokes one token by its jti
+- Revoking a user (logout everywhere, role or password change) raises the
+  user's token version; tokens issued with a lower tv are rejected and new
+  logins get the new version, so a changed role takes effect at next login.
+  The version is kept in user_token_versions and never goes down, so it
+  stays above the tv of every token issued after expired rows are pruned
+
+Each worker keeps the unexpired revocations in memory: a bloom filter in
+front of the exact jti set (most tokens are not revoked and are answered by
+the bloom filter alone) and the minimum valid token version per user. The
+table is polled incrementally by id at most every TOKEN_REVOCATION_POLL_S
+seconds from the request path; a revocation made through another worker is
+enforced after at most that delay, the revoking worker applies it at once.
+Rows are pruned once the tokens they revoke have expired.
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func, or_
+
+from database import SessionLocal, insert_ignore
+from models import TokenRevocation, UserTokenVersion
+
+TOKEN_REVOCATION_POLL_S = float(os.getenv("TOKEN_REVOCATION_POLL_S", "5"))
+TOKEN_REVOCATION_BLOOM_BITS = int(os.getenv("TOKEN_REVOCATION_BLOOM_BITS", str(1 << 20)))
+BLOOM_HASHES = 7
+
+# Rows can commit out of id order; rows this recent are read again on every poll
+COMMIT_SKEW = timedelta(seconds=30)
+PRUNE_INTERVAL_S = 3600
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings (double hashing of one BLAKE2b digest)"""
+
+    def __init__(self, bits: int = TOKEN_REVOCATION_BLOOM_BITS, hashes: int = BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def fill_ratio(self) -> float:
+        return sum(bin(byte).count("1") for byte in self._array) / self.bits
+
+
+class RevocationFilter:
+    """In-memory view of token_revocations, synced incrementally"""
+
+    def __init__(self):
+        self._bloom = BloomFilter()
+        self._jtis: Dict[str, datetime] = {}  # jti -> expires_at
+        self._user_versions: Dict[int, tuple] = {}  # user id -> (minimum tv, expires_at)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._cursor = 0
+        self._last_poll = 0.0
+        self._last_poll_at: Optional[datetime] = None
+        self._last_prune = time.monotonic()
+        self.checks = 0
+        self.bloom_hits = 0
+        self.rejected = 0
+        self.polls = 0
+        self.poll_errors = 0
+
+    def _apply(self, row: TokenRevocation):
+        """Add one revocation row (idempotent)"""
+        if row.jti:
+            if row.jti not in self._jtis:
+                self._bloom.add(row.jti)
+            self._jtis[row.jti] = row.expires_at
+        if row.user_id is not None and row.token_version is not None:
+            current = self._user_versions.get(row.user_id)
+            if current is None or row.token_version >= current[0]:
+                self._user_versions[row.user_id] = (row.token_version, max(row.expires_at, current[1])
+                                                    if current else row.expires_at)
+        self._cursor = max(self._cursor, row.id)
+
+    def add(self, row: TokenRevocation):
+        """Apply a revocation this worker just committed"""
+        with self._lock:
+            self._apply(row)
+
+    def is_revoked(self, payload: dict) -> bool:
+        """Check decoded token claims against the revocations"""
+        self.checks += 1
+        jti = payload.get("jti")
+        if jti and jti in self._bloom:
+            self.bloom_hits += 1
+            if jti in self._jtis:
+                self.rejected += 1
+                return True
+
+        user_id = payload.get("uid")
+        if user_id is not None:
+            minimum = self._user_versions.get(user_id)
+            if minimum and payload.get("tv", 0) < minimum[0]:
+                self.rejected += 1
+                return True
+        return False
+
+    def maybe_sync(self):
+        """Poll the table if TOKEN_REVOCATION_POLL_S has passed (one thread at a time)"""
+        if time.monotonic() - self._last_poll < TOKEN_REVOCATION_POLL_S:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return  # Another request is polling
+        try:
+            self._last_poll = time.monotonic()
+            self.sync()
+        except Exception as e:
+            self.poll_errors += 1
+            print(f"⚠️ Token revocation poll failed: {e}")
+        finally:
+            self._sync_lock.release()
+
+    def sync(self):
+        """Read revocations added since the last poll"""
+        started = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            query = db.query(TokenRevocation).filter(TokenRevocation.expires_at > started)
+            if self._last_poll_at is not None:
+                query = query.filter(or_(TokenRevocation.id > self._cursor,
+                                         TokenRevocation.created_at >= self._last_poll_at - COMMIT_SKEW))
+            rows = query.order_by(TokenRevocation.id).all()
+            with self._lock:
+                for row in rows:
+                    self._apply(row)
+            self._last_poll_at = started
+            self.polls += 1
+
+            if time.monotonic() - self._last_prune > PRUNE_INTERVAL_S:
+                self._last_prune = time.monotonic()
+                self.prune(started)
+                db.query(TokenRevocation).filter(TokenRevocation.expires_at <= started) \
+                    .delete(synchronize_session=False)
+                db.commit()
+        finally:
+            db.close()
+
+    def prune(self, now: datetime):
+        """Forget revocations of tokens that have expired; rebuilds the bloom filter"""
+        with self._lock:
+            self._jtis = {jti: expires for jti, expires in self._jtis.items() if expires > now}
+            self._user_versions = {user_id: entry for user_id, entry in self._user_versions.items()
+                                   if entry[1] > now}
+            bloom = BloomFilter(self._bloom.bits, self._bloom.hashes)
+            for jti in self._jtis:
+                bloom.add(jti)
+            self._bloom = bloom
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'revoked_tokens': len(self._jtis),
+                'revoked_users': len(self._user_versions),
+                'bloom_bits': self._bloom.bits,
+                'bloom_fill_ratio': round(self._bloom.fill_ratio(), 6),
+                'checks': self.checks,
+                'bloom_hits': self.bloom_hits,
+                'rejected': self.rejected,
+                'polls': self.polls,
+                'poll_errors': self.poll_errors,
+                'poll_interval_s': TOKEN_REVOCATION_POLL_S
+            }
+
+
+_filter: Optional[RevocationFilter] = None
+_filter_lock = threading.Lock()
+
+
+def get_revocation_filter() -> RevocationFilter:
+    """Return the worker's revocation filter"""
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = RevocationFilter()
+    return _filter
+
+
+def _revoked_token_version(db, user_id: int) -> int:
+    """Highest version in unexpired revocation rows (users revoked before user_token_versions existed)"""
+    version = db.query(func.max(TokenRevocation.token_version)).filter(
+        TokenRevocation.user_id == user_id,
+        TokenRevocation.expires_at > datetime.utcnow()
+    ).scalar()
+    return version or 0
+
+
+def current_token_version(db, user_id: int) -> int:
+    """Token version to put into a new token for this user"""
+    version = db.query(UserTokenVersion.version).filter(UserTokenVersion.user_id == user_id).scalar()
+    return version if version is not None else _revoked_token_version(db, user_id)
+
+
+def revoke_token(db, jti: str, expires_at: datetime):
+    """Revoke one token (logout)"""
+    row = TokenRevocation(jti=jti, expires_at=expires_at)
+    db.add(row)
+    db.commit()
+    get_revocation_filter().add(row)
+
+
+def revoke_user_tokens(db, user_id: int, token_lifetime: timedelta):
+    """
+    Revoke every token issued to a user so far: call after a logout
+    everywhere, role change or password change
+    """
+    # Raised in one UPDATE, so concurrent revocations never hand out the same version
+    insert_ignore(db, UserTokenVersion, user_id=user_id, version=_revoked_token_version(db, user_id))
+    db.query(UserTokenVersion).filter(UserTokenVersion.user_id == user_id) \
+        .update({UserTokenVersion.version: UserTokenVersion.version + 1}, synchronize_session=False)
+    version = db.query(UserTokenVersion.version).filter(UserTokenVersion.user_id == user_id).scalar()
+
+    row = TokenRevocation(user_id=user_id, token_version=version,
+                          expires_at=datetime.utcnow() + token_lifetime)
+    db.add(row)
+    db.commit()
+    get_revocation_filter().add(row)
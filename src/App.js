@@ -325,6 +325,13 @@ const HaritSwarajMRV = () => {
   };
 
   const handleLogout = () => {
+    if (token) {
+      // Revoke the token on the server; local logout does not wait for it
+      fetch(`${apiUrl}/auth/logout`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}`, 'ngrok-skip-browser-warning': '69420' }
+      }).catch(() => {});
+    }
     localStorage.removeItem('token');
     localStorage.removeItem('user');
     setToken(null);